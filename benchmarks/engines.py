@@ -0,0 +1,84 @@
+"""Compare crawl throughput of the asyncio engine against N worker threads.
+
+Each run starts from the seed urls of the config in a scratch directory and
+stops after --max_pages downloads. Run from the repository root:
+    python -m benchmarks.engines --config_file config.ini --threads 1 4 16 --max_pages 500
+"""
+import os
+import time
+import tempfile
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+from utils.config import Config
+from utils.server_registration import get_cache_server
+from crawler import Crawler
+from crawler.async_crawler import AsyncCrawler
+from crawler.frontier import Frontier
+from crawler.stats import Stats
+from launch import _get_stop_words
+
+
+def limited_frontier(max_pages, base=Frontier):
+    class LimitedFrontier(base):
+        # Stops handing out urls after max_pages.
+        handed_out = 0
+
+        def _poll(self):
+            if self.handed_out >= max_pages:
+                self.stopped = True
+                return None, None
+            url, delay = super()._poll()
+            if url is not None:
+                self.handed_out += 1
+            return url, delay
+    return LimitedFrontier
+
+
+def run(crawler_class, config, stopwords, max_pages):
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            os.makedirs("logs")
+            stats = Stats.load(config.seen_capacity, config.seen_error_rate)
+            crawler = crawler_class(config, True, stats, stopwords,
+                                    frontier_factory=limited_frontier(max_pages))
+            start = time.perf_counter()
+            crawler.start()
+            elapsed = time.perf_counter() - start
+            pages = crawler.frontier.handed_out
+        finally:
+            os.chdir(cwd)
+    return pages, elapsed
+
+
+def main(config_file, threads, max_pages, run_async):
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    config = Config(cparser)
+    config.cache_server = get_cache_server(config, True)
+    config.save_file = "frontier.shelve"
+    stopwords = _get_stop_words()
+
+    results = []
+    for count in threads:
+        config.threads_count = config.min_threads = config.max_threads = count
+        results.append((f"{count} threads", *run(Crawler, config, stopwords, max_pages)))
+    if run_async:
+        results.append((f"asyncio ({config.max_in_flight} in flight)",
+                        *run(AsyncCrawler, config, stopwords, max_pages)))
+
+    print(f"\n{'engine':32} {'pages':>8} {'seconds':>9} {'pages/sec':>10}")
+    for name, pages, elapsed in results:
+        print(f"{name:32} {pages:8} {elapsed:9.1f} {pages / elapsed:10.1f}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--max_pages", type=int, default=500)
+    parser.add_argument("--no_async", action="store_true", default=False)
+    args = parser.parse_args()
+    main(args.config_file, args.threads, args.max_pages, not args.no_async)
@@ -0,0 +1,99 @@
+"""Compare how many fetches the best-first and LIFO frontier orders need to
+reach N unique pages.
+
+Crawls a generated replay site in-process, one url at a time: the frontier
+hands out a url, the site serves it, the scraper analyzes and merges it, and
+its links go back to the frontier. A unique page is one whose content was
+merged into the stats as new and is one of the site's documents rather
+than a trap page. Run from the repository root:
+    python -m benchmarks.frontier_order --pages 5000 --trap_rate 0.1
+"""
+import os
+import pickle
+import tempfile
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+import scraper
+from utils.config import Config
+from utils.response import Response
+from crawler.frontier import Frontier
+from crawler.stats import Stats
+from launch import _get_stop_words
+from replay import SyntheticSite, raw_response
+
+ORDERS = ("lifo", "best")
+
+
+def fetch(site, url):
+    status, content, content_type = site.get(url)
+    if status != 200:
+        return Response({"url": url, "status": status, "error": f"status {status}"})
+    raw = raw_response(url, content, {"Content-Type": content_type})
+    return Response({"url": url, "status": status, "response": pickle.dumps(raw)})
+
+
+def crawl(config, site, stopwords, max_fetches):
+    # Fetches done when the n-th unique page came in, for every n
+    reached = []
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            stats = Stats()
+            frontier = Frontier(config, True)
+            fetches = 0
+            while fetches < max_fetches:
+                url = frontier.get_tbd_url()
+                if url is None:
+                    break
+                fetches += 1
+                links, fingerprint, merged = scraper.scrape(url, fetch(site, url), stats, stopwords)
+                frontier.add_urls(links, url)
+                frontier.mark_url_complete(url, fingerprint, merged)
+                if merged and site.is_document(url):
+                    reached.append(fetches)
+            frontier.close()
+        finally:
+            os.chdir(cwd)
+    return reached, fetches
+
+
+def main(args):
+    cparser = ConfigParser()
+    cparser.read(args.config_file)
+    config = Config(cparser)
+    site = SyntheticSite(pages=args.pages, hosts=args.hosts, fanout=args.fanout, words=args.words,
+                         error_rate=args.error_rate, trap_rate=args.trap_rate, seed=args.seed)
+    config.seed_urls = site.seed_urls()
+    config.save_file = "frontier.shelve"
+    config.time_delay = 0
+    config.trap_detection = not args.no_trap_detection
+    stopwords = _get_stop_words()
+
+    results = dict()
+    for order in ORDERS:
+        config.order = order
+        results[order] = crawl(config, site, stopwords, args.max_fetches)
+
+    targets = [int(args.pages * share) for share in (0.25, 0.5, 0.75, 0.9)]
+    print(f"\nfetches to reach N unique pages ({args.pages} documents, trap rate {args.trap_rate})")
+    print(f"{'order':6} " + " ".join(f"{f'N={n}':>9}" for n in targets) + f" {'unique':>8} {'fetches':>8}")
+    for order, (reached, fetches) in results.items():
+        cells = [f"{reached[n - 1]:9}" if len(reached) >= n else f"{'-':>9}" for n in targets]
+        print(f"{order:6} " + " ".join(cells) + f" {len(reached):8} {fetches:8}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--max_fetches", type=int, default=20000)
+    parser.add_argument("--no_trap_detection", action="store_true", default=False)
+    parser.add_argument("--pages", type=int, default=5000)
+    parser.add_argument("--hosts", type=int, default=20)
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--words", type=int, default=300)
+    parser.add_argument("--error_rate", type=float, default=0.01)
+    parser.add_argument("--trap_rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,100 @@
+"""Compare resuming a frontier through the pending-url index against a full
+scan of the save file.
+
+Builds a frontier of --urls urls of which --pending are still pending, then
+times Frontier(config, restart=False) both ways. Run from the repository root:
+    python -m benchmarks.frontier_resume --urls 1000000 --pending 0.1
+"""
+import os
+import time
+import shelve
+import tempfile
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+from utils import get_urlhash
+from utils.bloom import BloomFilter
+from utils.config import Config
+from crawler.frontier import Frontier
+from crawler.frontier_log import FrontierLog
+from crawler.pending_index import PendingIndex
+from scraper import url_filter
+
+
+def build(config, count, pending_share):
+    # Write the save file, the seen filter and the pending index directly,
+    # as a crawl that stopped cleanly would have left them.
+    save_file = config.save_file
+    if config.storage == 'shelve':
+        save = shelve.open(save_file)
+        seen = BloomFilter(config.seen_capacity, config.seen_error_rate, save_file + '.seen')
+    else:
+        save = FrontierLog(save_file + '.wal', commit_records=count + 1)
+        seen = None
+    pending = PendingIndex(save_file + '.pending', commit_records=count + 1)
+    pending.rules = url_filter.version
+    every = max(1, round(1 / pending_share)) if pending_share else count + 1
+    for i in range(count):
+        url = f"https://h{i % 500}.ics.uci.edu/research/topic-{i}?id={i * 7}"
+        urlhash = get_urlhash(url)
+        completed = i % every != 0
+        save[urlhash] = (url, completed)
+        if seen is not None:
+            seen.add(urlhash)
+        if not completed:
+            pending[urlhash] = (url, url_filter.is_valid(url))
+    save.close()
+    if seen is not None:
+        seen.close()
+    pending.close(count)
+
+
+def resume(config):
+    start = time.perf_counter()
+    frontier = Frontier(config, False)
+    ready = time.perf_counter() - start
+    queued = sum(len(queue) for queue in frontier.host_queues.values())
+    # The log may still be replaying in the background
+    len(frontier.save)
+    loaded = time.perf_counter() - start
+    frontier.close()
+    return queued, ready, loaded
+
+
+def main(config_file, count, pending_share, storage):
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    config = Config(cparser)
+    config.storage = storage
+    config.seen_capacity = max(config.seen_capacity, count)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            config.save_file = "frontier.shelve"
+            start = time.perf_counter()
+            build(config, count, pending_share)
+            print(f"built {count} urls ({storage}) in {time.perf_counter() - start:.1f}s")
+
+            queued, index_ready, index_loaded = resume(config)
+            # Without a clean pending index the frontier scans the whole save file
+            os.remove(config.save_file + '.pending.meta')
+            queued_scan, scan_ready, scan_loaded = resume(config)
+        finally:
+            os.chdir(cwd)
+
+    print(f"{'resume':14} {'queued':>8} {'first url':>10} {'save loaded':>12}")
+    print(f"{'full scan':14} {queued_scan:8} {scan_ready:9.2f}s {scan_loaded:11.2f}s")
+    print(f"{'pending index':14} {queued:8} {index_ready:9.2f}s {index_loaded:11.2f}s")
+    print(f"time to first url: {scan_ready / index_ready:.1f}x faster")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--urls", type=int, default=1000000)
+    parser.add_argument("--pending", type=float, default=0.1, help="share of urls still pending")
+    parser.add_argument("--storage", choices=["log", "shelve"], default="log")
+    args = parser.parse_args()
+    main(args.config_file, args.urls, args.pending, args.storage)
@@ -0,0 +1,63 @@
+"""Compare frontier add throughput of the shelve and write-ahead log backends.
+
+Run from the repository root:
+    python -m benchmarks.frontier_storage --urls 20000
+"""
+import os
+import time
+import shelve
+import tempfile
+from argparse import ArgumentParser
+
+from utils import get_urlhash
+from crawler.frontier_log import FrontierLog
+
+
+def make_urls(count):
+    return [f"https://www.ics.uci.edu/page/{i}/section?id={i * 7}" for i in range(count)]
+
+
+def bench_shelve(path, urls):
+    save = shelve.open(path)
+    start = time.perf_counter()
+    for url in urls:
+        urlhash = get_urlhash(url)
+        if urlhash not in save:
+            save[urlhash] = (url, False)
+            save.sync()
+    elapsed = time.perf_counter() - start
+    save.close()
+    return elapsed
+
+
+def bench_log(path, urls, commit_interval, commit_records):
+    save = FrontierLog(path, commit_interval=commit_interval, commit_records=commit_records)
+    start = time.perf_counter()
+    for url in urls:
+        urlhash = get_urlhash(url)
+        if urlhash not in save:
+            save[urlhash] = (url, False)
+            save.sync()
+    save.commit()
+    elapsed = time.perf_counter() - start
+    save.close()
+    return elapsed
+
+
+def main(count, commit_interval, commit_records):
+    urls = make_urls(count)
+    with tempfile.TemporaryDirectory() as tmp:
+        shelve_time = bench_shelve(os.path.join(tmp, "frontier.shelve"), urls)
+        log_time = bench_log(os.path.join(tmp, "frontier.wal"), urls, commit_interval, commit_records)
+    print(f"shelve: {count / shelve_time:12.0f} adds/sec ({shelve_time:.2f}s)")
+    print(f"log:    {count / log_time:12.0f} adds/sec ({log_time:.2f}s)")
+    print(f"speedup: {shelve_time / log_time:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=20000)
+    parser.add_argument("--commit_interval", type=float, default=1.0)
+    parser.add_argument("--commit_records", type=int, default=1000)
+    args = parser.parse_args()
+    main(args.urls, args.commit_interval, args.commit_records)
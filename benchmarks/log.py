@@ -0,0 +1,131 @@
+"""Measure what logging the per-url download line costs a worker, with the
+old synchronous handlers and with the queue listener at several sample
+rates.
+
+--threads threads each log --pages download lines the way the workers do.
+It reports the time the workers spend per line and the time until every
+line is written. The console goes to /dev/null, so it costs what writing
+to a terminal costs at the least. Run from the repository root:
+    python -m benchmarks.log --threads 8 --pages 20000
+"""
+import os
+import sys
+import time
+import logging
+import tempfile
+import threading
+from argparse import ArgumentParser
+
+from utils import log
+from utils.log import events
+from crawler.worker import DOWNLOADED
+
+
+def legacy_get_logger(name, filename=None):
+    # The old utils.get_logger: new handlers on every call
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    os.makedirs("Logs", exist_ok=True)
+    fh = logging.FileHandler(f"Logs/{filename if filename else name}.log")
+    fh.setLevel(logging.DEBUG)
+    ch = logging.StreamHandler()
+    ch.setLevel(logging.INFO)
+    formatter = logging.Formatter(log.FORMAT)
+    fh.setFormatter(formatter)
+    ch.setFormatter(formatter)
+    logger.addHandler(fh)
+    logger.addHandler(ch)
+    return logger
+
+
+class Settings(object):
+    # What log.configure reads from the config
+    def __init__(self, log_format, log_sample, log_summary_interval):
+        self.log_format = log_format
+        self.log_sample = log_sample
+        self.log_summary_interval = log_summary_interval
+
+
+def legacy_worker(logger, pages, cache_server):
+    for i in range(pages):
+        logger.info(
+            f"Downloaded https://www.ics.uci.edu/page/{i}, status <200>, "
+            f"using cache {cache_server}, "
+            f"connect {0.25:.1f}ms.")
+
+
+def queue_worker(logger, pages, cache_server):
+    for i in range(pages):
+        events.log(logger, "download", DOWNLOADED, key=200, url=f"https://www.ics.uci.edu/page/{i}",
+                   status=200, cache=cache_server, connect_ms=0.25)
+
+
+def run(mode, threads, pages):
+    # Returns (worker seconds per line, seconds until everything is written)
+    cache_server = ("127.0.0.1", 9000)
+    if mode.startswith("legacy"):
+        # The duplicate variant: get_logger called twice per worker, as
+        # happened when a crawler was created again in the same process
+        calls = 2 if mode == "legacy, duplicate handlers" else 1
+        loggers = [[legacy_get_logger(f"{mode}-{i}", "Worker") for _ in range(calls)][0] for i in range(threads)]
+        target = legacy_worker
+    else:
+        log_format, sample = mode.split(", ")
+        log.configure(Settings(log_format, {None: int(sample.split()[-1])}, 10.0))
+        loggers = [log.get_logger(f"{mode}-{i}", "Worker") for i in range(threads)]
+        target = queue_worker
+    busy = [0.0] * threads
+
+    def work(index):
+        start = time.thread_time()
+        target(loggers[index], pages, cache_server)
+        busy[index] = time.thread_time() - start
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    log.flush()
+    for logger in loggers:
+        for handler in logger.handlers:
+            handler.flush()
+    elapsed = time.perf_counter() - start
+    return sum(busy) / (threads * pages), elapsed
+
+
+MODES = ("legacy", "legacy, duplicate handlers", "text, sample 1", "json, sample 1",
+         "text, sample 10", "text, sample 100")
+
+
+def main(threads, pages):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        # The console handlers hold on to sys.stderr, so redirect what is
+        # behind it
+        sys.stderr.flush()
+        stderr = os.dup(2)
+        os.dup2(devnull.fileno(), 2)
+        try:
+            for mode in MODES:
+                results.append((mode, *run(mode, threads, pages)))
+        finally:
+            sys.stderr.flush()
+            os.dup2(stderr, 2)
+            os.close(stderr)
+            os.chdir(cwd)
+    print(f"{threads} threads, {pages} lines each")
+    print(f"{'mode':28} {'worker us/line':>15} {'seconds':>8}")
+    for mode, per_line, elapsed in results:
+        print(f"{mode:28} {per_line * 1e6:15.1f} {elapsed:8.2f}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.threads, args.pages)
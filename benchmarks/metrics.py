@@ -0,0 +1,47 @@
+"""Measure what the stage timers cost when metrics are off and on.
+
+Run from the repository root:
+    python -m benchmarks.metrics --calls 1000000
+"""
+import time
+from argparse import ArgumentParser
+
+from utils.metrics import metrics
+
+URL = "https://www.ics.uci.edu/about/index.php"
+
+
+def bench(calls, url):
+    start = time.perf_counter()
+    for _ in range(calls):
+        with metrics.timer("stage", url):
+            pass
+    return (time.perf_counter() - start) / calls
+
+
+def baseline(calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        pass
+    return (time.perf_counter() - start) / calls
+
+
+def main(calls):
+    empty = baseline(calls)
+    metrics.enabled = False
+    off = bench(calls, URL) - empty
+    metrics.enabled = True
+    on = bench(calls, None) - empty
+    on_host = bench(calls, URL) - empty
+    metrics.enabled = False
+    print(f"timer, metrics off:         {off * 1e9:7.0f} ns per stage")
+    print(f"timer, metrics on:          {on * 1e9:7.0f} ns per stage")
+    print(f"timer with host, metrics on:{on_host * 1e9:7.0f} ns per stage")
+    print(f"a url goes through about 10 stages: {10 * on_host * 1e6:.1f} us per url with metrics on")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--calls", type=int, default=1000000)
+    args = parser.parse_args()
+    main(args.calls)
@@ -0,0 +1,78 @@
+"""Measure the page store: write throughput and size per compression,
+random reads through the index, sequential scans, and the analysis of the
+stored pages with a pool of 1 and N processes, as rebuild.py does it.
+
+The pages are the documents of a synthetic replay site. Run from the
+repository root:
+    python -m benchmarks.page_store --pages 20000 --processes 1 4
+"""
+import os
+import time
+import random
+import tempfile
+import multiprocessing
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+import rebuild
+from crawler.page_store import PageStore, zstandard
+from launch import _get_stop_words
+from replay import SyntheticSite
+
+
+def main(pages, reads, processes):
+    site = SyntheticSite(pages=pages, trap_rate=0.0)
+    documents = [(url, *site.get(url)[:2]) for url in (site.doc_url(n) for n in range(pages))]
+    body_bytes = sum(len(content) for _, _, content in documents if content)
+    compressions = ["none", "zlib"] + (["zstd"] if zstandard is not None else [])
+    stopwords = _get_stop_words()
+
+    print(f"{pages} pages, {body_bytes / 2 ** 20:.1f} MB of bodies")
+    print(f"{'compression':12} {'write MB/s':>11} {'size':>7} {'get us':>8} {'scan pages/s':>13}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for compression in compressions:
+            directory = os.path.join(tmp, compression)
+            store = PageStore(directory, compression)
+            start = time.perf_counter()
+            for url, status, content in documents:
+                store.put(url, url, status, content)
+            store.close()
+            write = time.perf_counter() - start
+            size = sum(os.path.getsize(os.path.join(directory, name))
+                       for name in os.listdir(directory) if name.startswith("segment"))
+
+            store = PageStore(directory, readonly=True)
+            urls = random.Random(0).choices([url for url, _, _ in documents], k=reads)
+            start = time.perf_counter()
+            for url in urls:
+                store.get(url)
+            get = (time.perf_counter() - start) / reads
+            start = time.perf_counter()
+            scanned = sum(1 for _ in store.scan())
+            scan = time.perf_counter() - start
+            store.close()
+            print(f"{compression:12} {body_bytes / 2 ** 20 / write:11.1f} {size / body_bytes:7.1%} "
+                  f"{get * 1e6:8.1f} {scanned / scan:13.0f}")
+
+        # Analysis of the stored pages, without merging them
+        directory = os.path.join(tmp, compressions[-1])
+        store = PageStore(directory, readonly=True)
+        locations = list(store.locations())
+        store.close()
+        print(f"\n{'processes':>9} {'seconds':>8} {'pages/s':>8}")
+        for count in processes:
+            start = time.perf_counter()
+            with ProcessPoolExecutor(max_workers=count, mp_context=multiprocessing.get_context("fork"),
+                                     initializer=rebuild._init_process, initargs=(directory, stopwords)) as pool:
+                analyzed = sum(1 for _ in pool.map(rebuild._analyze, locations, chunksize=64))
+            elapsed = time.perf_counter() - start
+            print(f"{count:9} {elapsed:8.1f} {analyzed / elapsed:8.0f}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=20000)
+    parser.add_argument("--reads", type=int, default=20000)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, os.cpu_count()])
+    args = parser.parse_args()
+    main(args.pages, args.reads, args.processes)
@@ -0,0 +1,73 @@
+"""Compare the single-pass page parse against the old double BeautifulSoup parse.
+
+Pages are read from a directory of saved .html files; without one, a set of
+synthetic pages is generated. Run from the repository root:
+    python -m benchmarks.parse --pages path/to/saved/pages
+"""
+import os
+import time
+from argparse import ArgumentParser
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+from utils.parse import parse_html
+
+BASE_URL = "https://www.ics.uci.edu/"
+
+
+def double_parse(content, base_url):
+    # What scraper.scraper used to do: one soup for the links, one for the text.
+    soup = BeautifulSoup(content, 'lxml')
+    links = [urljoin(base_url, link['href']) for link in soup.find_all('a', href=True)]
+    soup = BeautifulSoup(content, 'lxml')
+    return links, soup.get_text(separator=' ', strip=True)
+
+
+def load_pages(directory):
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith((".html", ".htm")):
+            with open(os.path.join(directory, name), "rb") as f:
+                pages.append(f.read())
+    return pages
+
+
+def synthetic_pages(count):
+    pages = []
+    for i in range(count):
+        body = "".join(
+            f"<p>Paragraph {j} of page {i} about information retrieval &amp; crawling."
+            f" <a href=\"/page{i}/link{j}.html\">link {j}</a></p>"
+            for j in range(200))
+        pages.append(
+            f"<html><head><title>Page {i}</title><style>p {{}}</style></head>"
+            f"<body><script>var x = {i};</script>{body}</body></html>".encode("utf-8"))
+    return pages
+
+
+def bench(parse, pages, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for page in pages:
+            parse(page, BASE_URL)
+    return len(pages) * rounds / (time.perf_counter() - start)
+
+
+def main(directory, rounds):
+    pages = load_pages(directory) if directory else synthetic_pages(50)
+    mismatches = sum(parse_html(page, BASE_URL) != double_parse(page, BASE_URL) for page in pages)
+    print(f"{len(pages)} pages, {mismatches} with different links or text")
+    old = bench(double_parse, pages, rounds)
+    new = bench(parse_html, pages, rounds)
+    print(f"double BeautifulSoup parse: {old:8.1f} pages/sec")
+    print(f"single-pass lxml parse:     {new:8.1f} pages/sec")
+    print(f"speedup: {new / old:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=str, default=None, help="directory of saved .html pages")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    main(args.pages, args.rounds)
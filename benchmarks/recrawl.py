@@ -0,0 +1,120 @@
+"""Measure what an incremental recrawl saves over crawling the site again.
+
+A synthetic site is crawled to the end, then served at its next revision,
+with a share --change_rate of its documents changed, and recrawled with
+--recrawl and RECRAWLAFTER = 0. The recrawl is checked against a fresh
+crawl of the new revision: both must end with the same token counts. Traps
+are off, so every crawl ends when the site is exhausted. Run from the
+repository root:
+    python -m benchmarks.recrawl --engine threads --pages 2000 --change_rate 0.1
+"""
+import os
+import time
+import tempfile
+import multiprocessing
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+from utils.config import Config
+from crawler.stats import Stats
+from launch import ENGINES, _get_stop_words
+from replay import SyntheticSite, ReplayServer
+from benchmarks.replay import cpu_seconds
+
+
+def serve(site, conn):
+    server = ReplayServer(site)
+    conn.send(server.address)
+    server.serve_forever()
+
+
+def crawl(args, config, stopwords, revision, restart):
+    # Crawls the site at `revision` in the current directory and returns
+    # (stats, page records revisits, seconds, cpu seconds)
+    site = SyntheticSite(pages=args.pages, hosts=args.hosts, words=args.words, trap_rate=0.0,
+                         seed=args.seed, revision=revision, change_rate=args.change_rate)
+    config.seed_urls = site.seed_urls()
+    context = multiprocessing.get_context("fork")
+    parent, child = context.Pipe()
+    server = context.Process(target=serve, args=(site, child), daemon=True)
+    server.start()
+    config.host, config.port = config.cache_server = parent.recv()
+    try:
+        if restart:
+            Stats.remove_files()
+        stats = Stats.load(config.seen_capacity, config.seen_error_rate)
+        crawler = ENGINES[args.engine](config, restart, stats, stopwords)
+        cpu = cpu_seconds()
+        start = time.perf_counter()
+        crawler.start()
+        elapsed = time.perf_counter() - start
+        cpu = cpu_seconds() - cpu
+    finally:
+        server.terminate()
+        server.join()
+    return crawler.stats, dict(crawler.frontier.records.revisits), elapsed, cpu
+
+
+def main(args):
+    cparser = ConfigParser()
+    cparser.read(args.config_file)
+    config = Config(cparser)
+    config.offline = True
+    config.save_file = "frontier.shelve"
+    config.page_records = True
+    config.recrawl_after = 0.0
+    config.time_delay = args.politeness
+    if args.threads is not None:
+        config.threads_count = config.min_threads = config.max_threads = args.threads
+    stopwords = _get_stop_words()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            os.chdir(tmp)
+            os.makedirs("logs")
+            _, _, first_time, first_cpu = crawl(args, config, stopwords, 0, True)
+            config.recrawl = True
+            stats, revisits, recrawl_time, recrawl_cpu = crawl(args, config, stopwords, 1, False)
+            recrawled = dict(stats.tokens)
+            config.recrawl = False
+            os.mkdir("fresh")
+            os.chdir("fresh")
+            os.makedirs("logs")
+            stats, _, fresh_time, fresh_cpu = crawl(args, config, stopwords, 1, True)
+            fresh = dict(stats.tokens)
+        finally:
+            os.chdir(cwd)
+
+    unchanged = revisits["unchanged_validators"] + revisits["unchanged_digest"]
+    work = revisits["cpu_avoided"] + revisits["cpu_spent"]
+    done = revisits["cpu_spent"] + revisits["cpu_checks"]
+    mismatched = sum(1 for token in recrawled.keys() | fresh.keys() if recrawled.get(token) != fresh.get(token))
+    print(f"\nengine {args.engine}, {config.threads_count} threads, {args.pages} documents, "
+          f"change rate {args.change_rate}")
+    print(f"revisited {unchanged + revisits['changed']}: {unchanged} unchanged "
+          f"({revisits['unchanged_validators']} by validators, {revisits['unchanged_digest']} by digest), "
+          f"{revisits['changed']} changed")
+    print(f"parse, tokenize and merge CPU avoided: {1 - done / work if work else 0.0:.1%} "
+          f"({done:.2f}s of {work:.2f}s)")
+    print(f"{'crawl':20} {'seconds':>9} {'cpu seconds':>12}")
+    for name, elapsed, cpu in (("first, revision 0", first_time, first_cpu),
+                               ("recrawl, revision 1", recrawl_time, recrawl_cpu),
+                               ("fresh, revision 1", fresh_time, fresh_cpu)):
+        print(f"{name:20} {elapsed:9.1f} {cpu:12.2f}")
+    print(f"tokens of the recrawl and the fresh crawl: "
+          + ("identical" if not mismatched else f"{mismatched} of {len(fresh)} differ"))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="threads")
+    parser.add_argument("--threads", type=int, default=None, help="THREADCOUNT, default from the config")
+    parser.add_argument("--politeness", type=float, default=0.0)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--hosts", type=int, default=20)
+    parser.add_argument("--words", type=int, default=300)
+    parser.add_argument("--change_rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
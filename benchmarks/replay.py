@@ -0,0 +1,162 @@
+"""Crawl a local replay server and report pages/sec, CPU per page and peak RSS.
+
+The replay server runs in its own process, so its CPU time is not counted.
+Each run crawls from the site's seed urls in a scratch directory until the
+site is exhausted or --max_pages urls were handed out. The query-string trap
+gets past the url filter, so with traps on a run usually ends at
+--max_pages. With --shards, there is a run per number of shard processes
+(1 crawls in this process), each shard handing out at most its share of
+--max_pages; peak RSS is then that of the largest process. --threads runs a
+fixed number of workers, --scale MIN MAX lets the autoscaler size the pool
+and prints the worker counts it went through; with --capacity, the server
+only serves that many requests at once. Run from the repository root:
+    python -m benchmarks.replay --engine threads --threads 8 --pages 5000 --politeness 0
+    python -m benchmarks.replay --engine pipeline --corpus recorded/
+    python -m benchmarks.replay --shards 1 2 4 --latency 0.02
+    python -m benchmarks.replay --scale 1 32 --latency 0.05 --capacity 8 --politeness 0.1
+"""
+import os
+import time
+import resource
+import tempfile
+import multiprocessing
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+from utils.config import Config
+from crawler.stats import Stats
+from crawler.sharded import ShardedCrawler, ShardFrontier
+from launch import ENGINES, _get_stop_words
+from replay import SyntheticSite, Corpus, ReplayServer
+from replay.site import TRAPS
+from benchmarks.engines import limited_frontier
+
+
+def make_source(args):
+    if args.corpus:
+        return Corpus(args.corpus)
+    return SyntheticSite(pages=args.pages, hosts=args.hosts, fanout=args.fanout, words=args.words,
+                         error_rate=args.error_rate, trap_rate=args.trap_rate, traps=args.traps, seed=args.seed)
+
+
+def serve(args, conn):
+    server = ReplayServer(make_source(args), latency=args.latency, cache_error_rate=args.cache_error_rate,
+                          capacity=args.capacity)
+    conn.send(server.address)
+    server.serve_forever()
+
+
+def cpu_seconds():
+    self, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return self.ru_utime + self.ru_stime + children.ru_utime + children.ru_stime
+
+
+def crawl(args, config, stopwords, shards):
+    # Returns (urls handed out or None, pages, seconds, cpu seconds, peak RSS
+    # bytes, worker counts the autoscaler went through or None)
+    config.shards = shards
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            os.makedirs("logs")
+            if shards > 1:
+                crawler = ShardedCrawler(config, True, ENGINES[args.engine], stopwords,
+                                         frontier_factory=limited_frontier(args.max_pages // shards, ShardFrontier))
+            else:
+                stats = Stats.load(config.seen_capacity, config.seen_error_rate)
+                crawler = ENGINES[args.engine](config, True, stats, stopwords,
+                                               frontier_factory=limited_frontier(args.max_pages))
+            cpu = cpu_seconds()
+            start = time.perf_counter()
+            crawler.start()
+            elapsed = time.perf_counter() - start
+            cpu = cpu_seconds() - cpu
+            stats = crawler.stats
+            # Shards do not report how many urls they handed out, nor how
+            # they scaled
+            urls = crawler.frontier.handed_out if shards == 1 else None
+            workers = None
+            if shards == 1 and crawler.scaler is not None:
+                workers = [crawler.scaler.decisions[0]["from"]] if crawler.scaler.decisions else []
+                for decision in crawler.scaler.decisions:
+                    if decision["to"] != decision["from"]:
+                        workers.append(decision["to"])
+            pages = sum(len(subdomain_pages) for subdomain_pages in stats.subdomains.values())
+        finally:
+            os.chdir(cwd)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 if os.uname().sysname != "Darwin" else 1
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss if shards > 1 else 0) * scale
+    return urls, pages, elapsed, cpu, peak, workers
+
+
+def main(args):
+    cparser = ConfigParser()
+    cparser.read(args.config_file)
+    config = Config(cparser)
+    config.offline = True
+    config.seed_urls = make_source(args).seed_urls()
+    config.save_file = "frontier.shelve"
+    if args.threads is not None:
+        config.threads_count = config.min_threads = config.max_threads = args.threads
+    if args.scale is not None:
+        config.min_threads, config.max_threads = args.scale
+    if args.politeness is not None:
+        config.time_delay = args.politeness
+    stopwords = _get_stop_words()
+
+    context = multiprocessing.get_context("fork")
+    parent, child = context.Pipe()
+    server = context.Process(target=serve, args=(args, child), daemon=True)
+    server.start()
+    config.host, config.port = config.cache_server = parent.recv()
+
+    results = []
+    try:
+        for shards in args.shards:
+            results.append((shards, *crawl(args, config, stopwords, shards)))
+    finally:
+        server.terminate()
+        server.join()
+
+    if config.min_threads < config.max_threads:
+        threads = f"{config.min_threads}-{config.max_threads} threads starting at {config.threads_count}"
+    else:
+        threads = f"{config.threads_count} threads"
+    print(f"\nengine {args.engine}, {threads}, politeness {config.time_delay}s")
+    print(f"{'shards':>6} {'urls':>8} {'pages':>8} {'seconds':>9} {'pages/sec':>10} "
+          f"{'cpu ms/page':>12} {'peak MB':>9}")
+    for shards, urls, pages, elapsed, cpu, peak, workers in results:
+        print(f"{shards:6} {'-' if urls is None else urls:>8} {pages:8} {elapsed:9.1f} {pages / elapsed:10.1f} "
+              f"{1000 * cpu / max(pages, 1):12.2f} {peak / 2 ** 20:9.1f}")
+    for shards, *_, workers in results:
+        if workers and config.min_threads < config.max_threads:
+            print(f"workers with {shards} shard(s): {' -> '.join(map(str, workers))}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="threads")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="fixed THREADCOUNT, default the config's THREADCOUNT, MINTHREADS and MAXTHREADS")
+    parser.add_argument("--scale", type=int, nargs=2, default=None, metavar=("MIN", "MAX"),
+                        help="MINTHREADS and MAXTHREADS, with THREADCOUNT as the start")
+    parser.add_argument("--politeness", type=float, default=None, help="POLITENESS, default from the config")
+    parser.add_argument("--max_pages", type=int, default=10000)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1], help="shard processes, a run for each")
+    parser.add_argument("--corpus", type=str, default=None, help="replay this corpus instead of a generated site")
+    parser.add_argument("--pages", type=int, default=5000)
+    parser.add_argument("--hosts", type=int, default=20)
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--words", type=int, default=300)
+    parser.add_argument("--error_rate", type=float, default=0.01)
+    parser.add_argument("--trap_rate", type=float, default=0.02)
+    parser.add_argument("--traps", nargs="*", choices=TRAPS, default=list(TRAPS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--cache_error_rate", type=float, default=0.0)
+    parser.add_argument("--capacity", type=int, default=0, help="requests the server serves at once, 0 for any")
+    main(parser.parse_args())
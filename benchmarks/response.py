@@ -0,0 +1,136 @@
+"""Compare peak memory of lazy, size-capped response decoding with the old
+eager decoding on large pages.
+
+The cache server replies of a mix of large pages (HTML over the size cap,
+PDFs, and a few normal pages) are written to files first. Each mode then
+runs in a fresh process that reads the replies one at a time and takes the
+page bodies the way scraper.page_content does. It reports the peak of
+Python allocations and the peak RSS of the process.
+Run from the repository root:
+    python -m benchmarks.response --pages 40 --size_mb 8
+"""
+import os
+import time
+import tempfile
+import pickle
+import random
+import resource
+import tracemalloc
+import multiprocessing
+from argparse import ArgumentParser
+
+import cbor
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import scraper
+from utils.response import Response, MAX_PAGE_SIZE
+
+
+def make_pages(count, size_mb):
+    # (url, content type, body size) of a crawl's large-file pages
+    rng = random.Random(0)
+    pages = []
+    for i in range(count):
+        kind = rng.choice(("big_html", "pdf", "html"))
+        if kind == "big_html":
+            pages.append((f"https://www.ics.uci.edu/big/{i}", "text/html", int(size_mb * 2 ** 20)))
+        elif kind == "pdf":
+            pages.append((f"https://www.ics.uci.edu/paper/{i}", "application/pdf", rng.randint(1, 4) * 2 ** 20))
+        else:
+            pages.append((f"https://www.ics.uci.edu/page/{i}", "text/html", 200 * 1024))
+    return pages
+
+
+def reply(url, content_type, size):
+    # The cache server's reply body: a CBOR envelope with a pickled
+    # requests.Response, as it comes off the socket.
+    raw = requests.Response()
+    raw._content = b"<html><body>" + b"x" * size + b"</body></html>"
+    raw.status_code = 200
+    raw.headers = CaseInsensitiveDict({"Content-Type": content_type})
+    raw.url = url
+    return cbor.dumps({"url": url, "status": 200, "response": pickle.dumps(raw)})
+
+
+class LegacyResponse(object):
+    # The old Response: unpickles the page right away.
+    def __init__(self, resp_dict):
+        self.url = resp_dict["url"]
+        self.status = resp_dict["status"]
+        self.raw_response = pickle.loads(resp_dict["response"])
+
+
+def legacy_page_content(url, resp):
+    # The old page_content: checks the size after decoding.
+    if resp.status != 200 or not resp.raw_response or not resp.raw_response.content:
+        return None
+    if len(resp.raw_response.content) > MAX_PAGE_SIZE:
+        return None
+    return resp.raw_response.content
+
+
+def run(mode, files):
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept = 0
+    for url, path in files:
+        with open(path, "rb") as f:
+            body = f.read()
+        if mode == "legacy":
+            content = legacy_page_content(url, LegacyResponse(cbor.loads(body)))
+        else:
+            content = scraper.page_content(url, Response(cbor.loads(body)))
+        kept += content is not None
+        del body, content
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    scale = 1024 if os.uname().sysname != "Darwin" else 1
+    return kept, peak, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale, elapsed
+
+
+def write_replies(pages, directory):
+    files = []
+    for i, (url, content_type, size) in enumerate(pages):
+        path = os.path.join(directory, str(i))
+        with open(path, "wb") as f:
+            f.write(reply(url, content_type, size))
+        files.append((url, path))
+    return files
+
+
+def in_process(target, *args):
+    # Run target in a fresh process and return what it sends back. Building
+    # the replies happens in one as well: a child starts with the peak RSS of
+    # its parent at the time of the fork.
+    context = multiprocessing.get_context("spawn")
+    parent, child = context.Pipe()
+    process = context.Process(target=_send, args=(target, child) + args)
+    process.start()
+    result = parent.recv()
+    process.join()
+    return result
+
+
+def _send(target, conn, *args):
+    conn.send(target(*args))
+
+
+def main(count, size_mb):
+    pages = make_pages(count, size_mb)
+    with tempfile.TemporaryDirectory() as tmp:
+        files = in_process(write_replies, pages, tmp)
+        print(f"{count} pages, {sum(size for _, _, size in pages) / 2 ** 20:.0f} MB of bodies")
+        print(f"{'mode':8} {'kept':>5} {'peak alloc MB':>14} {'peak RSS MB':>12} {'seconds':>8}")
+        for mode in ("legacy", "lazy"):
+            kept, peak, rss, elapsed = in_process(run, mode, files)
+            print(f"{mode:8} {kept:5} {peak / 2 ** 20:14.1f} {rss / 2 ** 20:12.1f} {elapsed:8.2f}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--size_mb", type=float, default=8)
+    args = parser.parse_args()
+    main(args.pages, args.size_mb)
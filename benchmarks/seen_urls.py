@@ -0,0 +1,59 @@
+"""Compare memory and lookup latency of a set of urls against SeenUrls.
+
+Run from the repository root:
+    python -m benchmarks.seen_urls --urls 1000000 --error_rate 0.001
+"""
+import os
+import time
+import tempfile
+import tracemalloc
+from argparse import ArgumentParser
+
+from utils.bloom import BloomFilter, SeenUrls
+
+
+def make_urls(count, offset=0):
+    return [f"https://www.ics.uci.edu/~user{i % 977}/pages/item{i + offset}.html" for i in range(count)]
+
+
+def lookup_ns(container, urls):
+    start = time.perf_counter_ns()
+    for url in urls:
+        url in container
+    return (time.perf_counter_ns() - start) / len(urls)
+
+
+def main(count, error_rate):
+    misses = make_urls(min(count, 100000), offset=count)
+
+    # Count the url strings too: in the crawl only the set holds on to them.
+    tracemalloc.start()
+    pages = set(make_urls(count))
+    set_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    urls = list(pages)
+    hits = urls[:len(misses)]
+    print(f"set:       {set_bytes / count:8.1f} bytes/url, "
+          f"hit {lookup_ns(pages, hits):6.0f} ns, miss {lookup_ns(pages, misses):6.0f} ns")
+    del pages
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seen = SeenUrls(BloomFilter(count, error_rate, os.path.join(tmp, "stats.bloom")),
+                        os.path.join(tmp, "stats_pages.txt"))
+        for url in urls:
+            seen.add(url)
+        false_positives = sum(url in seen for url in misses)
+        print(f"SeenUrls:  {seen.bloom.size_bytes / count:8.1f} bytes/url, "
+              f"hit {lookup_ns(seen, hits):6.0f} ns, miss {lookup_ns(seen, misses):6.0f} ns "
+              f"(exact count {len(seen)}, {false_positives / len(misses):.4%} false positives, "
+              f"{seen.false_positives} maybes resolved on disk, "
+              f"index {os.path.getsize(seen.index.path) / count:.1f} bytes/url on disk)")
+        seen.close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=1000000)
+    parser.add_argument("--error_rate", type=float, default=0.001)
+    args = parser.parse_args()
+    main(args.urls, args.error_rate)
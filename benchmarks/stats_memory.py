@@ -0,0 +1,120 @@
+"""Compare the memory and checkpoint cost of the interned stats (TokenCounts
+and PageSets) against the dict of str counts and the sets of url strings
+they replaced.
+
+--tokens distinct tokens with Zipf-like counts and --pages crawled pages
+over --subdomains subdomains are merged in batches, the way the aggregator
+merges worker shards. Tokens and urls are decoded from bytes as they are
+merged, so each structure holds strings of its own, as it does behind the
+tokenizer. Memory is what tracemalloc sees allocated for each structure;
+the merge is timed in a second pass without tracemalloc. Run from the
+repository root:
+    python -m benchmarks.stats_memory --tokens 654000 --pages 100000
+"""
+import gc
+import time
+import pickle
+import random
+import tracemalloc
+from argparse import ArgumentParser
+from collections import Counter, defaultdict
+
+from crawler.report import top_tokens
+from utils.interned import TokenCounts, PageSets
+
+BATCH = 5000
+
+
+def make_data(tokens, pages, subdomains):
+    rng = random.Random(0)
+    letters = "abcdefghijklmnopqrstuvwxyz0123456789"
+    vocabulary = list({"".join(rng.choice(letters) for _ in range(rng.randint(3, 12))) for _ in range(tokens)})
+    counts = [(token.encode("utf-8"), max(1, int(100000 / (rank + 1)))) for rank, token in enumerate(vocabulary)]
+    batches = [counts[start:start + BATCH] for start in range(0, len(counts), BATCH)]
+    hosts = [f"sub{i}.ics.uci.edu" for i in range(subdomains)]
+    urls = [(host, f"https://{host}/people/{rng.randrange(10 ** 6)}/{n}/index.html".encode("utf-8"))
+            for n, host in enumerate(rng.choice(hosts) for _ in range(pages))]
+    return batches, urls
+
+
+def shard(batch):
+    # The token counts of a worker shard
+    return Counter({token.decode("utf-8"): count for token, count in batch})
+
+
+def build_legacy(batches, urls):
+    tokens = defaultdict(int)
+    subdomains = defaultdict(set)
+    for batch in batches:
+        for token, count in shard(batch).items():
+            tokens[token] += count
+    for host, url in urls:
+        subdomains[host].add(url.decode("utf-8"))
+    return tokens, subdomains
+
+
+def build_interned(batches, urls):
+    tokens = TokenCounts()
+    subdomains = PageSets()
+    for batch in batches:
+        tokens.update(shard(batch))
+    for host, url in urls:
+        subdomains[host].add(url.decode("utf-8"))
+    return tokens, subdomains
+
+
+def measure(build, batches, urls):
+    # Returns (tokens, subdomains, bytes of tokens, bytes of subdomains, build seconds)
+    gc.collect()
+    tracemalloc.start()
+    tokens, _ = build(batches, [])
+    token_bytes = tracemalloc.get_traced_memory()[0]
+    _, subdomains = build([], urls)
+    page_bytes = tracemalloc.get_traced_memory()[0] - token_bytes
+    tracemalloc.stop()
+    del tokens, subdomains
+    gc.collect()
+    start = time.perf_counter()
+    tokens, subdomains = build(batches, urls)
+    return tokens, subdomains, token_bytes, page_bytes, time.perf_counter() - start
+
+
+def checkpoint(tokens, subdomains, legacy):
+    # Seconds to snapshot and pickle the counts as Stats.save does, and the size
+    start = time.perf_counter()
+    if legacy:
+        data = {'tokens': dict(tokens), 'subdomains': {k: set(v) for k, v in subdomains.items()}}
+    else:
+        data = {'tokens': tokens.copy(), 'subdomains': subdomains.copy()}
+    size = len(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+    return time.perf_counter() - start, size
+
+
+def main(tokens, pages, subdomains):
+    batches, urls = make_data(tokens, pages, subdomains)
+    distinct = sum(len(batch) for batch in batches)
+    results = []
+    for name, build, legacy in (("dict / set of str", build_legacy, True),
+                                ("interned", build_interned, False)):
+        token_counts, page_sets, token_bytes, page_bytes, elapsed = measure(build, batches, urls)
+        save, size = checkpoint(token_counts, page_sets, legacy)
+        start = time.perf_counter()
+        top_tokens(token_counts)
+        top = time.perf_counter() - start
+        results.append((name, token_bytes / distinct, page_bytes / len(urls), elapsed, save, size, top))
+        del token_counts, page_sets
+
+    print(f"{distinct} tokens, {len(urls)} pages in {subdomains} subdomains")
+    print(f"{'stats':18} {'B/token':>8} {'B/page':>7} {'merge s':>8} {'save s':>7} {'pickle MB':>10} {'top100 ms':>10}")
+    for name, per_token, per_page, elapsed, save, size, top in results:
+        print(f"{name:18} {per_token:8.1f} {per_page:7.1f} {elapsed:8.2f} {save:7.2f} "
+              f"{size / 2 ** 20:10.1f} {top * 1000:10.1f}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=654000)
+    parser.add_argument("--pages", type=int, default=100000)
+    parser.add_argument("--subdomains", type=int, default=100)
+    args = parser.parse_args()
+    main(args.tokens, args.pages, args.subdomains)
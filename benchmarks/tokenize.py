@@ -0,0 +1,97 @@
+"""Compare tokenize_text against the old per-character tokenizer.
+
+Checks that both produce the same counts, whole and in chunks, on a set of
+tricky strings and on a large generated page, then times them. Run from the
+repository root:
+    python -m benchmarks.tokenize --words 2000000
+"""
+import random
+import time
+from argparse import ArgumentParser
+from collections import defaultdict
+
+from utils.tokenize import tokenize_text, tokenize_chunks
+
+STOP_WORDS = {"the", "of", "and", "a", "to", "in", "is", "it"}
+
+TRICKY = [
+    "", " ", "abc", "ABC def", "a-b_c.d", "x1 2y 33 z4z", "trailing ",
+    "İstanbul and KELVIN K", "naïve café résumé", "ÀÉÎ ÕÜ ß straße",
+    "日本語 text ｆｕｌｌ ｗｉｄｔｈ", "emoji 😀 here", "tab\tnew\nline\r\n",
+    "Σίσυφος ΣΟΦΟΣ", "\ud800 lone surrogate", "The the THE of Of",
+]
+
+
+def legacy_tokenize(text, stop_words=None):
+    # The old tokenize_text, character by character.
+    text = text.lower()
+    cur = 0
+    index = 0
+    token_freq = defaultdict(int)
+    while index < len(text):
+        ch = text[index]
+        if not (('a' <= ch <= 'z') or ('A' <= ch <= 'Z') or ('0' <= ch <= '9')):
+            token = text[cur:index]
+            if token and (stop_words is None or token not in stop_words):
+                token_freq[token] += 1
+            cur = index + 1
+        index += 1
+    token = text[cur:index]
+    if token and (stop_words is None or token not in stop_words):
+        token_freq[token] += 1
+    return token_freq
+
+
+def generate_page(words, seed=0):
+    rng = random.Random(seed)
+    vocabulary = [
+        "".join(rng.choice("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789")
+                for _ in range(rng.randint(1, 12)))
+        for _ in range(20000)] + sorted(STOP_WORDS) + ["café", "İndex", "Kelvin"]
+    separators = [" ", " ", " ", "\n", ", ", ". ", "-", "/", " — "]
+    return "".join(rng.choice(vocabulary) + rng.choice(separators) for _ in range(words))
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def check(text):
+    expected = dict(legacy_tokenize(text, STOP_WORDS))
+    if dict(tokenize_text(text, STOP_WORDS)) != expected:
+        return False
+    if dict(tokenize_text(text)) != dict(legacy_tokenize(text)):
+        return False
+    return all(dict(tokenize_chunks(chunked(text, size), STOP_WORDS)) == expected for size in (1, 3, 7, 4096))
+
+
+def bench(tokenize, text, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        tokenize(text, STOP_WORDS)
+    return (time.perf_counter() - start) / rounds
+
+
+def main(words, rounds):
+    mismatches = [text for text in TRICKY if not check(text)]
+    page = generate_page(words)
+    if not check(page[:200000]):
+        mismatches.append("generated page")
+    if dict(tokenize_text(page, STOP_WORDS)) != dict(legacy_tokenize(page, STOP_WORDS)):
+        mismatches.append("full generated page")
+    print(f"{len(TRICKY) + 2} inputs, {len(mismatches)} with different counts {mismatches or ''}")
+
+    old = bench(legacy_tokenize, page, rounds)
+    new = bench(tokenize_text, page, rounds)
+    print(f"page of {words} words, {len(page) / 1e6:.1f}M characters")
+    print(f"per-character tokenizer: {old:8.3f} s")
+    print(f"bytes tokenizer:         {new:8.3f} s")
+    print(f"speedup: {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--words", type=int, default=1000000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    main(args.words, args.rounds)
@@ -0,0 +1,116 @@
+"""Check the compiled url filter against the old is_valid and compare URLs/sec.
+
+Urls come from all_unique_pages in a saved stats report, plus variants of
+each of them that trip the trap and extension rules. Run from the
+repository root:
+    python -m benchmarks.url_filter --report stats_report.json
+"""
+import re
+import json
+import time
+from argparse import ArgumentParser
+from urllib.parse import urlparse
+
+from scraper import url_filter, blocked_domains, blocked_paths
+
+
+def legacy_is_valid(url, stats=None):
+    # scraper.is_valid before the rules were compiled into url_filter.
+    parsed = urlparse(url)
+    if stats:
+        base_url = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
+        if base_url in stats:
+            return False
+    if parsed.scheme not in {"http", "https"}:
+        return False
+    allowed_domains = ["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu"]
+    domain_valid = False
+    for domain in allowed_domains:
+        if parsed.netloc == domain or parsed.netloc.endswith("." + domain):
+            domain_valid = True
+            break
+    if not domain_valid:
+        return False
+    if parsed.netloc in blocked_domains:
+        return False
+    for blocked in blocked_paths:
+        if '/' in blocked:
+            domain, path = blocked.split('/', 1)
+            if parsed.netloc == domain and parsed.path.startswith('/' + path):
+                return False
+    if '/-/' in parsed.path:
+        return False
+    if '/doku.php/' in parsed.path:
+        return False
+    if re.search(r'/\d{4}/\d{1,2}(/\d{1,2})?', parsed.path):
+        return False
+    if re.search(r'\d{4}-\d{1,2}(-\d{1,2})?', parsed.path):
+        return False
+    if re.search(r'/(page|p)/\d+/?', parsed.path.lower()):
+        return False
+    match = re.search(r'/([a-z]+)(\d+)\.(html?|php|aspx?)$', parsed.path.lower())
+    if match:
+        if int(match.group(2)) > 50:
+            return False
+    if re.search(r'/(tree|commit|blob|raw)s?/[a-f0-9]{30,}', parsed.path.lower()):
+        return False
+    if re.search(r'/[a-f0-9]{32,}', parsed.path.lower()):
+        return False
+    gallery_patterns = ['/pix/', '/photos/', '/gallery/', '/galleries/', '/images/', '/pics/']
+    path_lower = parsed.path.lower()
+    if any(pattern in path_lower for pattern in gallery_patterns):
+        return False
+    return not re.match(
+        r".*\.(css|js|bmp|gif|jpe?g|ico"
+        + r"|png|tiff?|mid|mp2|mp3|mp4"
+        + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+        + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+        + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+        + r"|epub|dll|cnf|tgz|sha1"
+        + r"|thmx|mso|arff|rtf|jar|csv"
+        + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower())
+
+
+VARIANTS = ["", "/", ".PDF", "/page/3", "/2019/10/04", "/2019-10", "/item51.html",
+            "/item50.html", "/Tree/" + "ab" * 16, "/Photos/x", "/-/x", "/DOKU.PHP/x",
+            "/doku.php/x", "?q=1", "#frag", "/paper1234.Php"]
+
+
+def load_urls(report):
+    with open(report) as f:
+        pages = json.load(f)["all_unique_pages"]
+    urls = [page + variant for page in pages for variant in VARIANTS]
+    urls += [url.replace("https://", "ftp://", 1) for url in pages[:100]]
+    urls += [url.replace(".uci.edu", ".uci.edu:8080", 1) for url in pages[:100]]
+    return urls
+
+
+def main(report):
+    urls = load_urls(report)
+    seen = set(urls[::7])
+
+    mismatches = [url for url in urls
+                  if legacy_is_valid(url) != url_filter.is_valid(url)
+                  or legacy_is_valid(url, seen) != url_filter.is_valid(url, seen)]
+    print(f"{len(urls)} urls, {len(mismatches)} mismatches")
+    for url in mismatches[:10]:
+        print(f"  {url}")
+
+    start = time.perf_counter()
+    legacy = [url for url in urls if legacy_is_valid(url, seen)]
+    legacy_time = time.perf_counter() - start
+    start = time.perf_counter()
+    compiled = list(url_filter.filter_many(urls, seen))
+    compiled_time = time.perf_counter() - start
+    assert legacy == compiled
+
+    print(f"old is_valid:        {len(urls) / legacy_time:10.0f} urls/sec")
+    print(f"UrlFilter.filter_many: {len(urls) / compiled_time:10.0f} urls/sec")
+    print(f"speedup: {legacy_time / compiled_time:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--report", type=str, default="stats_report.json")
+    args = parser.parse_args()
+    main(args.report)
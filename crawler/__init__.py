@@ -1,18 +1,42 @@
 import signal
 from utils import get_logger
+from utils import metrics
+from utils import log
 from crawler.frontier import Frontier
+from crawler.aggregator import StatsAggregator
+from crawler.checkpoint import Checkpointer
+from crawler.autoscaler import Autoscaler
+from crawler.page_store import PageStore
 from crawler.worker import Worker
 
 class Crawler(object):
     def __init__(self, config, restart, stats, stopwords, frontier_factory=Frontier, worker_factory=Worker):
         self.config = config
+        log.configure(config)
         self.logger = get_logger("CRAWLER")
         self.frontier = frontier_factory(config, restart)
         self.workers = list()
         self.worker_factory = worker_factory
         self.stats = stats
+        # Pages the frontier keeps records of are checked for changes
+        stats.records = getattr(self.frontier, "records", None)
+        # Downloaded pages are kept for rebuilding the stats offline
+        self.store = None
+        if config.page_store:
+            if restart:
+                PageStore.remove_files(config.page_store_dir)
+            self.store = PageStore(
+                config.page_store_dir, config.page_store_compression, config.page_store_segment_bytes,
+                config.commit_interval)
+        # Workers count into their own shard of the stats, merged into
+        # self.stats and checkpointed in the background
+        self.checkpointer = Checkpointer(stats, config.checkpoint_interval, config.checkpoint_pages)
+        self.aggregator = StatsAggregator(stats, config.stats_merge_interval, self.checkpointer)
         self.stopwords = stopwords
+        # Sizes the worker pool, once the workers start
+        self.scaler = None
         self.shutdown_flag = False
+        self.metrics_reporter = metrics.start(config)
 
         # Register signal handler for graceful shutdown
         signal.signal(signal.SIGINT, self._signal_handler)
@@ -21,13 +45,25 @@ class Crawler(object):
         """Handle SIGINT (Control+C) gracefully"""
         self.logger.info("\n\nReceived shutdown signal. Finishing current tasks and saving...")
         self.shutdown_flag = True
+        # Wake up workers blocked waiting on the frontier, or parked.
+        self.frontier.stop()
+        if self.scaler is not None:
+            self.scaler.finish()
+
+    def _parse_capacity(self):
+        # CPUs pages can be parsed on at once: the workers parse under the GIL
+        return 1
+
+    def _add_worker(self, worker_id):
+        worker = self.worker_factory(
+            worker_id, self.config, self.frontier, self.aggregator.shard(), self.stopwords, self)
+        self.workers.append(worker)
+        worker.start()
 
     def start_async(self):
-        self.workers = [
-            self.worker_factory(worker_id, self.config, self.frontier, self.stats, self.stopwords, self)
-            for worker_id in range(self.config.threads_count)]
-        for worker in self.workers:
-            worker.start()
+        self.aggregator.start()
+        self.scaler = Autoscaler(self.frontier, self.config, self._add_worker, self._parse_capacity())
+        self.scaler.start_workers()
 
     def start(self):
         self.start_async()
@@ -36,10 +72,25 @@ class Crawler(object):
     def join(self):
         for worker in self.workers:
             worker.join()
+        # Workers are only added by the controller: once it has stopped, join
+        # the ones it added while the others were being joined
+        self.scaler.stop()
+        for worker in self.workers:
+            worker.join()
+        self.finish()
+
+    def finish(self):
         # Close the frontier to ensure shelve is saved
         self.frontier.close()
+        if self.store is not None:
+            self.store.close()
+        # Merge what the workers counted since the last merge
+        self.aggregator.stop()
         # Save stats to disk
         self.stats.save()
+        self.checkpointer.save_log()
+        if self.metrics_reporter:
+            self.metrics_reporter.stop()
         # Save comprehensive final report
-        self.stats.save_final_report()
+        self.stats.save_final_report(self.config.report_page_files)
         self.logger.info("Crawler stopped. All data saved.")
@@ -0,0 +1,93 @@
+from collections import Counter, defaultdict
+from threading import Thread, Event, Lock
+
+from crawler.stats import COUNTS, merge_counts
+from utils import get_logger
+
+
+class StatsShard(object):
+    ''' The stats of one worker since the last merge. It has the attributes
+    scraper.merge_page updates, so a worker passes its shard where it would
+    pass the global Stats. Only pages and fingerprints are shared with the
+    global Stats, because links and near duplicates have to be checked
+    against everything crawled so far, and so are the page records. '''
+
+    def __init__(self, stats):
+        self.pages = stats.pages
+        self.fingerprints = stats.fingerprints
+        self.records = stats.records
+        # Held by the worker while it merges a page and by the aggregator
+        # while it takes the shard's counts, so it is almost never contended.
+        self.lock = Lock()
+        self._reset()
+
+    def _reset(self):
+        self.longest_length = 0
+        self.tokens = Counter()
+        self.subdomains = defaultdict(set)
+        self.fingerprinted = Counter()
+        self.duplicates = Counter()
+
+    def counts(self):
+        return {key: getattr(self, key) for key in COUNTS}
+
+    def merge(self, shard):
+        with self.lock:
+            merge_counts(self, **shard.counts())
+
+    def drain(self):
+        ''' Return the counts gathered since the last drain as a shard, and
+        start over with empty ones. '''
+        delta = StatsShard.__new__(StatsShard)
+        with self.lock:
+            delta.__dict__.update(self.__dict__)
+            self._reset()
+        return delta
+
+
+class StatsAggregator(Thread):
+    ''' Merges the shards of all workers into the global Stats every
+    `interval` seconds, and a last time when it is stopped. What it merges
+    is also handed to the checkpointer, if there is one. '''
+
+    def __init__(self, stats, interval, checkpointer=None):
+        self.stats = stats
+        self.interval = interval
+        self.checkpointer = checkpointer
+        self.shards = list()
+        self.lock = Lock()
+        self.stopped = Event()
+        self.logger = get_logger("AGGREGATOR")
+        super().__init__(daemon=True)
+
+    def shard(self):
+        shard = StatsShard(self.stats)
+        with self.lock:
+            self.shards.append(shard)
+        return shard
+
+    def merge(self):
+        # Shards are merged in the order they were created. Counts are added
+        # up and the longest page is a max, so totals are exact either way.
+        with self.lock:
+            shards = list(self.shards)
+        for shard in shards:
+            delta = shard.drain()
+            self.stats.merge(delta)
+            if self.checkpointer:
+                self.checkpointer.add(delta)
+        if self.checkpointer:
+            try:
+                self.checkpointer.maybe_checkpoint()
+            except OSError as e:
+                self.logger.error(f"Error writing stats checkpoint: {e}")
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.merge()
+
+    def stop(self):
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+        self.merge()
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import scraper
+from crawler import Crawler
+from crawler.worker import DOWNLOADED
+from utils.async_download import AsyncCacheClient
+from utils.log import events
+from utils.metrics import metrics
+
+# Longest the dispatcher sleeps without re-checking for a shutdown signal
+MAX_IDLE_WAIT = 1.0
+
+
+class AsyncCrawler(Crawler):
+    ''' Crawler that runs every fetch on one asyncio event loop instead of a
+    thread per worker. Up to config.max_in_flight downloads are in flight at
+    once, the frontier still enforces per-host politeness, and pages are
+    scraped on a pool of config.parser_threads threads so parsing does not
+    stall the loop. Frontier and Stats are the same as for the threaded
+    crawler, so a crawl can be resumed with either engine. The loop only
+    reaches the frontier through a thread of its own, so a completion syncing
+    the frontier to disk does not hold up the fetches. '''
+
+    def start_async(self):
+        self.aggregator.start()
+        self.thread = threading.Thread(target=asyncio.run, args=(self._crawl(),), name="EventLoop")
+        self.thread.start()
+
+    def join(self):
+        self.thread.join()
+        self.finish()
+
+    def _frontier(self, method, *args):
+        # Frontier calls take its lock and may sync it to disk: run them on
+        # the frontier thread, one at a time, instead of on the loop.
+        return self.loop.run_in_executor(self.frontier_thread, method, *args)
+
+    async def _crawl(self):
+        self.loop = asyncio.get_running_loop()
+        self.client = AsyncCacheClient(self.config, self.config.max_in_flight)
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.config.parser_threads, thread_name_prefix="Parser")
+        self.frontier_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Frontier")
+        self.slots = asyncio.Semaphore(self.config.max_in_flight)
+        self.wakeup = asyncio.Event()
+        # Stats shard of each parser thread
+        self.shards = threading.local()
+        tasks = set()
+
+        try:
+            while not self.shutdown_flag:
+                await self.slots.acquire()
+                url, delay = await self._frontier(self.frontier.poll_tbd_url)
+                if url is not None:
+                    task = asyncio.create_task(self._process(url))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    continue
+                self.slots.release()
+                if delay is None and await self._frontier(self.frontier.is_finished):
+                    self.logger.info("Frontier is empty. Stopping Crawler.")
+                    break
+                # Wait for the next host to be ready or a page to finish.
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), min(delay or MAX_IDLE_WAIT, MAX_IDLE_WAIT))
+                except asyncio.TimeoutError:
+                    pass
+            if self.shutdown_flag:
+                self.logger.info("Shutdown signal received. Waiting for in-flight pages.")
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self.client.close()
+            self.executor.shutdown(wait=True)
+            self.frontier_thread.shutdown(wait=True)
+
+    def _scrape(self, url, resp):
+        # Runs on the parser threads. Returns the page's fingerprint and
+        # whether it was merged, for the frontier.
+        shard = getattr(self.shards, "shard", None)
+        if shard is None:
+            shard = self.shards.shard = self.aggregator.shard()
+        if self.store is not None:
+            with metrics.timer("store", url):
+                self.store.add(url, resp)
+        with metrics.timer("scrape", url):
+            scraped_urls, fingerprint, merged = scraper.scrape(url, resp, shard, self.stopwords)
+        with metrics.timer("frontier_add"):
+            self.frontier.add_urls(scraped_urls, url)
+        return fingerprint, merged
+
+    async def _process(self, url):
+        fingerprint, merged = None, False
+        try:
+            with metrics.timer("download", url):
+                resp = await self.client.download(url)
+            metrics.count(f"status_{resp.status}", url)
+            events.log(
+                self.logger, "download", DOWNLOADED, key=resp.status, url=url, status=resp.status,
+                cache=self.config.cache_server, connect_ms=resp.connect_time * 1000)
+            fingerprint, merged = await self.loop.run_in_executor(self.executor, self._scrape, url, resp)
+        except Exception as e:
+            metrics.count("error", url)
+            self.logger.error(f"Error processing {url}: {e}")
+        finally:
+            try:
+                await self._frontier(self.frontier.mark_url_complete, url, fingerprint, merged)
+            finally:
+                self.slots.release()
+                self.wakeup.set()
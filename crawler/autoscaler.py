@@ -0,0 +1,241 @@
+import math
+import time
+from collections import deque
+from threading import Thread, Condition, Event
+
+from utils import get_logger
+from utils.download import NO_RESPONSE
+
+# Below this share of their time busy with a page, workers are parked;
+# above HIGH_UTILIZATION and with hosts left over, more are added. Parking
+# aims for TARGET_UTILIZATION.
+LOW_UTILIZATION = 0.5
+HIGH_UTILIZATION = 0.9
+TARGET_UTILIZATION = 0.8
+# Share of the parse capacity in use at which parsing is the bottleneck
+PARSE_BUSY = 0.9
+# Share of the workers kept when latency or errors go up
+BACKOFF = 0.75
+# Failed downloads in a window before its error rate counts
+MIN_ERRORS = 3
+# Control windows the baseline fetch latency is the lowest of
+BASELINE_WINDOWS = 30
+# A step up from n to m workers has to raise the pages processed per second
+# by at least this share of m / n - 1, or it is taken back and the pool does
+# not grow past n again for CEILING_WINDOWS windows.
+GROWTH_PAYOFF = 0.25
+CEILING_WINDOWS = 15
+
+
+def failed(status):
+    ''' Whether a download failed in a way that more load makes worse: no
+    response from the cache server, or a 5xx status. '''
+    return status is None or status == NO_RESPONSE or 500 <= status < 600
+
+
+class _Window(object):
+    # What the workers observed since the last decision
+    __slots__ = ('pages', 'errors', 'waited', 'busy', 'fetch', 'parse', 'start')
+
+    def __init__(self):
+        self.pages = self.errors = 0
+        self.waited = self.busy = self.fetch = self.parse = 0.0
+        self.start = time.monotonic()
+
+
+class Autoscaler(Thread):
+    ''' Grows and shrinks the workers of a crawler between config.min_threads
+    and config.max_threads. Workers report every page they process, and
+    every config.scale_interval seconds the controller sets how many of them
+    are active:
+
+        failed downloads above scale_error_rate   back off to 3/4
+        fetch latency above scale_latency times
+        the lowest of the last windows            back off to 3/4
+        the last step up did not raise the
+        pages processed per second                step back down, and stay
+                                                  there for a while
+        busy less than half of the time           park the idle ones
+        busy nearly all of the time, and more
+        hosts with work than active workers       add up to half again, unless
+                                                  parsing is using all of
+                                                  parse_capacity CPUs
+
+    A host is fetched by one worker at a time, so the pool does not grow
+    past the hosts with urls queued or in flight. Workers beyond the target
+    park before taking their next url, and are woken when
+    the target grows again or the crawl is over; new workers are only
+    started (by `spawn`) when there are no parked ones left. Decisions are
+    logged to Logs/Autoscaler.log with the observations they were based on,
+    and kept in `decisions`. '''
+
+    def __init__(self, frontier, config, spawn, parse_capacity=1):
+        self.logger = get_logger("AUTOSCALER", "Autoscaler")
+        self.frontier = frontier
+        self.spawn = spawn
+        self.parse_capacity = parse_capacity
+        self.min_threads = max(1, config.min_threads)
+        self.max_threads = max(self.min_threads, config.max_threads)
+        self.interval = config.scale_interval
+        self.latency_factor = config.scale_latency
+        self.max_error_rate = config.scale_error_rate
+        self.target = min(max(config.threads_count, self.min_threads), self.max_threads)
+        self.started = 0
+        self.lock = Condition()
+        self.window = _Window()
+        self.latencies = deque(maxlen=BASELINE_WINDOWS)
+        self.decisions = list()
+        self.last_kind = None
+        # (workers, pages/s) before the last step up, checked after it, and
+        # the count growth stops at for CEILING_WINDOWS windows after a step
+        # up that did not pay off
+        self.probe = None
+        self.ceiling = self.max_threads
+        self.ceiling_windows = 0
+        self.finished = False
+        self.stopped = Event()
+        super().__init__(daemon=True, name="Autoscaler")
+
+    @property
+    def enabled(self):
+        return self.min_threads < self.max_threads
+
+    def start_workers(self):
+        ''' Start the first workers, and the controller if the bounds leave
+        it anything to decide. '''
+        self._grow(self.target)
+        if self.enabled:
+            self.logger.info(
+                f"Starting with {self.target} workers, scaling between {self.min_threads} "
+                f"and {self.max_threads} every {self.interval:g}s.")
+            self.start()
+
+    def _grow(self, target):
+        # Start the workers up to target that were never started; parked
+        # ones are woken by notify_all.
+        while self.started < target:
+            self.spawn(self.started)
+            self.started += 1
+
+    def wait_active(self, worker_id):
+        ''' Park the worker while it is beyond the target. Returns False once
+        the crawl is over and the worker should stop. '''
+        with self.lock:
+            while worker_id >= self.target and not self.finished:
+                self.lock.wait()
+            return not self.finished
+
+    def observe(self, waited, busy, fetch, parse=0.0, status=200):
+        ''' A page processed by a worker: seconds it waited for the url, was
+        busy with it, of that downloading it, and CPU seconds parsing it.
+        status is that of the download, None if downloading raised. '''
+        with self.lock:
+            window = self.window
+            window.pages += 1
+            window.errors += failed(status)
+            window.waited += waited
+            window.busy += busy
+            window.fetch += fetch
+            window.parse += parse
+
+    def parsed(self, cpu):
+        ''' CPU seconds parsing a page somewhere else than in the worker. '''
+        with self.lock:
+            self.window.parse += cpu
+
+    def finish(self):
+        ''' The crawl is over: wake the parked workers so they stop, and stop
+        deciding. '''
+        with self.lock:
+            self.finished = True
+            self.lock.notify_all()
+        self.stopped.set()
+
+    def stop(self):
+        self.finish()
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.adjust()
+            except Exception as e:
+                self.logger.error(f"Error adjusting the workers: {e}")
+
+    def adjust(self):
+        with self.lock:
+            window, self.window = self.window, _Window()
+        elapsed = max(self.window.start - window.start, 1e-9)
+        hosts, ready, queued = self.frontier.backlog()
+        active = self.target
+        probe, self.probe = self.probe, None
+        if self.ceiling_windows:
+            self.ceiling_windows -= 1
+        if not window.pages:
+            self._decide(active, active, "idle", "no pages processed", window, hosts, ready, queued)
+            return
+        throughput = window.pages / elapsed
+        latency = window.fetch / window.pages
+        baseline = min(self.latencies, default=latency)
+        self.latencies.append(latency)
+        error_rate = window.errors / window.pages
+        utilization = window.busy / max(window.busy + window.waited, 1e-9)
+        parse_share = window.parse / (elapsed * self.parse_capacity)
+        backoff = max(self.min_threads, min(active - 1, int(active * BACKOFF)))
+
+        if error_rate > self.max_error_rate and window.errors >= MIN_ERRORS:
+            target, kind, reason = backoff, "errors", f"error rate {error_rate:.0%} over {self.max_error_rate:.0%}"
+        elif latency > baseline * self.latency_factor:
+            target, kind, reason = backoff, "latency", (
+                f"fetch latency {latency * 1000:.0f}ms over {self.latency_factor:g} x {baseline * 1000:.0f}ms")
+        elif probe is not None and throughput < probe[1] * (1 + GROWTH_PAYOFF * (active / probe[0] - 1)):
+            # The last step up did not pay off: go back, and stay there for a while
+            target, kind = probe[0], "no gain"
+            reason = (f"{active} workers processed {throughput:.1f} pages/s, "
+                      f"{probe[0]} workers {probe[1]:.1f}")
+            self.ceiling, self.ceiling_windows = target, CEILING_WINDOWS
+        elif utilization < LOW_UTILIZATION:
+            target = math.ceil(active * utilization / TARGET_UTILIZATION)
+            kind, reason = "waiting", f"workers busy {utilization:.0%} of the time"
+        elif utilization > HIGH_UTILIZATION and hosts > active:
+            if parse_share > PARSE_BUSY:
+                target, kind = active, "parsing"
+                reason = f"parsing uses {parse_share:.0%} of {self.parse_capacity} CPUs"
+            elif self.ceiling_windows and active >= self.ceiling:
+                target, kind = active, "ceiling"
+                reason = f"more than {self.ceiling} workers did not process more pages"
+            else:
+                target = min(hosts, active + max(1, active // 2))
+                kind, reason = "busy", f"workers busy {utilization:.0%} of the time, {hosts} hosts with work"
+        else:
+            target, kind, reason = active, "steady", "steady"
+        target = min(max(target, self.min_threads), self.max_threads)
+        if target > active:
+            self.probe = (active, throughput)
+        self._decide(active, target, kind, reason, window, hosts, ready, queued,
+                     throughput=throughput, latency=latency, baseline=baseline, error_rate=error_rate,
+                     utilization=utilization, parse_share=parse_share)
+
+    def _decide(self, active, target, kind, reason, window, hosts, ready, queued, **observed):
+        with self.lock:
+            if self.finished:
+                return
+            self.target = target
+            self._grow(target)
+            self.lock.notify_all()
+        decision = {"time": time.time(), "from": active, "to": target, "kind": kind, "reason": reason,
+                    "pages": window.pages, "hosts": hosts, "ready": ready, "queued": queued}
+        decision.update({key: round(value, 4) for key, value in observed.items()})
+        self.decisions.append(decision)
+        # Holds are only logged when their kind of reason changes
+        if target == active and kind == self.last_kind:
+            return
+        self.last_kind = kind
+        if target == active:
+            action = f"Holding at {active}"
+        else:
+            action = f"{'Grew' if target > active else 'Shrank'} from {active} to {target}"
+        self.logger.info(
+            f"{action} workers: {reason}. {window.pages} pages, {hosts} hosts with work "
+            f"({ready} ready), {queued} urls queued.", extra={"event": "scale", **decision})
@@ -0,0 +1,84 @@
+import os
+import json
+import time
+
+from crawler.aggregator import StatsShard
+from crawler.stats import Stats, dump_atomic
+from utils import get_logger
+
+STATS_LOG = "logs/Stats.log"
+
+
+class Checkpointer(object):
+    ''' Saves the stats while the crawl runs, off the worker threads.
+
+    The aggregator hands it every delta it merges into the Stats. Every
+    `interval` seconds, or once `pages` new pages were seen, the deltas
+    collected since the last checkpoint are written to the next
+    Stats.DELTA_FILE, so a checkpoint costs what changed rather than the
+    whole crawl. Once the deltas add up to more than `compact_ratio` times
+    the size of Stats.SAVE_FILE, the full stats are saved instead and the
+    deltas removed. Stats.load replays SAVE_FILE plus the deltas. '''
+
+    def __init__(self, stats, interval, pages, compact_ratio=1.0):
+        self.stats = stats
+        self.interval = interval
+        self.pages = pages
+        self.compact_ratio = compact_ratio
+        self.logger = get_logger("CHECKPOINT")
+        self.pending = StatsShard(stats)
+        self.last_time = time.monotonic()
+        self.last_pages = len(stats.pages)
+        self.base_bytes = os.path.getsize(Stats.SAVE_FILE) if os.path.exists(Stats.SAVE_FILE) else 0
+        self.delta_bytes = sum(os.path.getsize(path) for _, path in Stats.delta_files())
+
+    def add(self, shard):
+        self.pending.merge(shard)
+
+    def maybe_checkpoint(self):
+        if (time.monotonic() - self.last_time >= self.interval
+                or len(self.stats.pages) - self.last_pages >= self.pages):
+            self.checkpoint()
+
+    def checkpoint(self):
+        start = time.perf_counter()
+        stats = self.stats
+        delta = self.pending.drain().counts()
+        with stats.fingerprints.lock:
+            delta['fingerprints'] = stats.fingerprints.fingerprints[stats.checkpoint_fingerprints:].tobytes()
+            delta['removed_fingerprints'] = stats.fingerprints.removed[stats.checkpoint_removed:].tobytes()
+        delta['seq'] = stats.checkpoint_seq + 1
+        if not isinstance(stats.pages, set):
+            # The pages the delta refers to must be on disk first
+            stats.pages.flush()
+
+        size = dump_atomic(delta, Stats.DELTA_FILE.format(delta['seq']))
+        stats.checkpoint_seq = delta['seq']
+        stats.checkpoint_fingerprints += len(delta['fingerprints']) // 8
+        stats.checkpoint_removed += len(delta['removed_fingerprints']) // 8
+        self.delta_bytes += size
+        kind = f"delta {delta['seq']}"
+        if self.delta_bytes > self.compact_ratio * self.base_bytes:
+            size = self.base_bytes = stats.save()
+            self.delta_bytes = 0
+            kind = "full"
+
+        self.last_time = time.monotonic()
+        self.last_pages = len(stats.pages)
+        self.save_log()
+        self.logger.info(
+            f"Stats checkpoint ({kind}): {size} bytes, {len(delta['tokens'])} tokens changed, "
+            f"{(time.perf_counter() - start) * 1000:.1f}ms.")
+
+    def save_log(self):
+        # Progress summary for watching a running crawl
+        with self.stats.lock:
+            log_entry = {
+                'pages_scraped': len(self.stats.pages),
+                'longest_page_words': self.stats.longest_length
+            }
+        os.makedirs(os.path.dirname(STATS_LOG), exist_ok=True)
+        temp = STATS_LOG + ".tmp"
+        with open(temp, 'w') as f:
+            json.dump(log_entry, f, indent=2)
+        os.replace(temp, STATS_LOG)
@@ -1,20 +1,64 @@
 import os
+import pickle
 import shelve
+import time
+import heapq
 
-from threading import Thread, RLock
+from threading import Thread, RLock, Condition
 from queue import Queue, Empty
+from collections import defaultdict
 
-from utils import get_logger, get_urlhash, normalize
-from scraper import is_valid
+from utils import get_logger, get_urlhash, get_host, normalize
+from scraper import is_valid, url_filter
+from utils.bloom import BloomFilter
+from crawler.frontier_log import FrontierLog
+from crawler.pending_index import PendingIndex
+from crawler.page_records import PageRecords
+from crawler.trap_detector import TrapDetector
+from crawler.priority import (
+    IndexedHeap, LifoQueue, HostYield, url_score, INLINK_BONUS, MAX_INLINK_BONUS)
+from crawler.stats import dump_atomic
+from utils.metrics import metrics
+
+# Seconds between checks whether the crawl is over, while nothing is queued
+# or in flight here but urls may still come in from elsewhere
+DRAIN_WAIT = 0.1
 
 class Frontier(object):
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = list()
 
-        # Check for shelve file with .db extension (most common)
-        save_file_exists = os.path.exists(self.config.save_file + '.db') or os.path.exists(self.config.save_file)
+        # Per-host politeness scheduling. Every host has its own queue of
+        # urls, and hosts that have urls waiting (and no fetch in flight) sit
+        # in a heap ordered by the time they are next allowed to be fetched.
+        # Once that time has passed they move to the runnable heap.
+        # With ORDER = best, host queues are indexed heaps of urls by score
+        # and runnable hosts are taken by their yield and best url; with
+        # ORDER = lifo, the url added last is fetched first.
+        self.lock = RLock()
+        self.has_work = Condition(self.lock)
+        self.best_first = self.config.order == 'best'
+        self.host_queues = defaultdict(IndexedHeap if self.best_first else LifoQueue)
+        self.ready_heap = []
+        self.runnable = IndexedHeap()
+        self.scheduled_hosts = set()
+        self.busy_hosts = set()
+        self.next_allowed = dict()
+        self.in_flight = 0
+        self.stopped = False
+        # Depth of the urls being fetched, and what fetches from each host
+        # yield
+        self.fetching = dict()
+        self.host_yields = defaultdict(HostYield)
+        self.priority_file = self.config.save_file + '.priority'
+
+        # Check for shelve file with .db extension (most common) or the .dir
+        # and .dat pair written by dbm.dumb, or a frontier log
+        shelve_exists = any(
+            os.path.exists(self.config.save_file + ext) for ext in ['.db', '.dir', ''])
+        log_exists = os.path.exists(self.config.save_file + '.wal')
+        save_file_exists = shelve_exists or log_exists
 
         if not save_file_exists and not restart:
             # Save file does not exist, but request to load save.
@@ -26,38 +70,142 @@ class Frontier(object):
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
             # Remove all shelve-related files
-            for ext in ['.db', '.dat', '.dir', '.bak', '']:
+            for ext in ['.db', '.dat', '.dir', '.bak', '.wal', '.wal.migrating', '.seen',
+                        '.pending', '.pending.meta', '.traps', '.priority', '.pages', '']:
                 try:
                     if os.path.exists(self.config.save_file + ext):
                         os.remove(self.config.save_file + ext)
                 except:
                     pass
-        # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
+        # The urls still to be downloaded, so a resume does not have to go
+        # through every url in the save file.
+        self.pending = PendingIndex(
+            self.config.save_file + '.pending',
+            commit_interval=self.config.commit_interval,
+            commit_records=self.config.commit_records)
+        seen_file = self.config.save_file + '.seen'
+        # Digests, validators and tokens of the fetched pages, so a page
+        # fetched again is only parsed and merged if it changed. Records of
+        # a crawl started without them do not cover the pages before.
+        self.records = None
+        if self.config.page_records:
+            self.records = PageRecords(
+                self.config.save_file + '.pages', restart or not save_file_exists,
+                commit_interval=self.config.commit_interval)
+        # Learns which url templates keep yielding nothing new and keeps
+        # their urls out of the frontier
+        self.traps = None
+        if self.config.trap_detection:
+            self.traps = TrapDetector(
+                self.config.save_file + '.traps', self.config.trap_window,
+                self.config.trap_throttle_yield, self.config.trap_block_yield,
+                self.config.trap_throttle)
+        resume_pending = self.pending.clean and not restart and (
+            self.config.storage != 'shelve' or os.path.exists(seen_file))
+
+        # Depths and scores of the urls queued when the frontier was last
+        # closed, used while they are queued again
+        self.saved_priorities = dict() if restart else self._load_priorities()
+
+        start = time.perf_counter()
+        if resume_pending:
+            # Queue the pending urls before anything else competes for the GIL
+            total_count = self._resume_pending()
+
+        # Load existing save file, or create one if it does not exist. When
+        # resuming from the pending index, the log is replayed in the
+        # background while the first urls are downloaded.
+        self.save = self._open_save_file(
+            shelve_exists and not log_exists and not restart, background=resume_pending)
+        # The log keeps its index in memory, but shelve lookups go to disk:
+        # put a bloom filter of url hashes in front of them, so new urls
+        # (the common case in add_url) never touch the shelve.
+        self.seen = None
+        if not isinstance(self.save, FrontierLog):
+            if resume_pending:
+                self.seen = BloomFilter.open(seen_file)
+            else:
+                self.seen = BloomFilter(self.config.seen_capacity, self.config.seen_error_rate, seen_file)
         if restart:
             for url in self.config.seed_urls:
                 self.add_url(url)
         else:
             # Set the frontier state with contents of save file.
-            self._parse_save_file()
-            if len(self.save) == 0:
+            if not resume_pending:
+                total_count = self._parse_save_file()
+            self.logger.info(
+                f"Frontier ready after {time.perf_counter() - start:.2f}s "
+                f"({'pending index' if resume_pending else 'full scan of the save file'}).")
+            if total_count == 0:
                 for url in self.config.seed_urls:
                     self.add_url(url)
+            elif self.config.recrawl:
+                self._schedule_recrawl()
+        self.saved_priorities = dict()
+
+    def _load_priorities(self):
+        if not self.best_first or not os.path.exists(self.priority_file):
+            return dict()
+        try:
+            with open(self.priority_file, 'rb') as f:
+                saved = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            self.logger.warning(f"Could not read {self.priority_file}, scoring urls afresh: {e}")
+            return dict()
+        for host, (novel, links) in saved['hosts'].items():
+            self.host_yields[host] = HostYield(novel, links)
+        return saved['urls']
+
+    def _save_priorities(self):
+        if not self.best_first:
+            if os.path.exists(self.priority_file):
+                os.remove(self.priority_file)
+            return
+        urls = {url: (depth, base, -entry[0])
+                for queue in self.host_queues.values()
+                for entry in queue.heap
+                for url, (depth, base) in [(entry[2], entry[3])]}
+        hosts = {host: (hy.novel, hy.links) for host, hy in self.host_yields.items()}
+        dump_atomic({'urls': urls, 'hosts': hosts}, self.priority_file)
+
+    def _open_save_file(self, migrate, background=False):
+        ''' This function can be overridden for alternate saving techniques. '''
+        if self.config.storage == 'shelve':
+            return shelve.open(self.config.save_file)
+
+        log_file = self.config.save_file + '.wal'
+        options = dict(
+            commit_interval=self.config.commit_interval,
+            commit_records=self.config.commit_records)
+        if migrate:
+            # Carry an existing shelve over to the log the first time round.
+            self.logger.info(
+                f"Migrating save file {self.config.save_file} to {log_file}.")
+            return FrontierLog.migrate_shelve(self.config.save_file, log_file, **options)
+        return FrontierLog(log_file, background=background, **options)
 
     def _parse_save_file(self):
         ''' This function can be overridden for alternate saving techniques. '''
         total_count = 0
         tbd_count = 0
         corrupted_count = 0
+        # The pending index is rebuilt along the way
+        self.pending.clear()
+        self.pending.rules = url_filter.version
 
         # Iterate over keys to handle corrupted entries gracefully
         for key in list(self.save.keys()):
             try:
                 url, completed = self.save[key]
                 total_count += 1
-                if not completed and is_valid(url):
-                    self.to_be_downloaded.append(url)
-                    tbd_count += 1
+                if self.seen is not None:
+                    self.seen.add(key)
+                if not completed:
+                    valid = is_valid(url)
+                    self.pending[key] = (url, valid)
+                    if valid:
+                        self._enqueue(url)
+                        tbd_count += 1
             except (KeyError, ValueError, EOFError) as e:
                 # Skip corrupted entries
                 corrupted_count += 1
@@ -69,33 +217,310 @@ class Frontier(object):
 
         self.logger.info(
             f"Found {tbd_count} urls to be downloaded from {total_count} "
-            f"total urls discovered.")
+            f"total urls discovered, across {len(self.host_queues)} hosts.")
+        return total_count
+
+    def _schedule_recrawl(self):
+        ''' Queue the completed urls again whose page was fetched more than
+        config.recrawl_after seconds ago. Completed urls without a page
+        record were not pages with content, unless the records were started
+        after the crawl: then they are not known to be and are left out. '''
+        records = self.records
+        if records is None:
+            self.logger.warning("Recrawl needs PAGERECORDS, not fetching completed urls again.")
+            return
+        cutoff = time.time() - self.config.recrawl_after
+        queued = 0
+        fresh = 0
+        unknown = 0
+        for key, (url, completed) in list(self.save.items()):
+            if not completed:
+                continue
+            record = records.get(key)
+            if record is None:
+                if not records.complete:
+                    unknown += 1
+                continue
+            if record.fetched > cutoff:
+                fresh += 1
+                continue
+            if not is_valid(url):
+                continue
+            self.save[key] = (url, False)
+            self.pending[key] = (url, True)
+            self._enqueue(url)
+            queued += 1
+        self.save.sync()
+        self.pending.sync()
+        self.logger.info(
+            f"Recrawl: queued {queued} completed urls fetched more than "
+            f"{self.config.recrawl_after:.0f}s ago, {fresh} fetched since.")
+        if unknown:
+            self.logger.warning(
+                f"Recrawl: {unknown} completed urls have no page record, because the records were "
+                f"started after them, and are not fetched again.")
+
+    def _resume_pending(self):
+        ''' Queue the pending urls from the pending index, without reading
+        the save file. The cached verdicts are reused unless the url filter
+        rules changed since they were saved. '''
+        revalidate = self.pending.rules != url_filter.version
+        if revalidate:
+            self.logger.info("Url filter rules changed, re-validating pending urls.")
+        tbd_count = 0
+        for key, (url, valid) in list(self.pending.items()):
+            if revalidate:
+                verdict = is_valid(url)
+                if verdict != valid:
+                    self.pending[key] = (url, verdict)
+                valid = verdict
+            if valid:
+                self._enqueue(url)
+                tbd_count += 1
+        self.pending.rules = url_filter.version
+
+        self.logger.info(
+            f"Found {tbd_count} urls to be downloaded from {len(self.pending)} "
+            f"pending urls in the index, {self.pending.total_urls} total urls "
+            f"discovered, across {len(self.host_queues)} hosts.")
+        return self.pending.total_urls
+
+    @staticmethod
+    def _get_host(url):
+        return get_host(url)
+
+    def _schedule(self, host):
+        # Put a host with waiting urls on the heap, unless it is already
+        # there or one of its urls is being fetched right now.
+        if host in self.scheduled_hosts or host in self.busy_hosts:
+            return
+        ready_at = self.next_allowed.get(host, 0.0)
+        heapq.heappush(self.ready_heap, (ready_at, host))
+        self.scheduled_hosts.add(host)
+        self.has_work.notify()
+
+    def _enqueue(self, url, depth=None, novelty=0.0):
+        # Queue a url found `depth` links from the seeds. Without a depth, a
+        # url that was queued when the frontier was closed gets its score
+        # back, and any other its number of path segments as depth.
+        score = None
+        if depth is None:
+            saved = self.saved_priorities.get(url)
+            if saved is not None:
+                depth, base, score = saved
+            else:
+                depth = max(0, url.count('/') - 2)
+        if score is None:
+            base = score = url_score(url, depth, novelty)
+        host = self._get_host(url)
+        with self.lock:
+            self.host_queues[host].push(url, score, (depth, base))
+            self._schedule(host)
+            if host in self.runnable:
+                self.runnable.update(host, self._host_priority(host))
+
+    def _reprioritize(self, url):
+        # Another page links to a queued url: move it up, within
+        # MAX_INLINK_BONUS of its own score. Must be called with the lock held.
+        host = self._get_host(url)
+        queue = self.host_queues.get(host)
+        if queue is None or url not in queue:
+            return
+        depth, base = queue.heap[queue.position[url]][3]
+        priority = min(queue.priority(url) + INLINK_BONUS, base + MAX_INLINK_BONUS)
+        queue.update(url, priority)
+        if host in self.runnable:
+            self.runnable.update(host, self._host_priority(host))
+
+    def _host_priority(self, host):
+        if not self.best_first:
+            # Runnable hosts are taken in the order they became ready
+            return 0.0
+        return self.host_yields[host].score() + self.host_queues[host].peek_priority()
+
+    def _poll(self):
+        # Pop the next url if its host is ready. Returns (url, None), or
+        # (None, seconds until the next host is ready), or (None, None) if
+        # no host has urls waiting. Must be called with the lock held.
+        now = time.monotonic()
+        while self.ready_heap and self.ready_heap[0][0] <= now:
+            _, host = heapq.heappop(self.ready_heap)
+            self.runnable.push(host, self._host_priority(host))
+        while self.runnable:
+            host, _ = self.runnable.pop()
+            self.scheduled_hosts.discard(host)
+            url = self._pop_url(host)
+            if url is None:
+                # All its urls were in blocked trap templates
+                continue
+            self.busy_hosts.add(host)
+            self.in_flight += 1
+            return url, None
+        if self.ready_heap:
+            return None, self.ready_heap[0][0] - now
+        return None, None
+
+    def _pop_url(self, host):
+        # Next url of the host, skipping the urls of trap templates that were
+        # blocked after they were queued. Those stay pending in the save file
+        # and the pending index: a resume queues them again, and skips them
+        # again unless the trap state was cleared. Must be called with the
+        # lock held.
+        queue = self.host_queues[host]
+        url = None
+        while queue:
+            url, (depth, _) = queue.pop()
+            if self.traps is None or not self.traps.blocked(url):
+                self.fetching[url] = depth
+                break
+            url = None
+        if not queue:
+            del self.host_queues[host]
+        return url
+
+    def poll_tbd_url(self):
+        ''' Non-blocking get_tbd_url, for callers with their own scheduling.
+        Returns (url, None) when a url is ready, (None, seconds) until the
+        next host is ready, and (None, None) when nothing is queued; the
+        crawl is over once that happens with is_finished() true. '''
+        with self.lock:
+            if self.stopped:
+                return None, None
+            return self._poll()
+
+    def is_finished(self):
+        with self.lock:
+            return self.stopped or (
+                not self.ready_heap and not self.runnable and not self.in_flight and self._drained())
+
+    def backlog(self):
+        ''' (hosts with urls queued or being fetched, hosts that may be
+        fetched right now, urls queued), for sizing the worker pool. '''
+        with self.lock:
+            now = time.monotonic()
+            ready = len(self.runnable) + sum(1 for ready_at, _ in self.ready_heap if ready_at <= now)
+            queued = sum(len(queue) for queue in self.host_queues.values())
+            return len(self.scheduled_hosts) + len(self.busy_hosts), ready, queued
+
+    def _drained(self):
+        ''' Called with the lock held when nothing is queued or in flight:
+        whether the crawl is over. It is, unless urls can be added from
+        outside the workers (see crawler/sharded.py). '''
+        return True
 
     def get_tbd_url(self):
-        try:
-            return self.to_be_downloaded.pop()
-        except IndexError:
+        ''' Block until some host is allowed to be fetched again and return
+        the next url for it. Returns None once every queue is empty and no
+        worker is still processing a url (or the frontier was stopped). '''
+        with self.lock:
+            while not self.stopped:
+                url, delay = self._poll()
+                if url is not None:
+                    return url
+                if delay is not None:
+                    # Sleep until that host is ready, or until new work shows up.
+                    self.has_work.wait(delay)
+                elif self.in_flight:
+                    # Nothing queued, but a worker may still add urls.
+                    self.has_work.wait()
+                elif not self._drained():
+                    self.has_work.wait(DRAIN_WAIT)
+                else:
+                    break
+            # Wake up the other workers so they can stop too.
+            self.has_work.notify_all()
             return None
 
     def add_url(self, url):
-        url = normalize(url)
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False)
-            self.save.sync()
-            self.to_be_downloaded.append(url)
-    
-    def mark_url_complete(self, url):
+        self.add_urls([url])
+
+    def add_urls(self, urls, parent=None, depth=None):
+        ''' Add the links found on parent, a url being fetched (or seeds,
+        without a parent). New urls are scored by their depth and the share
+        of the links that were new; known urls still queued move up. depth
+        is given for links whose parent was fetched elsewhere. '''
+        urls = [normalize(url) for url in urls]
+        with self.lock:
+            if depth is None:
+                depth = self.fetching.get(parent, -1) + 1 if parent is not None else 0
+            new = []
+            for url in urls:
+                urlhash = get_urlhash(url)
+                if self.seen is not None and self.seen.add(urlhash):
+                    # Definitely not in the save file yet.
+                    known = False
+                else:
+                    known = urlhash in self.save
+                if known:
+                    if self.best_first:
+                        self._reprioritize(url)
+                    continue
+                if self.traps is not None and not self.traps.admit(url):
+                    continue
+                self.save[urlhash] = (url, False)
+                # Urls reach add_url after passing is_valid in the scraper
+                self.pending[urlhash] = (url, True)
+                new.append(url)
+            if parent is not None:
+                self.host_yields[self._get_host(parent)].add_links(len(new))
+            if not new:
+                return
+            with metrics.timer("frontier_sync"):
+                self.save.sync()
+            self.pending.sync()
+            novelty = len(new) / len(urls)
+            for url in new:
+                self._enqueue(url, depth, novelty)
+
+    def mark_url_complete(self, url, fingerprint=None, merged=False):
+        ''' merged is whether the page added new content to the stats, and
+        fingerprint its SimHash (None if it was too short to have one), for
+        the host yields and the trap detector. '''
         urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            # This should not happen.
-            self.logger.error(
-                f"Completed url {url}, but have not seen it before.")
+        with self.lock:
+            if urlhash not in self.save:
+                # This should not happen.
+                self.logger.error(
+                    f"Completed url {url}, but have not seen it before.")
 
-        self.save[urlhash] = (url, True)
-        self.save.sync()
+            self.save[urlhash] = (url, True)
+            with metrics.timer("frontier_sync"):
+                self.save.sync()
+            if urlhash in self.pending:
+                del self.pending[urlhash]
+                self.pending.sync()
+
+            # Release the host: it may be fetched again after the politeness delay.
+            host = self._get_host(url)
+            self.fetching.pop(url, None)
+            self.host_yields[host].add_fetch(merged)
+            if host in self.busy_hosts:
+                self.busy_hosts.discard(host)
+                self.in_flight -= 1
+                self.next_allowed[host] = time.monotonic() + self.config.time_delay
+                if self.host_queues.get(host):
+                    self._schedule(host)
+            # Workers waiting for the last in-flight url need to re-check.
+            self.has_work.notify_all()
+        if self.traps is not None:
+            self.traps.record(url, fingerprint, merged)
+
+    def stop(self):
+        """Wake up all workers blocked in get_tbd_url and make them exit."""
+        with self.lock:
+            self.stopped = True
+            self.has_work.notify_all()
 
     def close(self):
-        """Close the shelve database to ensure all data is saved."""
+        """Close the save file to ensure all data is saved."""
+        total_urls = len(self.save)
         self.save.close()
-        self.logger.info("Frontier shelve database closed successfully.")
+        if self.seen is not None:
+            self.seen.close()
+        # Only now do the index and the save file match
+        self.pending.close(total_urls)
+        with self.lock:
+            self._save_priorities()
+        if self.records is not None:
+            self.records.close()
+        self.logger.info("Frontier save file closed successfully.")
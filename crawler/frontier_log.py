@@ -0,0 +1,228 @@
+import os
+import time
+import struct
+import shelve
+import zlib
+
+from threading import Thread, RLock, Event
+
+from utils import get_logger
+
+# Every record is a (payload length, crc32) header followed by the payload:
+# 32 raw bytes of urlhash, one state byte and the utf-8 url.
+HEADER = struct.Struct("<II")
+HASH_SIZE = 32
+# State byte of a record that deletes its urlhash
+DELETED = 2
+
+
+class FrontierLog(object):
+    ''' Append-only write-ahead log of (urlhash, url, completed) records.
+
+    It has the subset of the shelve interface the Frontier uses, so it can
+    be swapped in for the shelve. Writes are buffered and group-committed:
+    the buffer is written and fsync'ed once it holds `commit_records`
+    records or is older than `commit_interval` seconds, so a crash loses at
+    most one commit window. The log is rewritten from the live entries once
+    it holds `compact_ratio` times more records than there are urls.
+
+    With background=True the log is replayed on a thread, and the
+    constructor returns right away; every access waits for the replay. '''
+
+    def __init__(self, path, commit_interval=1.0, commit_records=1000,
+                 compact_ratio=4.0, compact_min_records=10000, background=False):
+        self.logger = get_logger("FRONTIER_LOG", "FRONTIER")
+        self.path = path
+        self.commit_interval = commit_interval
+        self.commit_records = commit_records
+        self.compact_ratio = compact_ratio
+        self.compact_min_records = compact_min_records
+
+        self.lock = RLock()
+        self.entries = dict()
+        self.buffer = list()
+        self.log_records = 0
+        self.last_commit = time.monotonic()
+        self.closed = Event()
+        self.loaded = Event()
+        if background:
+            Thread(target=self._load, daemon=True).start()
+        else:
+            self._load()
+
+    def _load(self):
+        start = time.perf_counter()
+        try:
+            self._replay()
+            self.file = open(self.path, "ab")
+        finally:
+            self.loaded.set()
+        self.load_time = time.perf_counter() - start
+
+        # Commit on the time trigger even if no more writes come in.
+        self.committer = Thread(target=self._commit_loop, daemon=True)
+        self.committer.start()
+
+    @staticmethod
+    def _encode(urlhash, url, completed):
+        payload = bytes.fromhex(urlhash) + (b"\x01" if completed else b"\x00") + url.encode("utf-8")
+        return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+    @staticmethod
+    def _encode_delete(urlhash):
+        payload = bytes.fromhex(urlhash) + bytes([DELETED])
+        return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            data = f.read()
+
+        offset = 0
+        while offset + HEADER.size <= len(data):
+            length, crc = HEADER.unpack_from(data, offset)
+            start = offset + HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or length <= HASH_SIZE or zlib.crc32(payload) != crc:
+                break
+            urlhash = payload[:HASH_SIZE].hex()
+            state = payload[HASH_SIZE]
+            if state == DELETED:
+                self.entries.pop(urlhash, None)
+            else:
+                self.entries[urlhash] = (payload[HASH_SIZE + 1:].decode("utf-8"), state == 1)
+            self.log_records += 1
+            offset = start + length
+
+        if offset < len(data):
+            # A torn write from a crash: drop everything after the last good record.
+            self.logger.warning(
+                f"Truncating {len(data) - offset} bytes of incomplete records "
+                f"at the end of {self.path}.")
+            with open(self.path, "r+b") as f:
+                f.truncate(offset)
+
+        self.logger.info(
+            f"Replayed {self.log_records} records for {len(self.entries)} urls "
+            f"from {self.path}.")
+
+    def __contains__(self, urlhash):
+        self.loaded.wait()
+        return urlhash in self.entries
+
+    def __getitem__(self, urlhash):
+        self.loaded.wait()
+        return self.entries[urlhash]
+
+    def __setitem__(self, urlhash, value):
+        url, completed = value
+        self.loaded.wait()
+        with self.lock:
+            self.entries[urlhash] = (url, completed)
+            self.buffer.append(self._encode(urlhash, url, completed))
+
+    def __delitem__(self, urlhash):
+        self.loaded.wait()
+        with self.lock:
+            del self.entries[urlhash]
+            self.buffer.append(self._encode_delete(urlhash))
+
+    def __len__(self):
+        self.loaded.wait()
+        return len(self.entries)
+
+    def __iter__(self):
+        self.loaded.wait()
+        return iter(self.entries)
+
+    def keys(self):
+        self.loaded.wait()
+        return self.entries.keys()
+
+    def items(self):
+        self.loaded.wait()
+        return self.entries.items()
+
+    def sync(self):
+        ''' Commit if one of the group commit triggers has fired. Cheap to
+        call after every write, unlike shelve.sync(). '''
+        self.loaded.wait()
+        with self.lock:
+            if (len(self.buffer) >= self.commit_records
+                    or (self.buffer and time.monotonic() - self.last_commit >= self.commit_interval)):
+                self.commit()
+
+    def commit(self):
+        ''' Write out and fsync all buffered records. '''
+        self.loaded.wait()
+        with self.lock:
+            self.last_commit = time.monotonic()
+            if not self.buffer:
+                return
+            self.file.write(b"".join(self.buffer))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.log_records += len(self.buffer)
+            self.buffer = list()
+
+            if (self.log_records >= self.compact_min_records
+                    and self.log_records > self.compact_ratio * len(self.entries)):
+                self.compact()
+
+    def compact(self):
+        ''' Rewrite the log with one record per url, atomically. '''
+        with self.lock:
+            start = time.perf_counter()
+            before = self.log_records
+            tmp_path = self.path + ".compact"
+            with open(tmp_path, "wb") as f:
+                f.write(b"".join(
+                    self._encode(urlhash, url, completed)
+                    for urlhash, (url, completed) in self.entries.items()))
+                f.flush()
+                os.fsync(f.fileno())
+            self.file.close()
+            os.replace(tmp_path, self.path)
+            self.file = open(self.path, "ab")
+            self.log_records = len(self.entries)
+            self.logger.info(
+                f"Compacted {self.path} from {before} to {self.log_records} "
+                f"records in {time.perf_counter() - start:.2f}s.")
+
+    def _commit_loop(self):
+        while not self.closed.wait(self.commit_interval):
+            try:
+                self.sync()
+            except Exception as e:
+                self.logger.error(f"Background commit of {self.path} failed: {e}")
+
+    def close(self):
+        self.closed.set()
+        self.loaded.wait()
+        with self.lock:
+            self.commit()
+            self.file.close()
+
+    @classmethod
+    def migrate_shelve(cls, shelve_path, log_path, **kwargs):
+        ''' Build a new log from an existing frontier shelve and return it.
+        The log is built next to log_path and only moved there once it is
+        complete, so a migration cut short is started over rather than taken
+        for the frontier. '''
+        temp = log_path + ".migrating"
+        if os.path.exists(temp):
+            os.remove(temp)
+        log = cls(temp, **kwargs)
+        migrated = 0
+        with shelve.open(shelve_path, "r") as save:
+            for key in save.keys():
+                try:
+                    log[key] = save[key]
+                    migrated += 1
+                except (KeyError, ValueError, EOFError) as e:
+                    log.logger.warning(f"Skipping corrupted entry with key {key}: {e}")
+        log.close()
+        os.replace(temp, log_path)
+        log.logger.info(f"Migrated {migrated} urls from {shelve_path} to {log_path}.")
+        return cls(log_path, **kwargs)
@@ -0,0 +1,262 @@
+import os
+import time
+import zlib
+import pickle
+import struct
+from hashlib import blake2b
+from threading import RLock
+from collections import namedtuple
+
+from utils import get_logger, get_urlhash
+
+# The file starts with MAGIC and a byte telling whether the records were
+# kept from the start of the crawl. Every record is a (payload length,
+# crc32) header followed by the payload: 32 raw bytes of urlhash, META, the
+# etag and last-modified (utf-8), and the zlib-compressed pickle of the
+# tokens merged for the page.
+MAGIC = b"PGREC1"
+FILE_HEADER = struct.Struct("<6sBx")
+HEADER = struct.Struct("<II")
+HASH_SIZE = 32
+# digest, fetch time, fingerprint, cpu seconds, flags, etag and
+# last-modified lengths
+META = struct.Struct("<16sdQdBHH")
+MERGED = 1
+HAS_FINGERPRINT = 2
+# Only the fetch time changed: the rest is in the record before
+TOUCH = 4
+
+# What is known about a fetched page. offset and length locate its tokens
+# in the file.
+PageRecord = namedtuple('PageRecord', [
+    'digest', 'fetched', 'etag', 'last_modified', 'fingerprint', 'merged', 'cpu', 'offset', 'length'])
+
+
+class PageVisit(object):
+    ''' A fetch of a page, checked against its record. unchanged is
+    "validators" or "digest" when the page is known to be the same as when
+    it was recorded, else None. '''
+    __slots__ = ('urlhash', 'digest', 'etag', 'last_modified', 'previous', 'unchanged')
+
+    def __init__(self, urlhash, digest, etag, last_modified, previous, unchanged=None):
+        self.urlhash = urlhash
+        self.digest = digest
+        self.etag = etag
+        self.last_modified = last_modified
+        self.previous = previous
+        self.unchanged = unchanged
+
+
+class PageRecords(object):
+    ''' Append-only log of what the crawl knows about every fetched page:
+    a digest of its content, when it was fetched, the ETag and
+    Last-Modified validators of the response, its fingerprint, the tokens
+    merged into the stats for it, and the CPU time parsing and merging it
+    took. The records are indexed in memory; the tokens stay on disk and
+    are only read back when a page changed.
+
+    Writes are buffered and flushed and fsync'ed every `commit_interval`
+    seconds and on close. The log is rewritten from the live records on
+    close once it holds `compact_ratio` times more records than pages.
+
+    `complete` tells whether records were kept since the crawl started, so
+    a completed page without a record was not a page with content. '''
+
+    def __init__(self, path, complete, commit_interval=1.0, compact_ratio=2.0, compact_min_records=10000):
+        self.logger = get_logger("PAGE_RECORDS", "FRONTIER")
+        self.path = path
+        self.commit_interval = commit_interval
+        self.compact_ratio = compact_ratio
+        self.compact_min_records = compact_min_records
+        self.lock = RLock()
+        self.index = dict()
+        self.log_records = 0
+        self.complete = complete
+        if os.path.exists(path):
+            self._replay()
+        else:
+            with open(path, "wb") as f:
+                f.write(FILE_HEADER.pack(MAGIC, complete))
+        self.file = open(path, "ab")
+        self.reader = open(path, "rb")
+        self.last_commit = time.monotonic()
+        # Revisits of recorded pages since the records were opened
+        self.revisits = dict(unchanged_validators=0, unchanged_digest=0, changed=0,
+                             cpu_avoided=0.0, cpu_spent=0.0, cpu_checks=0.0)
+
+    def _replay(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        magic, complete = FILE_HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a page records file")
+        self.complete = bool(complete)
+        offset = FILE_HEADER.size
+        while offset + HEADER.size <= len(data):
+            length, crc = HEADER.unpack_from(data, offset)
+            start = offset + HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or length < HASH_SIZE + META.size or zlib.crc32(payload) != crc:
+                break
+            self._index(payload, start)
+            self.log_records += 1
+            offset = start + length
+        if offset < len(data):
+            # A torn write from a crash: drop everything after the last good record.
+            self.logger.warning(
+                f"Truncating {len(data) - offset} bytes of incomplete records at the end of {self.path}.")
+            with open(self.path, "r+b") as f:
+                f.truncate(offset)
+        self.logger.info(f"Replayed {self.log_records} records for {len(self.index)} pages from {self.path}.")
+
+    def _index(self, payload, start):
+        # Index the record with this payload, which starts at `start` in the file
+        urlhash = payload[:HASH_SIZE].hex()
+        digest, fetched, fingerprint, cpu, flags, etag_size, modified_size = META.unpack_from(payload, HASH_SIZE)
+        if flags & TOUCH:
+            previous = self.index.get(urlhash)
+            if previous is not None:
+                self.index[urlhash] = previous._replace(fetched=fetched)
+            return
+        position = HASH_SIZE + META.size
+        etag = payload[position:position + etag_size].decode("utf-8") or None
+        position += etag_size
+        last_modified = payload[position:position + modified_size].decode("utf-8") or None
+        position += modified_size
+        self.index[urlhash] = PageRecord(
+            digest, fetched, etag, last_modified, fingerprint if flags & HAS_FINGERPRINT else None,
+            bool(flags & MERGED), cpu, start + position, len(payload) - position)
+
+    @staticmethod
+    def _encode(urlhash, record, flags, blob=b""):
+        etag = (record.etag or "").encode("utf-8")
+        last_modified = (record.last_modified or "").encode("utf-8")
+        if record.merged:
+            flags |= MERGED
+        if record.fingerprint is not None:
+            flags |= HAS_FINGERPRINT
+        payload = (bytes.fromhex(urlhash)
+                   + META.pack(record.digest, record.fetched, record.fingerprint or 0, record.cpu, flags,
+                               len(etag), len(last_modified))
+                   + etag + last_modified + blob)
+        return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+    def _append(self, urlhash, record, flags=0, blob=b""):
+        # Must be called with the lock held. Returns where the blob starts.
+        data = self._encode(urlhash, record, flags, blob)
+        offset = self.file.tell() + len(data) - len(blob)
+        self.file.write(data)
+        self.log_records += 1
+        if time.monotonic() - self.last_commit >= self.commit_interval:
+            self.sync()
+        return offset
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, urlhash):
+        return self.index.get(urlhash)
+
+    def visit(self, url, resp, content):
+        ''' Check a fetched page against its record. A page whose validators
+        or digest match its record is counted as unchanged and its fetch time
+        updated; a changed or new page has to be recorded with put() once it
+        was merged. '''
+        start = time.thread_time()
+        urlhash = get_urlhash(url)
+        etag, last_modified = resp.validators()
+        previous = self.index.get(urlhash)
+        visit = PageVisit(urlhash, None, etag, last_modified, previous)
+        if previous is not None and (etag or last_modified) and (
+                etag, last_modified) == (previous.etag, previous.last_modified):
+            visit.digest = previous.digest
+            visit.unchanged = "validators"
+        else:
+            visit.digest = blake2b(content, digest_size=16).digest()
+            if previous is not None and previous.digest == visit.digest:
+                visit.unchanged = "digest"
+        with self.lock:
+            if visit.unchanged:
+                record = previous._replace(fetched=time.time())
+                self._append(urlhash, record, TOUCH)
+                self.index[urlhash] = record
+                self.revisits["unchanged_" + visit.unchanged] += 1
+                self.revisits["cpu_avoided"] += previous.cpu
+            if previous is not None:
+                self.revisits["cpu_checks"] += time.thread_time() - start
+        return visit
+
+    def tokens(self, record):
+        ''' The tokens merged for the page of this record. '''
+        if not record.length:
+            return dict()
+        with self.lock:
+            self.file.flush()
+            blob = os.pread(self.reader.fileno(), record.length, record.offset)
+        return pickle.loads(zlib.decompress(blob))
+
+    def put(self, visit, tokens, fingerprint, merged, cpu):
+        ''' Record a changed or new page: the tokens and fingerprint merged
+        into the stats for it (None if it was not merged), and the CPU
+        seconds it took to parse and merge. '''
+        blob = zlib.compress(pickle.dumps(dict(tokens), pickle.HIGHEST_PROTOCOL)) if tokens else b""
+        record = PageRecord(visit.digest, time.time(), visit.etag, visit.last_modified,
+                            fingerprint, merged, cpu, 0, len(blob))
+        with self.lock:
+            offset = self._append(visit.urlhash, record, 0, blob)
+            self.index[visit.urlhash] = record._replace(offset=offset)
+            if visit.previous is not None:
+                self.revisits["changed"] += 1
+                self.revisits["cpu_spent"] += cpu
+
+    def summary(self):
+        ''' The revisits so far in words, or None if there were none. '''
+        revisits = self.revisits
+        unchanged = revisits["unchanged_validators"] + revisits["unchanged_digest"]
+        total = unchanged + revisits["changed"]
+        if not total:
+            return None
+        # What parsing and merging the revisited pages would have cost,
+        # against what the changed ones and the checks did cost
+        work = revisits["cpu_avoided"] + revisits["cpu_spent"]
+        done = revisits["cpu_spent"] + revisits["cpu_checks"]
+        avoided = 1 - done / work if work else 0.0
+        return (f"Recrawl: {total} pages revisited, {unchanged} unchanged "
+                f"({revisits['unchanged_validators']} by validators, {revisits['unchanged_digest']} by digest), "
+                f"{revisits['changed']} changed. {avoided:.1%} of the CPU time of parsing, tokenizing and "
+                f"merging them was avoided ({done:.2f}s spent of {work:.2f}s).")
+
+    def sync(self):
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.last_commit = time.monotonic()
+
+    def close(self):
+        summary = self.summary()
+        if summary:
+            self.logger.info(summary)
+        with self.lock:
+            self.sync()
+            self.file.close()
+            if self.log_records > max(self.compact_min_records, self.compact_ratio * len(self.index)):
+                self._compact()
+            self.reader.close()
+
+    def _compact(self):
+        # Rewrite the live records, with their tokens, to a new file.
+        temp = self.path + ".tmp"
+        index = dict()
+        with open(temp, "wb") as f:
+            f.write(FILE_HEADER.pack(MAGIC, self.complete))
+            for urlhash, record in self.index.items():
+                blob = os.pread(self.reader.fileno(), record.length, record.offset) if record.length else b""
+                data = self._encode(urlhash, record, 0, blob)
+                index[urlhash] = record._replace(offset=f.tell() + len(data) - len(blob))
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.path)
+        self.logger.info(f"Compacted {self.path} from {self.log_records} to {len(index)} records.")
+        self.index = index
+        self.log_records = len(index)
@@ -0,0 +1,420 @@
+import os
+import glob
+import mmap
+import time
+import zlib
+import shutil
+import struct
+import threading
+from collections import namedtuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from utils import get_logger, get_urlhash
+
+# Segments are numbered from 1 and start with SEGMENT_MAGIC. Every record is
+# RECORD followed by its payload: the url, the url of the response (empty
+# when it is the same) and the body, compressed with the codec of the
+# record. The crc32 covers the payload.
+SEGMENT_FILE = "segment-{:06d}.dat"
+SEGMENT_MAGIC = b"PGSTOR1\n"
+RECORD = struct.Struct("<IIhBxHH")
+RAW = 0
+ZLIB = 1
+ZSTD = 2
+# A response without a body worth keeping (an error, or a rejected page)
+NO_BODY = 3
+
+# The index is an open-addressing hash table in one file, mapped in memory:
+# INDEX_HEADER, then `capacity` slots of SLOT, keyed by the first 16 bytes
+# of get_urlhash and pointing at the latest record of the url. Segment 0
+# marks an empty slot. `clean` is cleared while the store is open for
+# writing, so an index that was not closed is rebuilt from the segments.
+INDEX_FILE = "index.bin"
+INDEX_MAGIC = b"PGINDEX1"
+INDEX_HEADER = struct.Struct("<8sQQB7x")
+SLOT = struct.Struct("<16sIIQ")
+KEY_SIZE = 16
+MIN_CAPACITY = 1 << 16
+MAX_LOAD = 0.7
+
+# A stored response, and where a record is
+StoredPage = namedtuple('StoredPage', ['url', 'final_url', 'status', 'content'])
+Location = namedtuple('Location', ['segment', 'offset', 'length'])
+
+
+def _key(url):
+    return bytes.fromhex(get_urlhash(url))[:KEY_SIZE]
+
+
+class PageStore(object):
+    ''' Append-only store of the fetched pages, so stats can be rebuilt
+    without crawling again (see rebuild.py).
+
+    Records go to numbered segment files in `directory`; a new segment is
+    started once one holds `segment_bytes`. Bodies are compressed with
+    zstd when the zstandard package is installed and zlib otherwise
+    (`compression` "auto"), or as set: "zstd", "zlib" or "none". The
+    latest record of every url is found through a memory-mapped index in
+    O(1); scan() reads the segments in order. Segments are fsync'ed every
+    `commit_interval` seconds and on close. A url stored again keeps only
+    its latest record in the index; the segments are never rewritten.
+
+    With readonly, nothing is written and the index must have been closed
+    cleanly. '''
+
+    def __init__(self, directory, compression="auto", segment_bytes=256 * 1024 * 1024,
+                 commit_interval=1.0, readonly=False):
+        self.logger = get_logger("PAGE_STORE", "Worker")
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.commit_interval = commit_interval
+        self.readonly = readonly
+        self.codec = self._codec(compression)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.readers = dict()
+        self.stored = 0
+        self.stored_bytes = 0
+        self.body_bytes = 0
+        if not readonly:
+            os.makedirs(directory, exist_ok=True)
+        segments = self._segments()
+        self.segment = segments[-1] if segments else 1
+        self.fd = None
+        if not readonly:
+            self._open_segment(self.segment)
+        self._open_index(segments)
+        self.last_commit = time.monotonic()
+
+    @staticmethod
+    def _codec(compression):
+        compression = compression.strip().lower()
+        if compression == "auto":
+            return ZSTD if zstandard is not None else ZLIB
+        if compression == "zstd":
+            if zstandard is None:
+                raise ValueError("PAGESTORECOMPRESSION = zstd needs the zstandard package")
+            return ZSTD
+        if compression in ("zlib", "gzip"):
+            return ZLIB
+        if compression == "none":
+            return RAW
+        raise ValueError(f"Unknown page store compression {compression!r}")
+
+    @staticmethod
+    def remove_files(directory):
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _segments(self):
+        numbers = []
+        for path in glob.glob(self._path(SEGMENT_FILE.replace("{:06d}", "*"))):
+            number = os.path.basename(path)[len("segment-"):-len(".dat")]
+            if number.isdigit():
+                numbers.append(int(number))
+        return sorted(numbers)
+
+    def _open_segment(self, segment):
+        # Must be called with the lock held, or before the store is shared.
+        if self.fd is not None:
+            os.fsync(self.fd)
+            os.close(self.fd)
+        self.segment = segment
+        self.fd = os.open(self._path(SEGMENT_FILE.format(segment)), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.size = os.fstat(self.fd).st_size
+        if not self.size:
+            self.size = os.write(self.fd, SEGMENT_MAGIC)
+
+    # Index
+
+    def _open_index(self, segments):
+        path = self._path(INDEX_FILE)
+        clean = False
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                magic, capacity, count, clean = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+            if magic != INDEX_MAGIC:
+                raise ValueError(f"{path} is not a page store index")
+        if self.readonly:
+            if not clean:
+                raise ValueError(f"The index of the page store in {self.directory} was not closed cleanly; "
+                                 f"open the store for writing once to rebuild it")
+            self.index_file = open(path, "rb")
+            self.index = mmap.mmap(self.index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.capacity, self.count = capacity, count
+            return
+        if clean:
+            self.index_file = open(path, "r+b")
+            self.index = mmap.mmap(self.index_file.fileno(), 0)
+            self.capacity, self.count = capacity, count
+        else:
+            if os.path.exists(path):
+                self.logger.warning(f"Page store index {path} was not closed cleanly, rebuilding it.")
+            self._create_index(path, MIN_CAPACITY)
+            start = time.perf_counter()
+            for segment in segments:
+                self._reindex(segment)
+            if segments:
+                self.logger.info(
+                    f"Indexed {self.count} urls from {len(segments)} segments in "
+                    f"{time.perf_counter() - start:.2f}s.")
+        INDEX_HEADER.pack_into(self.index, 0, INDEX_MAGIC, self.capacity, self.count, False)
+        self.index.flush()
+
+    def _create_index(self, path, capacity):
+        with open(path, "wb") as f:
+            f.truncate(INDEX_HEADER.size + capacity * SLOT.size)
+        self.index_file = open(path, "r+b")
+        self.index = mmap.mmap(self.index_file.fileno(), 0)
+        self.capacity = capacity
+        self.count = 0
+
+    def _reindex(self, segment):
+        # Index the records of a segment, and cut a torn record off its end.
+        path = self._path(SEGMENT_FILE.format(segment))
+        offset = len(SEGMENT_MAGIC)
+        for offset, length, header, payload in self._records(path):
+            if header is None:
+                break
+            url_size = header[4]
+            self._put(_key(payload[:url_size].tobytes().decode("utf-8")), segment, offset, length)
+            offset += length
+        if offset < os.path.getsize(path):
+            self.logger.warning(
+                f"Truncating {os.path.getsize(path) - offset} bytes of incomplete records at the end of {path}.")
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+
+    def _slot(self, key):
+        # The slot of key, or the empty slot it would go to
+        mask = self.capacity - 1
+        slot = int.from_bytes(key[:8], "little") & mask
+        index = self.index
+        while True:
+            position = INDEX_HEADER.size + slot * SLOT.size
+            stored, segment = SLOT.unpack_from(index, position)[:2]
+            if segment == 0 or stored == key:
+                return position, segment != 0
+            slot = (slot + 1) & mask
+
+    def _put(self, key, segment, offset, length):
+        position, found = self._slot(key)
+        SLOT.pack_into(self.index, position, key, segment, length, offset)
+        if not found:
+            self.count += 1
+            if self.count > MAX_LOAD * self.capacity:
+                self._grow()
+
+    def _grow(self):
+        # Rehash every slot into an index of twice the capacity.
+        old, old_file, old_capacity = self.index, self.index_file, self.capacity
+        path = self._path(INDEX_FILE)
+        temp = path + ".tmp"
+        count = self.count
+        self._create_index(temp, old_capacity * 2)
+        for slot in range(old_capacity):
+            key, segment, length, offset = SLOT.unpack_from(old, INDEX_HEADER.size + slot * SLOT.size)
+            if segment:
+                self._put(key, segment, offset, length)
+        self.count = count
+        INDEX_HEADER.pack_into(self.index, 0, INDEX_MAGIC, self.capacity, self.count, False)
+        self.index.flush()
+        os.replace(temp, path)
+        old.close()
+        old_file.close()
+
+    def locate(self, url):
+        ''' The Location of the latest record of url, or None. '''
+        with self.lock:
+            position, found = self._slot(_key(url))
+            if not found:
+                return None
+            _, segment, length, offset = SLOT.unpack_from(self.index, position)
+        return Location(segment, offset, length)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, url):
+        return self.locate(url) is not None
+
+    # Records
+
+    def _compress(self, content):
+        if self.codec == ZSTD:
+            compressor = getattr(self.local, "compressor", None)
+            if compressor is None:
+                compressor = self.local.compressor = zstandard.ZstdCompressor(level=3)
+            return compressor.compress(content)
+        if self.codec == ZLIB:
+            return zlib.compress(content, 6)
+        return content
+
+    def _decompress(self, codec, data):
+        if codec == ZSTD:
+            if zstandard is None:
+                raise ValueError("The page store has zstd records, which need the zstandard package")
+            decompressor = getattr(self.local, "decompressor", None)
+            if decompressor is None:
+                decompressor = self.local.decompressor = zstandard.ZstdDecompressor()
+            return decompressor.decompress(data)
+        if codec == ZLIB:
+            return zlib.decompress(data)
+        if codec == NO_BODY:
+            return None
+        return bytes(data)
+
+    def add(self, url, resp):
+        ''' Store a downloaded response: its status, url and the body if
+        there is one to parse. '''
+        content = resp.content if resp.status == 200 else None
+        self.put(url, resp.url, resp.status, content)
+
+    def put(self, url, final_url, status, content):
+        url_bytes = url.encode("utf-8")
+        final_bytes = final_url.encode("utf-8") if final_url and final_url != url else b""
+        if content is None:
+            codec, body = NO_BODY, b""
+        else:
+            codec, body = self.codec, self._compress(content)
+        payload = b"".join((url_bytes, final_bytes, body))
+        record = RECORD.pack(len(payload), zlib.crc32(payload), status, codec,
+                             len(url_bytes), len(final_bytes)) + payload
+        key = _key(url)
+        with self.lock:
+            if self.size > len(SEGMENT_MAGIC) and self.size + len(record) > self.segment_bytes:
+                self._open_segment(self.segment + 1)
+            offset = self.size
+            os.write(self.fd, record)
+            self.size += len(record)
+            self._put(key, self.segment, offset, len(record))
+            self.stored += 1
+            self.stored_bytes += len(record)
+            self.body_bytes += len(content) if content is not None else 0
+            if time.monotonic() - self.last_commit >= self.commit_interval:
+                self.sync()
+
+    def _reader(self, segment):
+        fd = self.readers.get(segment)
+        if fd is None:
+            with self.lock:
+                fd = self.readers.get(segment)
+                if fd is None:
+                    fd = self.readers[segment] = os.open(self._path(SEGMENT_FILE.format(segment)), os.O_RDONLY)
+        return fd
+
+    def _decode(self, header, payload):
+        length, crc, status, codec, url_size, final_size = header
+        if zlib.crc32(payload) != crc:
+            raise ValueError("Corrupted page store record")
+        url = payload[:url_size].tobytes().decode("utf-8")
+        final_url = payload[url_size:url_size + final_size].tobytes().decode("utf-8") or url
+        return StoredPage(url, final_url, status, self._decompress(codec, payload[url_size + final_size:]))
+
+    def read(self, location):
+        ''' The StoredPage of the record at location. '''
+        data = os.pread(self._reader(location.segment), location.length, location.offset)
+        if len(data) != location.length:
+            raise ValueError(f"Page store record at {location} is cut short")
+        view = memoryview(data)
+        return self._decode(RECORD.unpack_from(view), view[RECORD.size:])
+
+    def get(self, url):
+        ''' The latest StoredPage of url, or None. '''
+        location = self.locate(url)
+        return self.read(location) if location is not None else None
+
+    @staticmethod
+    def _records(path, buffer_size=4 * 1024 * 1024):
+        # (offset, length, header, payload) of the records of a segment file,
+        # read in large blocks. Ends with a None header at a torn or corrupt
+        # record.
+        with open(path, "rb") as f:
+            if f.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+                raise ValueError(f"{path} is not a page store segment")
+            offset = len(SEGMENT_MAGIC)
+            data = memoryview(b"")
+            start = 0
+            while True:
+                if len(data) - start < RECORD.size:
+                    data = memoryview(data[start:].tobytes() + f.read(buffer_size))
+                    start = 0
+                    if len(data) < RECORD.size:
+                        if len(data):
+                            yield offset, 0, None, None
+                        return
+                header = RECORD.unpack_from(data, start)
+                length = RECORD.size + header[0]
+                if len(data) - start < length:
+                    data = memoryview(data[start:].tobytes() + f.read(max(buffer_size, length)))
+                    start = 0
+                    if len(data) < length:
+                        yield offset, 0, None, None
+                        return
+                payload = data[start + RECORD.size:start + length]
+                if zlib.crc32(payload) != header[1]:
+                    yield offset, 0, None, None
+                    return
+                yield offset, length, header, payload
+                offset += length
+                start += length
+
+    def locations(self, latest=True):
+        ''' Locations of the records in the order they were written; with
+        latest, only those of the latest record of every url. '''
+        for segment in self._segments():
+            for offset, length, header, payload in self._records(self._path(SEGMENT_FILE.format(segment))):
+                if header is None:
+                    break
+                if latest:
+                    url = payload[:header[4]].tobytes().decode("utf-8")
+                    if self.locate(url) != (segment, offset, length):
+                        continue
+                yield Location(segment, offset, length)
+
+    def scan(self, latest=True):
+        ''' Every StoredPage in the order they were written, reading the
+        segments sequentially; with latest, only the latest of every url. '''
+        for segment in self._segments():
+            for offset, length, header, payload in self._records(self._path(SEGMENT_FILE.format(segment))):
+                if header is None:
+                    break
+                page = self._decode(header, payload)
+                if latest and self.locate(page.url) != (segment, offset, length):
+                    continue
+                yield page
+
+    def summary(self):
+        ''' What was stored since the store was opened, in words. '''
+        ratio = self.stored_bytes / self.body_bytes if self.body_bytes else 0.0
+        return (f"Stored {self.stored} pages in {self.stored_bytes / 2 ** 20:.1f} MB, "
+                f"{ratio:.1%} of their {self.body_bytes / 2 ** 20:.1f} MB of bodies; "
+                f"{self.count} urls in segments 1-{self.segment}.")
+
+    def sync(self):
+        # Must be called with the lock held, or once no more pages are added.
+        os.fsync(self.fd)
+        self.index.flush()
+        self.last_commit = time.monotonic()
+
+    def close(self):
+        if not self.readonly:
+            if self.stored:
+                self.logger.info(self.summary())
+            with self.lock:
+                os.fsync(self.fd)
+                os.close(self.fd)
+                INDEX_HEADER.pack_into(self.index, 0, INDEX_MAGIC, self.capacity, self.count, True)
+                self.index.flush()
+        self.index.close()
+        self.index_file.close()
+        for fd in self.readers.values():
+            os.close(fd)
+        self.readers.clear()
@@ -0,0 +1,82 @@
+import os
+import json
+
+from crawler.frontier_log import FrontierLog
+
+
+class PendingIndex(object):
+    ''' Persistent index of the urls the frontier still has to download.
+
+    It is a FrontierLog of urlhash -> (url, valid), where valid is the
+    cached is_valid verdict for the url under the filter rules version in
+    `rules`. Completed urls are deleted from it, and the log compacts itself,
+    so resuming reads about as much as there are pending urls rather than
+    every url ever discovered.
+
+    A meta file next to the log holds the rules version, the total number of
+    urls in the frontier save file, and whether the index was closed
+    cleanly. The index and the save file are committed separately, so after
+    a crash the index may not match the save file; `clean` is False then and
+    the frontier rebuilds it. '''
+
+    def __init__(self, path, **log_options):
+        self.path = path
+        self.meta_path = path + ".meta"
+        self.log_options = log_options
+        meta = self._read_meta()
+        self.clean = bool(meta.get("clean")) and os.path.exists(path)
+        self.rules = meta.get("rules")
+        self.total_urls = meta.get("urls", 0)
+        if not self.clean:
+            self._remove_log()
+        self.log = FrontierLog(path, **log_options)
+        # Until close() the index may fall behind the save file.
+        self._write_meta(False)
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict()
+
+    def _write_meta(self, clean):
+        temp = self.meta_path + ".tmp"
+        with open(temp, "w") as f:
+            json.dump({"rules": self.rules, "urls": self.total_urls, "clean": clean}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.meta_path)
+
+    def _remove_log(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def clear(self):
+        ''' Drop every entry, before rebuilding the index from the save file. '''
+        self.log.close()
+        self._remove_log()
+        self.log = FrontierLog(self.path, **self.log_options)
+
+    def __contains__(self, urlhash):
+        return urlhash in self.log
+
+    def __setitem__(self, urlhash, value):
+        self.log[urlhash] = value
+
+    def __delitem__(self, urlhash):
+        del self.log[urlhash]
+
+    def __len__(self):
+        return len(self.log)
+
+    def items(self):
+        return self.log.items()
+
+    def sync(self):
+        self.log.sync()
+
+    def close(self, total_urls):
+        self.log.close()
+        self.total_urls = total_urls
+        self._write_meta(True)
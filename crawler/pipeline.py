@@ -0,0 +1,157 @@
+import os
+import time
+import multiprocessing
+from queue import Queue
+from threading import Thread
+from concurrent.futures import ProcessPoolExecutor
+
+import scraper
+from crawler import Crawler
+from crawler.frontier import Frontier
+from crawler.worker import Worker, DOWNLOADED
+from utils import get_logger
+from utils.download import download
+from utils.log import events
+from utils.metrics import metrics
+
+# Stopwords of the parser processes, set once by _init_parser.
+_stopwords = None
+
+
+def _init_parser(stopwords):
+    global _stopwords
+    _stopwords = stopwords
+
+
+def _analyze(url, base_url, content):
+    # Runs in the parser processes. Returns the page and the CPU seconds it
+    # took.
+    cpu = time.process_time()
+    page = scraper.analyze_page(url, base_url, content, _stopwords)
+    return page, time.process_time() - cpu
+
+
+class FetchWorker(Worker):
+    ''' Worker that only downloads pages and hands them to the parse stage.
+    Blocks when the page queue is full, which keeps memory bounded. '''
+
+    def run(self):
+        while True:
+            # Check for shutdown signal
+            if self.crawler.shutdown_flag:
+                self.logger.info("Shutdown signal received. Stopping worker.")
+                break
+
+            tbd_url = self._next_url()
+            if not tbd_url:
+                break
+            started = time.perf_counter()
+            try:
+                with metrics.timer("download", tbd_url):
+                    resp = download(tbd_url, self.config, self.logger)
+                fetch = time.perf_counter() - started
+                metrics.count(f"status_{resp.status}", tbd_url)
+                events.log(
+                    self.logger, "download", DOWNLOADED, key=resp.status, url=tbd_url, status=resp.status,
+                    cache=self.config.cache_server, connect_ms=resp.connect_time * 1000)
+                if self.crawler.store is not None:
+                    with metrics.timer("store", tbd_url):
+                        self.crawler.store.add(tbd_url, resp)
+            except Exception as e:
+                self.logger.error(f"Error downloading {tbd_url}: {e}")
+                self.frontier.mark_url_complete(tbd_url)
+                self._observe(started, time.perf_counter() - started, 0.0, None)
+                continue
+            # The url stays in flight (and its host busy) until it is merged.
+            # Time blocked on a full queue counts as busy: more fetchers would
+            # not help then.
+            with metrics.timer("queue_put"):
+                self.crawler.pages.put((tbd_url, resp))
+            self._observe(started, fetch, 0.0, resp.status)
+
+
+class MergeWorker(Thread):
+    ''' Sends queued pages to the parser processes and merges the results
+    into stats and the frontier. One per parser process. '''
+
+    def __init__(self, worker_id, crawler):
+        self.logger = get_logger(f"Merger-{worker_id}", "Worker")
+        self.crawler = crawler
+        self.stats = crawler.aggregator.shard()
+        super().__init__(daemon=True, name=f"Merger-{worker_id}")
+
+    def run(self):
+        crawler = self.crawler
+        while True:
+            item = crawler.pages.get()
+            if item is None:
+                break
+            url, resp = item
+            fingerprint = None
+            merged = False
+            try:
+                if resp.status == 200:
+                    # Only the bytes go to the parser process, not the Response.
+                    content, visit = scraper.revisit(url, resp, self.stats)
+                    if visit is not None and visit.unchanged:
+                        fingerprint, merged = visit.previous.fingerprint, visit.previous.merged
+                    else:
+                        # Parse stages run in the parser processes and are
+                        # timed here as a whole
+                        with metrics.timer("analyze", url):
+                            page, cpu = crawler.pool.submit(_analyze, url, resp.url, content).result()
+                        crawler.scaler.parsed(cpu)
+                        scraped_urls, fingerprint, merged = scraper.merge_page(url, page, self.stats, visit)
+                        with metrics.timer("frontier_add"):
+                            crawler.frontier.add_urls(scraped_urls, url)
+            except Exception as e:
+                metrics.count("error", url)
+                self.logger.error(f"Error processing {url}: {e}")
+            crawler.frontier.mark_url_complete(url, fingerprint, merged)
+
+
+class PipelineCrawler(Crawler):
+    ''' Crawler that splits downloading from parsing. Fetcher threads, as
+    many as the autoscaler keeps active, download pages into a bounded
+    queue, and a pool of config.parser_processes processes parses and
+    tokenizes them, so parsing is not serialized by the GIL. Results are
+    merged into the stats in this process. Works with the fork start method
+    set by launch.py. '''
+
+    def __init__(self, config, restart, stats, stopwords, frontier_factory=Frontier, worker_factory=FetchWorker):
+        super().__init__(config, restart, stats, stopwords, frontier_factory, worker_factory)
+        self.pages = Queue(maxsize=config.parse_queue_size)
+        self.pool = None
+        self.mergers = list()
+
+    def _parse_capacity(self):
+        return max(1, min(self.config.parser_processes, os.cpu_count() or 1))
+
+    def start_async(self):
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.config.parser_processes,
+            mp_context=multiprocessing.get_context(),
+            initializer=_init_parser, initargs=(self.stopwords,))
+        # Fork the parser processes now, before the fetcher and merge threads
+        # start, so they are not forked in the middle of a download.
+        list(self.pool.map(_init_parser, [self.stopwords] * self.config.parser_processes))
+
+        self.mergers = [MergeWorker(merger_id, self) for merger_id in range(self.config.parser_processes)]
+        for merger in self.mergers:
+            merger.start()
+        super().start_async()
+
+    def join(self):
+        for worker in self.workers:
+            worker.join()
+        self.scaler.stop()
+        for worker in self.workers:
+            worker.join()
+        # Every queued page is still in flight, so the fetchers only stop once
+        # the queue has been drained; stop the mergers behind the last page.
+        for _ in self.mergers:
+            self.pages.put(None)
+        for merger in self.mergers:
+            merger.join()
+        self.pool.shutdown()
+        self.finish()
@@ -0,0 +1,182 @@
+import re
+from itertools import count
+
+# Url scores, higher is fetched first. A url loses DEPTH_WEIGHT per link
+# it is away from the seeds, gains up to NOVELTY_WEIGHT by the share of new
+# links on the page it was found on, and INLINK_BONUS for every other page
+# that links to it while it waits (up to MAX_INLINK_BONUS). Query
+# parameters, deep paths and numbers in the path cost a little each.
+DEPTH_WEIGHT = 1.0
+NOVELTY_WEIGHT = 2.0
+INLINK_BONUS = 0.25
+MAX_INLINK_BONUS = 1.0
+QUERY_PENALTY = 0.5
+SEGMENT_PENALTY = 0.2
+DIGIT_PENALTY = 0.2
+# Path segments that cost nothing
+FREE_SEGMENTS = 3
+
+# Hosts are picked by their best url plus HOST_WEIGHT times their yield: the
+# average of the share of fetches with novel content and of the new links
+# per fetch over LINKS_SATURATION, both decaying by YIELD_DECAY per fetch.
+HOST_WEIGHT = 2.0
+LINKS_SATURATION = 10
+YIELD_DECAY = 0.1
+
+_DIGITS = re.compile(r'\d+')
+
+
+def shape_penalty(url):
+    ''' What the shape of the url costs: query parameters, path segments
+    past FREE_SEGMENTS and numbers in the path. '''
+    rest = url.split("://", 1)[-1].split("#", 1)[0]
+    path, _, query = rest.partition("?")
+    segments = path.count("/")
+    penalty = SEGMENT_PENALTY * max(0, segments - FREE_SEGMENTS)
+    penalty += DIGIT_PENALTY * len(_DIGITS.findall(path[path.find("/"):] if "/" in path else ""))
+    if query:
+        penalty += QUERY_PENALTY * (query.count("&") + 1)
+    return penalty
+
+
+def url_score(url, depth, novelty):
+    ''' Score of a url found `depth` links from the seeds on a page whose
+    links were new in the share `novelty`. '''
+    return NOVELTY_WEIGHT * novelty - DEPTH_WEIGHT * depth - shape_penalty(url)
+
+
+class IndexedHeap(object):
+    ''' Max-heap of keys by priority, with the position of every key
+    indexed, so a queued key can be re-prioritized or removed in O(log n).
+    Keys of equal priority come out in the order they were pushed. Every
+    key carries a value, handed back by pop(). '''
+
+    def __init__(self):
+        # [-priority, sequence, key, value]
+        self.heap = []
+        self.position = dict()
+        self.sequence = count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __bool__(self):
+        return bool(self.heap)
+
+    def __contains__(self, key):
+        return key in self.position
+
+    def __iter__(self):
+        return iter(self.position)
+
+    def priority(self, key):
+        return -self.heap[self.position[key]][0]
+
+    def peek_priority(self):
+        return -self.heap[0][0]
+
+    def push(self, key, priority, value=None):
+        ''' Add key, or re-prioritize it if it is queued already. '''
+        index = self.position.get(key)
+        if index is not None:
+            self.update(key, priority)
+            return
+        self.heap.append([-priority, next(self.sequence), key, value])
+        self.position[key] = len(self.heap) - 1
+        self._sift_up(len(self.heap) - 1)
+
+    def update(self, key, priority):
+        index = self.position[key]
+        entry = self.heap[index]
+        old, entry[0] = entry[0], -priority
+        if entry[0] < old:
+            self._sift_up(index)
+        else:
+            self._sift_down(index)
+
+    def pop(self):
+        ''' Remove and return the (key, value) of the highest priority. '''
+        return self._remove_at(0)
+
+    def remove(self, key):
+        return self._remove_at(self.position[key])
+
+    def _remove_at(self, index):
+        heap = self.heap
+        entry = heap[index]
+        last = heap.pop()
+        del self.position[entry[2]]
+        if index < len(heap):
+            heap[index] = last
+            self.position[last[2]] = index
+            self._sift_up(index)
+            self._sift_down(self.position[last[2]])
+        return entry[2], entry[3]
+
+    def _sift_up(self, index):
+        heap, position = self.heap, self.position
+        entry = heap[index]
+        while index > 0:
+            parent = (index - 1) >> 1
+            if heap[parent] <= entry:
+                break
+            heap[index] = heap[parent]
+            position[heap[index][2]] = index
+            index = parent
+        heap[index] = entry
+        position[entry[2]] = index
+
+    def _sift_down(self, index):
+        heap, position = self.heap, self.position
+        size = len(heap)
+        entry = heap[index]
+        while True:
+            child = 2 * index + 1
+            if child >= size:
+                break
+            if child + 1 < size and heap[child + 1] < heap[child]:
+                child += 1
+            if entry <= heap[child]:
+                break
+            heap[index] = heap[child]
+            position[heap[index][2]] = index
+            index = child
+        heap[index] = entry
+        position[entry[2]] = index
+
+
+class LifoQueue(list):
+    ''' The original host queue: the url added last is fetched first. It
+    has the IndexedHeap methods the frontier uses and ignores priorities. '''
+
+    def push(self, key, priority, value=None):
+        self.append((key, value))
+
+    def pop(self):
+        return super().pop()
+
+    def __iter__(self):
+        return (key for key, _ in super().__iter__())
+
+    def __contains__(self, key):
+        # Queued urls are not re-prioritized in LIFO order
+        return False
+
+
+class HostYield(object):
+    ''' Decaying averages of what fetches from one host yield. '''
+    __slots__ = ('novel', 'links')
+
+    def __init__(self, novel=1.0, links=float(LINKS_SATURATION)):
+        # New hosts start out optimistic, so they get explored
+        self.novel = novel
+        self.links = links
+
+    def add_fetch(self, novel):
+        self.novel += YIELD_DECAY * (float(novel) - self.novel)
+
+    def add_links(self, new_links):
+        self.links += YIELD_DECAY * (new_links - self.links)
+
+    def score(self):
+        return HOST_WEIGHT * (self.novel + min(1.0, self.links / LINKS_SATURATION)) / 2
@@ -0,0 +1,111 @@
+import os
+import json
+import heapq
+from operator import itemgetter
+
+TOP_TOKENS = 100
+
+
+def _dumps(value, level):
+    # value as indented JSON, for a position `level` deep in the document
+    return json.dumps(value, indent=2).replace("\n", "\n" + "  " * level)
+
+
+def _write_list(f, items, level):
+    # Stream a JSON list one item at a time
+    pad = "  " * (level + 1)
+    first = True
+    for item in items:
+        f.write(("[\n" if first else ",\n") + pad + json.dumps(item))
+        first = False
+    f.write("[]" if first else "\n" + "  " * level + "]")
+
+
+def _write_object(f, sections, level):
+    # Stream a JSON object from (key, write) pairs, where write(f, level)
+    # writes the value of key
+    pad = "  " * (level + 1)
+    first = True
+    for key, write in sections:
+        f.write(("{\n" if first else ",\n") + pad + json.dumps(key) + ": ")
+        write(f, level + 1)
+        first = False
+    f.write("{}" if first else "\n" + "  " * level + "}")
+
+
+def _value(value):
+    return lambda f, level: f.write(_dumps(value, level))
+
+
+def _pages(pages):
+    return lambda f, level: _write_list(f, pages, level)
+
+
+def top_tokens(tokens, k=TOP_TOKENS):
+    """The k most common (token, count) pairs, in the order sorting would give"""
+    if hasattr(tokens, 'most_common'):
+        # Only decodes the top tokens of a TokenCounts
+        return tokens.most_common(k)
+    return heapq.nlargest(k, tokens.items(), key=itemgetter(1))
+
+
+def write_report(path, data, pages, duplicate_rates, page_files=False):
+    """Write the final report JSON to path, one section at a time.
+
+    Args:
+        path: The report file
+        data: A Stats.snapshot()
+        pages: Iterable of all crawled pages, with len()
+        duplicate_rates: Stats.duplicate_rates() of the snapshot
+        page_files: Write the page listings to newline-delimited JSON files
+            next to the report instead of into it
+
+    Returns:
+        (summary, top tokens) of the report
+    """
+    tokens, subdomains = data['tokens'], data['subdomains']
+    sorted_tokens = top_tokens(tokens)
+    summary = {
+        'total_unique_pages': len(pages),
+        'total_subdomains': len(subdomains),
+        'longest_page_words': data['longest_length'],
+        'total_unique_tokens': len(tokens),
+        'total_token_occurrences': sum(tokens.values())
+    }
+    base = os.path.splitext(path)[0]
+    pages_file = base + ".pages.ndjson"
+    subdomain_pages_file = base + ".subdomain_pages.ndjson"
+
+    def write_subdomain(subdomain_pages):
+        sections = [('unique_pages', _value(len(subdomain_pages)))]
+        if not page_files:
+            sections.append(('pages', _pages(sorted(subdomain_pages))))
+        return lambda f, level: _write_object(f, sections, level)
+
+    sections = [
+        ('summary', _value(summary)),
+        ('subdomains', lambda f, level: _write_object(
+            f, ((subdomain, write_subdomain(subdomain_pages))
+                for subdomain, subdomain_pages in subdomains.items()), level)),
+        ('duplicates', _value(duplicate_rates)),
+        ('top_100_tokens', _value([{'token': token, 'count': count} for token, count in sorted_tokens])),
+    ]
+    if page_files:
+        # Pages are listed in crawl order, so nothing has to be sorted in memory
+        with open(pages_file, 'w') as f:
+            for page in pages:
+                f.write(json.dumps(page) + "\n")
+        with open(subdomain_pages_file, 'w') as f:
+            for subdomain, subdomain_pages in subdomains.items():
+                for page in sorted(subdomain_pages):
+                    f.write(json.dumps({'subdomain': subdomain, 'page': page}) + "\n")
+        sections += [('all_unique_pages_file', _value(pages_file)),
+                     ('subdomain_pages_file', _value(subdomain_pages_file))]
+    else:
+        sections.append(('all_unique_pages', _pages(sorted(pages))))
+
+    temp = path + ".tmp"
+    with open(temp, 'w') as f:
+        _write_object(f, sections, 0)
+    os.replace(temp, path)
+    return summary, sorted_tokens
@@ -0,0 +1,351 @@
+import os
+import time
+import zlib
+import signal
+import multiprocessing
+from functools import partial
+from contextlib import contextmanager
+from threading import Thread, BrokenBarrierError
+from queue import Empty
+
+from crawler.frontier import Frontier
+from crawler.stats import Stats, COUNTS, merge_counts
+from utils import get_logger, get_host, normalize
+from utils.bloom import SeenUrls
+
+# Seconds between checks of the coordinator, and the longest a shard waits
+# for its inbox before it checks for batches to flush
+WATCH_INTERVAL = 0.1
+ROUTER_WAIT = 0.05
+# Seconds a stopping shard waits for the others to send their last batches
+CLOSE_TIMEOUT = 30.0
+
+
+def shard_of(url, shards):
+    ''' The shard that owns the host of url. Stable across processes and
+    runs, unlike hash(). '''
+    return zlib.crc32(get_host(url).encode("utf-8")) % shards
+
+
+def shard_directory(config, index):
+    return os.path.abspath(os.path.join(config.shard_dir, f"{index + 1}-of-{config.shards}"))
+
+
+@contextmanager
+def _in_directory(path):
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+class ShardState(object):
+    ''' What the shard processes share: an inbox of url batches per shard,
+    the number of batches sent to and received by each shard, and which
+    shards have nothing to do. done is set by the coordinator once the
+    crawl is over, halt when one shard stopped early and all should stop. '''
+
+    def __init__(self, shards, context):
+        self.shards = shards
+        self.inboxes = [context.Queue() for _ in range(shards)]
+        self.sent = context.Array('q', shards)
+        self.received = context.Array('q', shards)
+        self.idle = context.Array('b', shards)
+        self.done = context.Event()
+        self.halt = context.Event()
+        self.closing = context.Barrier(shards)
+
+    def counts(self):
+        with self.sent.get_lock(), self.received.get_lock():
+            return list(self.sent), list(self.received)
+
+    def drained(self):
+        ''' Whether every shard is idle with no batch in transit. Idle shards
+        only get work from a batch, and receiving one changes the counts, so
+        counts that add up and do not change around the idle check mean no
+        shard got work in between. '''
+        sent, received = self.counts()
+        if sum(sent) != sum(received):
+            return False
+        if not all(self.idle[:]):
+            return False
+        return (sent, received) == self.counts()
+
+
+class ShardFrontier(Frontier):
+    ''' The frontier of one shard: the hosts that hash to it, with their
+    politeness state. Links to hosts of other shards are collected per
+    shard and sent as a batch once there are config.shard_batch urls, or
+    config.shard_flush_interval seconds after the first one, or when this
+    shard runs out of work. A router thread adds the batches sent here.
+
+    The crawl is over when the coordinator finds all shards drained, and
+    not when the queues of this shard run empty. The depth of a link sent
+    to another shard goes with it; its novelty is counted where it is
+    added, among the links of its batch. '''
+
+    def __init__(self, config, restart, shard=None, state=None):
+        self.shard = shard
+        self.state = state
+        self.outbox = [[] for _ in range(state.shards)]
+        self.outbox_size = [0] * state.shards
+        self.outbox_since = None
+        self.closing = False
+        super().__init__(config, restart)
+        self.router = Thread(target=self._route, daemon=True, name=f"Router-{shard}")
+        self.router.start()
+
+    def add_urls(self, urls, parent=None, depth=None):
+        local = []
+        remote = dict()
+        for url in urls:
+            url = normalize(url)
+            owner = shard_of(url, self.state.shards)
+            if owner == self.shard:
+                local.append(url)
+            else:
+                remote.setdefault(owner, []).append(url)
+        if remote:
+            with self.lock:
+                if depth is None:
+                    remote_depth = self.fetching.get(parent, -1) + 1 if parent is not None else 0
+                else:
+                    remote_depth = depth
+                for owner, owned in remote.items():
+                    self._post(owner, remote_depth, owned)
+        if local or not remote:
+            super().add_urls(local, parent, depth)
+
+    def _post(self, owner, depth, urls):
+        # Must be called with the lock held.
+        self.outbox[owner].append((depth, urls))
+        self.outbox_size[owner] += len(urls)
+        if self.outbox_since is None:
+            self.outbox_since = time.monotonic()
+        if self.outbox_size[owner] >= self.config.shard_batch:
+            self._send(owner)
+
+    def _send(self, owner):
+        batch, self.outbox[owner] = self.outbox[owner], []
+        self.outbox_size[owner] = 0
+        # Counted as sent before it can be received
+        with self.state.sent.get_lock():
+            self.state.sent[owner] += 1
+        self.state.inboxes[owner].put(batch)
+
+    def _flush(self):
+        with self.lock:
+            for owner, batch in enumerate(self.outbox):
+                if batch:
+                    self._send(owner)
+            self.outbox_since = None
+
+    def _receive(self, batch):
+        with self.lock:
+            for depth, urls in batch:
+                super().add_urls(urls, depth=depth)
+            # Busy before the batch counts as received, see ShardState.drained
+            self.state.idle[self.shard] = 0
+            with self.state.received.get_lock():
+                self.state.received[self.shard] += 1
+            self.has_work.notify_all()
+
+    def _drained(self):
+        # Nothing left here: send what the others are waiting for, and wait
+        # for the coordinator.
+        self._flush()
+        self.state.idle[self.shard] = 1
+        return self.state.done.is_set()
+
+    def _route(self):
+        inbox = self.state.inboxes[self.shard]
+        while not self.closing:
+            try:
+                self._receive(inbox.get(timeout=ROUTER_WAIT))
+            except Empty:
+                pass
+            since = self.outbox_since
+            if since is not None and time.monotonic() - since >= self.config.shard_flush_interval:
+                self._flush()
+            if self.state.halt.is_set() and not self.stopped:
+                self.logger.info("Another shard stopped, stopping this one.")
+                self.stop()
+
+    def close(self):
+        if not self.state.done.is_set():
+            # Stopped before the crawl is over: stop the other shards too
+            self.state.halt.set()
+        self._flush()
+        self.closing = True
+        self.router.join()
+        # Take in the last batches of the other shards, so every url found
+        # is in the save file of its shard when the crawl is resumed.
+        try:
+            self.state.closing.wait(CLOSE_TIMEOUT)
+        except BrokenBarrierError:
+            self.logger.warning("Not all shards stopped in time, some urls sent here may be lost.")
+        inbox = self.state.inboxes[self.shard]
+        while self.state.received[self.shard] < self.state.sent[self.shard]:
+            try:
+                self._receive(inbox.get(timeout=1.0))
+            except Empty:
+                break
+        super().close()
+
+
+class ShardPages(object):
+    ''' The pages of all shards: the SeenUrls of each, in shard order, None
+    for a shard that never ran. A shard also lists the links it found to
+    hosts of other shards, so a url is taken from the shard that owns its
+    host (see shard_of) if that one has it, else from the first shard that
+    has it. Only urls of other shards' hosts are looked up, in the exact
+    SeenUrls of the others. '''
+
+    def __init__(self, shards):
+        self.shards = shards
+        self.count = sum(1 for _ in self)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for index, pages in enumerate(self.shards):
+            if pages is None:
+                continue
+            for url in pages:
+                owner = shard_of(url, len(self.shards))
+                if owner == index:
+                    yield url
+                elif not self._has(owner, url) and not any(
+                        self._has(other, url) for other in range(index)):
+                    yield url
+
+    def _has(self, index, url):
+        pages = self.shards[index]
+        return pages is not None and url in pages
+
+    def __repr__(self):
+        return f"<ShardPages {self.count} urls from {len(self.shards)} shards>"
+
+    def close(self):
+        for pages in self.shards:
+            if pages is not None:
+                pages.close()
+
+
+def _run_shard(index, config, restart, engine, stopwords, state, frontier_factory):
+    # Runs in the shard processes.
+    directory = shard_directory(config, index)
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory)
+    config.seed_urls = [url for url in config.seed_urls if shard_of(normalize(url), config.shards) == index]
+    if config.metrics_port:
+        config.metrics_port += index + 1
+
+    if restart:
+        Stats.remove_files()
+    stats = Stats.load(config.seen_capacity, config.seen_error_rate)
+    crawler = engine(config, restart, stats, stopwords,
+                     frontier_factory=partial(frontier_factory, shard=index, state=state))
+    crawler.start()
+
+
+class ShardedCrawler(object):
+    ''' Crawls with config.shards processes, each running `engine` for the
+    hosts that hash to it (see shard_of) with its own frontier, politeness
+    state and stats, in its own directory under config.shard_dir. The
+    coordinator in this process only watches the shards: it ends the crawl
+    when all of them are drained, stops them all when one stops early or
+    fails, and merges their stats into the final report. Restarting with
+    the same number of shards resumes each of them.
+
+    Near duplicates are only checked within a shard, so the same page on
+    hosts of two shards is counted twice. '''
+
+    def __init__(self, config, restart, engine, stopwords, frontier_factory=ShardFrontier):
+        self.config = config
+        self.restart = restart
+        self.engine = engine
+        self.stopwords = stopwords
+        self.frontier_factory = frontier_factory
+        self.logger = get_logger("COORDINATOR")
+        self.directories = [shard_directory(config, index) for index in range(config.shards)]
+        self.stats = None
+
+    def _check_directories(self):
+        if self.restart or not os.path.isdir(self.config.shard_dir):
+            return
+        current = {os.path.basename(directory) for directory in self.directories}
+        other = sorted(set(os.listdir(self.config.shard_dir)) - current)
+        if other:
+            self.logger.warning(
+                f"Found shards {', '.join(other)} in {self.config.shard_dir}, which are not resumed "
+                f"with {self.config.shards} shards.")
+
+    def start(self):
+        self._check_directories()
+        context = multiprocessing.get_context()
+        state = ShardState(self.config.shards, context)
+        processes = [
+            context.Process(
+                target=_run_shard, name=f"Shard-{index + 1}",
+                args=(index, self.config, self.restart, self.engine, self.stopwords, state,
+                      self.frontier_factory))
+            for index in range(self.config.shards)]
+
+        def _signal_handler(signum, frame):
+            # The shards get the signal too and stop by themselves
+            self.logger.info("Received shutdown signal. Waiting for the shards to save...")
+            state.halt.set()
+        previous = signal.signal(signal.SIGINT, _signal_handler)
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        self.logger.info(f"Started {len(processes)} shards.")
+        try:
+            self._watch(state, processes)
+        finally:
+            for process in processes:
+                process.join()
+            signal.signal(signal.SIGINT, previous)
+        self.logger.info(f"All shards stopped after {time.perf_counter() - start:.1f}s.")
+
+        self.stats = self.merge_stats()
+        self.stats.save_final_report(self.config.report_page_files)
+        self.stats.pages.close()
+
+    def _watch(self, state, processes):
+        while any(process.is_alive() for process in processes):
+            failed = [process.name for process in processes if process.exitcode not in (None, 0)]
+            if failed and not state.halt.is_set():
+                self.logger.error(f"{', '.join(failed)} failed, stopping all shards.")
+                state.halt.set()
+            if not state.done.is_set() and state.drained():
+                sent, _ = state.counts()
+                self.logger.info(f"All shards drained after {sum(sent)} batches, stopping.")
+                state.done.set()
+            time.sleep(WATCH_INTERVAL)
+
+    def merge_stats(self):
+        ''' The stats of all shards in one Stats. Its pages are read from the
+        page files of the shards when they are needed. '''
+        merged = Stats(None)
+        shard_pages = []
+        for directory in self.directories:
+            if not os.path.isdir(directory):
+                shard_pages.append(None)
+                continue
+            with _in_directory(directory):
+                stats = Stats.load(self.config.seen_capacity, self.config.seen_error_rate)
+                stats.pages.close()
+            # Reopened by absolute path, to be read from here
+            shard_pages.append(SeenUrls.open(
+                os.path.join(directory, Stats.BLOOM_FILE), os.path.join(directory, Stats.PAGES_FILE),
+                self.config.seen_capacity, self.config.seen_error_rate, os.path.join(directory, Stats.INDEX_FILE)))
+            merge_counts(merged, **{key: getattr(stats, key) for key in COUNTS})
+            merged.fingerprints.extend(
+                stats.fingerprints.fingerprints.tobytes(), stats.fingerprints.removed.tobytes())
+        merged.pages = ShardPages(shard_pages)
+        return merged
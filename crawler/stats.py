@@ -0,0 +1,221 @@
+from collections import defaultdict
+import pickle
+import glob
+import os
+from threading import RLock
+
+from utils.bloom import SeenUrls
+from utils.simhash import SimHashIndex
+from utils.interned import TokenCounts, PageSets
+from crawler.report import write_report
+
+# The counts kept by Stats, StatsShard and checkpoint deltas
+COUNTS = ('longest_length', 'tokens', 'subdomains', 'fingerprinted', 'duplicates')
+
+
+def merge_counts(target, longest_length, tokens, subdomains, fingerprinted, duplicates):
+    """Add counts into the Stats or StatsShard target"""
+    if longest_length > target.longest_length:
+        target.longest_length = longest_length
+    # Counter and TokenCounts both add counts on update. Counts go down when
+    # a recrawled page changed.
+    target.tokens.update(tokens)
+    for subdomain, pages in subdomains.items():
+        target.subdomains[subdomain].update(pages)
+    for host, count in fingerprinted.items():
+        target.fingerprinted[host] += count
+    for host, count in duplicates.items():
+        target.duplicates[host] += count
+
+
+def dump_atomic(data, path):
+    """Pickle data to path through a temp file, so path is always whole.
+    Returns the size written."""
+    temp = path + ".tmp"
+    with open(temp, 'wb') as f:
+        pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+        size = f.tell()
+    os.replace(temp, path)
+    return size
+
+
+class Stats:
+    SAVE_FILE = "stats.pkl"
+    # Checkpoint deltas written since SAVE_FILE, numbered in order
+    DELTA_FILE = "stats.delta.{:08d}"
+    BLOOM_FILE = "stats.bloom"
+    PAGES_FILE = "stats_pages.txt"
+    # Exact index of the pages, checked when the bloom filter says "maybe"
+    INDEX_FILE = "stats_pages.index"
+    FINAL_REPORT = "stats_report.json"
+
+    def __init__(self, pages=None):
+        # A plain set, or a SeenUrls when the crawl is bounded in memory
+        self.pages = pages if pages is not None else set()
+        # The frontier's PageRecords, when it keeps them
+        self.records = None
+        self.longest_length = 0
+        # Tokens and crawled pages are interned, see utils.interned
+        self.tokens = TokenCounts()
+        self.subdomains = PageSets()
+        # Near-duplicate detection: SimHash fingerprints of the crawled pages,
+        # and per host the pages checked and the near duplicates found
+        self.fingerprints = SimHashIndex()
+        self.fingerprinted = defaultdict(int)
+        self.duplicates = defaultdict(int)
+        # Held while shards are merged in and while a snapshot is taken
+        self.lock = RLock()
+        # Last checkpoint delta in the stats files, and how many fingerprints
+        # added and removed they hold
+        self.checkpoint_seq = 0
+        self.checkpoint_fingerprints = 0
+        self.checkpoint_removed = 0
+
+    def __repr__(self):
+        return f'<Stats:\n pages {self.pages}\n longest_length {self.longest_length}\n tokens {self.tokens}\n subdomains {self.subdomains}\n>'
+
+    def merge(self, shard):
+        """Add the counts of a drained StatsShard"""
+        with self.lock:
+            merge_counts(self, **shard.counts())
+
+    def snapshot(self):
+        """Copy of the counts as of one point between merges"""
+        with self.lock, self.fingerprints.lock:
+            return {
+                'longest_length': self.longest_length,
+                'tokens': self.tokens.copy(),
+                'subdomains': self.subdomains.copy(),
+                # Only the fingerprint bytes, see SimHashIndex.__getstate__
+                'fingerprints': self.fingerprints.__getstate__(),
+                'fingerprinted': dict(self.fingerprinted),
+                'duplicates': dict(self.duplicates),
+                'checkpoint': self.checkpoint_seq
+            }
+
+    def save(self):
+        """Write all stats to SAVE_FILE and drop the checkpoint deltas it covers"""
+        data = self.snapshot()
+        if isinstance(self.pages, set):
+            data['pages'] = set(self.pages)
+        else:
+            # SeenUrls writes its own files as it goes
+            self.pages.flush()
+        size = dump_atomic(data, self.SAVE_FILE)
+        self.checkpoint_fingerprints = len(data['fingerprints']['fingerprints']) // 8
+        self.checkpoint_removed = len(data['fingerprints']['removed']) // 8
+        for seq, path in self.delta_files():
+            if seq <= data['checkpoint']:
+                os.remove(path)
+        return size
+
+    @staticmethod
+    def delta_files():
+        """(seq, path) of the checkpoint deltas on disk, in order"""
+        prefix = Stats.DELTA_FILE.split("{")[0]
+        files = []
+        for path in glob.glob(prefix + "*"):
+            suffix = path[len(prefix):]
+            if suffix.isdigit():
+                files.append((int(suffix), path))
+        return sorted(files)
+
+    def duplicate_rates(self, snapshot=None):
+        """Near-duplicate pages per host, highest rate first"""
+        data = snapshot or self.snapshot()
+        duplicates = data['duplicates']
+        rates = {
+            host: {
+                'checked_pages': checked,
+                'near_duplicates': duplicates.get(host, 0),
+                'duplicate_rate': round(duplicates.get(host, 0) / checked, 4)
+            }
+            for host, checked in data['fingerprinted'].items()
+        }
+        return dict(sorted(rates.items(), key=lambda x: x[1]['duplicate_rate'], reverse=True))
+
+    def save_final_report(self, page_files=False, path=None):
+        """Save comprehensive final stats report"""
+        path = path or self.FINAL_REPORT
+        # Everything below comes from one consistent snapshot
+        data = self.snapshot()
+        duplicate_rates = self.duplicate_rates(data)
+        summary, sorted_tokens = write_report(path, data, self.pages, duplicate_rates, page_files)
+        subdomains = data['subdomains']
+
+        print(f"\n{'='*60}")
+        print(f"CRAWL COMPLETE - Final Statistics")
+        print(f"{'='*60}")
+        print(f"Total Unique Pages Crawled: {summary['total_unique_pages']}")
+        print(f"Total Unique Subdomains: {len(subdomains)}")
+        print(f"Longest Page (words): {data['longest_length']}")
+        print(f"Total Unique Tokens: {len(data['tokens'])}")
+        print(f"\nTop 10 Most Common Tokens:")
+        for i, (token, count) in enumerate(sorted_tokens[:10], 1):
+            print(f"  {i}. {token}: {count}")
+        print(f"\nNear-Duplicate Pages Skipped: {sum(data['duplicates'].values())}")
+        for host, rate in list(duplicate_rates.items())[:10]:
+            if rate['near_duplicates']:
+                print(f"  {host}: {rate['near_duplicates']}/{rate['checked_pages']} ({rate['duplicate_rate']:.1%})")
+        print(f"\nSubdomains with Page Counts:")
+        for subdomain in sorted(subdomains.keys()):
+            print(f"  {subdomain}: {len(subdomains[subdomain])} pages")
+        print(f"\nFull report saved to: {path}")
+        print(f"{'='*60}\n")
+
+    @staticmethod
+    def remove_files():
+        paths = [Stats.SAVE_FILE, Stats.BLOOM_FILE, Stats.PAGES_FILE, Stats.INDEX_FILE]
+        paths += [path for _, path in Stats.delta_files()]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+                print(f"Deleted existing stats file: {path}")
+
+    @staticmethod
+    def load(capacity=10000000, error_rate=0.001):
+        pages = SeenUrls.open(Stats.BLOOM_FILE, Stats.PAGES_FILE, capacity, error_rate, Stats.INDEX_FILE)
+        stats = Stats(pages)
+        try:
+            if os.path.exists(Stats.SAVE_FILE):
+                with open(Stats.SAVE_FILE, 'rb') as f:
+                    data = pickle.load(f)
+                # Stats saved before pages moved out of the pickle
+                if 'pages' in data:
+                    pages.update(data['pages'])
+                stats.longest_length = data['longest_length']
+                # Stats saved before tokens and pages were interned are
+                # plain dicts
+                tokens, subdomains = data['tokens'], data['subdomains']
+                stats.tokens = tokens if isinstance(tokens, TokenCounts) else TokenCounts(tokens)
+                stats.subdomains = subdomains if isinstance(subdomains, PageSets) else PageSets(subdomains)
+                if 'fingerprints' in data:
+                    fingerprints = data['fingerprints']
+                    if not isinstance(fingerprints, SimHashIndex):
+                        fingerprints = SimHashIndex.__new__(SimHashIndex)
+                        fingerprints.__setstate__(data['fingerprints'])
+                    stats.fingerprints = fingerprints
+                    stats.fingerprinted = defaultdict(int, data['fingerprinted'])
+                    stats.duplicates = defaultdict(int, data['duplicates'])
+                stats.checkpoint_seq = data.get('checkpoint', 0)
+
+            # Replay the checkpoint deltas written after SAVE_FILE, in order
+            for seq, path in Stats.delta_files():
+                if seq <= stats.checkpoint_seq:
+                    continue
+                if seq != stats.checkpoint_seq + 1:
+                    print(f"Missing stats checkpoint {stats.checkpoint_seq + 1}, ignoring {path} and later")
+                    break
+                with open(path, 'rb') as f:
+                    delta = pickle.load(f)
+                merge_counts(stats, **{key: delta[key] for key in COUNTS})
+                stats.fingerprints.extend(delta['fingerprints'], delta.get('removed_fingerprints', b''))
+                stats.checkpoint_seq = seq
+            stats.checkpoint_fingerprints = len(stats.fingerprints.fingerprints)
+            stats.checkpoint_removed = len(stats.fingerprints.removed)
+            return stats
+        except Exception as e:
+            print(f"Error loading stats: {e}")
+            return Stats(pages)
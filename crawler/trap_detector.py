@@ -0,0 +1,264 @@
+import os
+import re
+import json
+import time
+from collections import deque
+from threading import Lock
+
+from utils import get_logger, get_host
+from utils.simhash import hamming_distance
+
+OK = "ok"
+THROTTLED = "throttled"
+BLOCKED = "blocked"
+
+# Pages of one template whose fingerprints are this close have the same
+# content for the detector, even when they are too far apart to be near
+# duplicates of each other.
+SIMILAR_BITS = 12
+# Fingerprints of the latest pages of a template compared against
+RECENT_FINGERPRINTS = 16
+# Urls of a template quoted when explaining a decision
+EXAMPLES = 3
+# Url templates kept in memory at most. Templates are only tracked once one
+# of their urls was fetched, and past this many the least recently fetched
+# ones that are not throttled or blocked are forgotten.
+MAX_TEMPLATES = 20000
+
+_DATE = re.compile(r'(?:\d{4}-\d{1,2}(?:-\d{1,2})?|\d{1,2}-\d{1,2}-\d{4})$')
+_HEX = re.compile(r'[0-9a-f]{8,}$')
+_DIGITS = re.compile(r'\d+')
+
+
+def url_template(url):
+    ''' The template of a url: its host and path, with path segments that are
+    dates, hex strings or numbers replaced by {date}, {hex} and {n} (and
+    numbers inside other segments by {n}), and the query reduced to its sorted
+    parameter names. https://a.uci.edu/events/2020-01-31?page=3&sort=x is
+    a.uci.edu/events/{date}?page&sort. '''
+    url = url.split("#", 1)[0]
+    host = get_host(url)
+    rest = url[url.find("://") + 3 + len(host):] if "://" in url else url
+    path, _, query = rest.partition("?")
+    segments = []
+    for segment in path.split("/"):
+        lower = segment.lower()
+        if lower.isdigit():
+            segments.append("{n}")
+        elif _DATE.match(lower):
+            segments.append("{date}")
+        elif _HEX.match(lower) and not lower.isalpha():
+            segments.append("{hex}")
+        else:
+            segments.append(_DIGITS.sub("{n}", segment))
+    template = host.lower() + "/".join(segments)
+    if query:
+        template += "?" + "&".join(sorted({part.partition("=")[0] for part in query.split("&") if part}))
+    return template
+
+
+class _Template(object):
+    __slots__ = ('state', 'discovered', 'dropped', 'fetched', 'novel',
+                 'window_fetched', 'window_novel', 'recent', 'examples')
+
+    def __init__(self, state=OK, discovered=0, dropped=0, fetched=0, novel=0,
+                 window_fetched=0, window_novel=0, recent=(), examples=()):
+        self.state = state
+        self.discovered = discovered
+        self.dropped = dropped
+        self.fetched = fetched
+        self.novel = novel
+        self.window_fetched = window_fetched
+        self.window_novel = window_novel
+        self.recent = deque(recent, RECENT_FINGERPRINTS)
+        self.examples = list(examples)
+
+
+class TrapDetector(object):
+    ''' Online crawler-trap detection by url template.
+
+    Every url discovered or fetched is grouped under its url_template per
+    host. For each template the detector counts the fetched pages and how
+    many of them had novel content: they were merged into the stats as new
+    content, and their fingerprint is not within SIMILAR_BITS of the recent
+    pages of the template. Every `window` fetches of a template its yield
+    over the window is checked:
+
+        below block_yield     throttled, or blocked if it was throttled
+        below throttle_yield  throttled
+        otherwise             ok again (a blocked template stays blocked)
+
+    Only one in `throttle` new urls of a throttled template is admitted to
+    the frontier, and none of a blocked one. Every decision is logged with
+    its evidence to Logs/Traps.log and appended as a JSON line to the state
+    file at `path`; loading it replays the decisions. Counts of templates
+    that were never decided on are not kept across runs, and at most
+    `max_templates` are kept in memory. '''
+
+    def __init__(self, path, window=20, throttle_yield=0.3, block_yield=0.1, throttle=10,
+                 max_templates=MAX_TEMPLATES):
+        self.logger = get_logger("TRAPS", "Traps")
+        self.path = path
+        self.window = window
+        self.throttle_yield = throttle_yield
+        self.block_yield = block_yield
+        self.throttle = throttle
+        self.max_templates = max_templates
+        self.lock = Lock()
+        self.templates = dict()
+        self.events = list()
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                text = f.read()
+        except OSError as e:
+            self.logger.error(f"Could not read trap state {self.path}, starting over: {e}")
+            return
+        events = list()
+        try:
+            state = json.loads(text)
+        except ValueError:
+            state = None
+        if isinstance(state, dict):
+            # A state file from before decisions were appended: keep its
+            # decisions, in the new format
+            events = state["events"]
+            self._rewrite(events)
+        else:
+            for number, line in enumerate(text.splitlines(), 1):
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # A line cut short by a crash
+                    self.logger.error(f"Skipping unreadable line {number} of {self.path}.")
+        for event in events:
+            counts = self.templates.get(event["template"]) or _Template()
+            counts.state = event["to"]
+            counts.discovered, counts.fetched, counts.novel = event["discovered"], event["fetched"], event["novel"]
+            counts.examples = list(event["examples"])
+            self.templates[event["template"]] = counts
+        self.events = events
+        blocked = sum(template.state == BLOCKED for template in self.templates.values())
+        throttled = sum(template.state == THROTTLED for template in self.templates.values())
+        self.logger.info(
+            f"Loaded {len(events)} decisions on {len(self.templates)} url templates, "
+            f"{blocked} blocked and {throttled} throttled.")
+
+    def _rewrite(self, events):
+        temp = self.path + ".tmp"
+        with open(temp, "w") as f:
+            for event in events:
+                f.write(json.dumps(event) + "\n")
+        os.replace(temp, self.path)
+
+    def _append(self, event):
+        # Called with the lock held; decisions are rare.
+        try:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(event) + "\n")
+        except OSError as e:
+            self.logger.error(f"Error writing trap state {self.path}: {e}")
+
+    def _template(self, url):
+        # The counts of the template of a fetched url, as the most recently
+        # fetched template. Must be called with the lock held.
+        template = url_template(url)
+        counts = self.templates.pop(template, None)
+        if counts is None:
+            counts = _Template()
+            self._evict()
+        self.templates[template] = counts
+        return template, counts
+
+    def _evict(self):
+        # Make room for one more template by forgetting the least recently
+        # fetched one that is ok. Throttled and blocked ones are kept.
+        if len(self.templates) < self.max_templates:
+            return
+        for template, counts in self.templates.items():
+            if counts.state == OK:
+                del self.templates[template]
+                return
+
+    def admit(self, url):
+        ''' Whether a newly discovered url may go into the frontier. '''
+        with self.lock:
+            counts = self.templates.get(url_template(url))
+            if counts is None:
+                return True
+            counts.discovered += 1
+            if counts.state == OK or (counts.state == THROTTLED and counts.discovered % self.throttle == 0):
+                return True
+            counts.dropped += 1
+            return False
+
+    def blocked(self, url):
+        ''' Whether the url belongs to a blocked template, for urls that were
+        queued before the template was blocked. '''
+        counts = self.templates.get(url_template(url))
+        return counts is not None and counts.state == BLOCKED
+
+    def record(self, url, fingerprint, merged):
+        ''' Count a fetched url. merged is whether the page was merged into
+        the stats as new content, and fingerprint its SimHash, None for pages
+        too short to have one; those count as novel if they were merged. '''
+        with self.lock:
+            template, counts = self._template(url)
+            novel = merged and (fingerprint is None or all(
+                hamming_distance(fingerprint, recent) > SIMILAR_BITS for recent in counts.recent))
+            if merged and fingerprint is not None:
+                counts.recent.append(fingerprint)
+            counts.fetched += 1
+            counts.window_fetched += 1
+            if novel:
+                counts.novel += 1
+                counts.window_novel += 1
+            if len(counts.examples) < EXAMPLES:
+                counts.examples.append(url)
+            if counts.window_fetched >= self.window:
+                self._decide(template, counts)
+
+    def _decide(self, template, counts):
+        # Check the yield of a full window. Returns whether the state changed.
+        window_yield = counts.window_novel / counts.window_fetched
+        if counts.state == BLOCKED:
+            state = BLOCKED
+        elif window_yield < self.block_yield:
+            state = BLOCKED if counts.state == THROTTLED else THROTTLED
+        elif window_yield < self.throttle_yield:
+            state = THROTTLED
+        else:
+            state = OK
+        event = {
+            "time": time.time(), "template": template, "from": counts.state, "to": state,
+            "window_novel": counts.window_novel, "window_fetched": counts.window_fetched,
+            "discovered": counts.discovered, "fetched": counts.fetched, "novel": counts.novel,
+            "examples": list(counts.examples)}
+        previous, counts.state = counts.state, state
+        counts.window_fetched = counts.window_novel = 0
+        if state == previous:
+            return False
+        self.events.append(event)
+        self._append(event)
+        self.logger.info(self.explain(event))
+        return True
+
+    def explain(self, event):
+        ''' A decision in words. '''
+        evidence = (
+            f"{event['window_novel']} of its last {event['window_fetched']} fetched pages "
+            f"({event['window_novel'] / event['window_fetched']:.0%}) had novel content; "
+            f"{event['discovered']} urls discovered, {event['fetched']} fetched and "
+            f"{event['novel']} novel so far. Examples: {', '.join(event['examples'])}")
+        if event["to"] == BLOCKED:
+            action = (f"Blocked {event['template']}: still below {self.block_yield:.0%} while throttled, "
+                      f"its urls are skipped from now on")
+        elif event["to"] == THROTTLED:
+            action = (f"Throttled {event['template']}: below {self.throttle_yield:.0%}, "
+                      f"admitting 1 in {self.throttle} of its new urls")
+        else:
+            action = f"Released {event['template']}: yield recovered to {self.throttle_yield:.0%} or more"
+        return f"{action}. {evidence}"
@@ -1,15 +1,20 @@
+import time
 from threading import Thread
 
 from inspect import getsource
 from utils.download import download
 from utils import get_logger
+from utils.log import events
+from utils.metrics import metrics
 import scraper
-import time
+
+DOWNLOADED = "Downloaded {url}, status <{status}>, using cache {cache}, connect {connect_ms:.1f}ms."
 
 
 class Worker(Thread):
     def __init__(self, worker_id, config, frontier, stats, stopwords, crawler=None):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
+        self.worker_id = worker_id
         self.config = config
         self.frontier = frontier
         self.stats = stats
@@ -18,8 +23,32 @@ class Worker(Thread):
         # basic check for requests in scraper
         assert {getsource(scraper).find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
         assert {getsource(scraper).find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, "Do not use urllib.request in scraper.py"
-        super().__init__(daemon=True)
+        super().__init__(daemon=True, name=f"Worker-{worker_id}")
         
+    def _next_url(self):
+        ''' The next url to process, or None once the worker should stop.
+        While the autoscaler has more workers than it wants active, this
+        worker may park here first. '''
+        scaler = self.crawler.scaler if self.crawler is not None else None
+        if scaler is not None and not scaler.wait_active(self.worker_id):
+            return None
+        # Time parked does not count as waiting for a url
+        self.waiting_since = time.perf_counter()
+        with metrics.timer("wait"):
+            tbd_url = self.frontier.get_tbd_url()
+        if not tbd_url:
+            self.logger.info("Frontier is empty. Stopping Crawler.")
+            if scaler is not None:
+                # Parked workers stop too
+                scaler.finish()
+        return tbd_url
+
+    def _observe(self, started, fetch, parse, status):
+        # Report a page processed since `started` to the autoscaler
+        if self.crawler is not None and self.crawler.scaler is not None:
+            self.crawler.scaler.observe(
+                started - self.waiting_since, time.perf_counter() - started, fetch, parse, status)
+
     def run(self):
         while True:
             # Check for shutdown signal
@@ -27,16 +56,37 @@ class Worker(Thread):
                 self.logger.info("Shutdown signal received. Stopping worker.")
                 break
 
-            tbd_url = self.frontier.get_tbd_url()
+            tbd_url = self._next_url()
             if not tbd_url:
-                self.logger.info("Frontier is empty. Stopping Crawler.")
                 break
-            resp = download(tbd_url, self.config, self.logger)
-            self.logger.info(
-                f"Downloaded {tbd_url}, status <{resp.status}>, "
-                f"using cache {self.config.cache_server}.")
-            scraped_urls = scraper.scraper(tbd_url, resp, self.stats, self.stopwords)
-            for scraped_url in scraped_urls:
-                self.frontier.add_url(scraped_url)
-            self.frontier.mark_url_complete(tbd_url)
-            time.sleep(self.config.time_delay)
+            started = time.perf_counter()
+            fingerprint = None
+            merged = False
+            status = None
+            fetch = parse = 0.0
+            try:
+                with metrics.timer("download", tbd_url):
+                    resp = download(tbd_url, self.config, self.logger)
+                fetch = time.perf_counter() - started
+                status = resp.status
+                metrics.count(f"status_{resp.status}", tbd_url)
+                events.log(
+                    self.logger, "download", DOWNLOADED, key=resp.status, url=tbd_url, status=resp.status,
+                    cache=self.config.cache_server, connect_ms=resp.connect_time * 1000)
+                if self.crawler is not None and self.crawler.store is not None:
+                    with metrics.timer("store", tbd_url):
+                        self.crawler.store.add(tbd_url, resp)
+                cpu = time.thread_time()
+                with metrics.timer("scrape", tbd_url):
+                    scraped_urls, fingerprint, merged = scraper.scrape(tbd_url, resp, self.stats, self.stopwords)
+                parse = time.thread_time() - cpu
+                with metrics.timer("frontier_add"):
+                    self.frontier.add_urls(scraped_urls, tbd_url)
+            except Exception as e:
+                metrics.count("error", tbd_url)
+                self.logger.error(f"Error processing {tbd_url}: {e}")
+            # Politeness is enforced per host by the frontier, which only hands
+            # out this host again once the url is marked complete.
+            with metrics.timer("frontier_complete"):
+                self.frontier.mark_url_complete(tbd_url, fingerprint, merged)
+            self._observe(started, fetch, parse, status)
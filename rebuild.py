@@ -0,0 +1,88 @@
+from configparser import ConfigParser
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import sys
+import time
+
+import scraper
+from utils.config import Config
+from crawler.stats import Stats
+from crawler.aggregator import StatsShard
+from crawler.page_store import PageStore
+from launch import _get_stop_words
+
+# Pages merged into a shard before it is merged into the Stats
+MERGE_PAGES = 500
+# Store and stopwords of the pool processes, set once by _init_process.
+_store = None
+_stopwords = None
+
+
+def _init_process(directory, stopwords):
+    global _store, _stopwords
+    _store = PageStore(directory, readonly=True)
+    _stopwords = stopwords
+
+
+def _analyze(location):
+    # Runs in the pool processes: reads, decompresses and analyzes a page.
+    page = _store.read(location)
+    if page.status != 200:
+        return page.url, None
+    return page.url, scraper.analyze_page(page.url, page.final_url, page.content, _stopwords)
+
+
+def main(config_file, store_dir, output_dir, processes, page_files):
+    # Rebuilds the stats and the final report from the page store, without
+    # crawling. Pages are merged in the order they were stored.
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    config = Config(cparser)
+    store_dir = os.path.abspath(store_dir or config.page_store_dir)
+    if not os.path.isdir(store_dir):
+        print(f"No page store found ({store_dir})")
+        sys.exit(1)
+    stopwords = _get_stop_words()
+    # Opened for writing once, to rebuild its index if the crawl did not close it
+    PageStore(store_dir).close()
+    store = PageStore(store_dir, readonly=True)
+
+    os.makedirs(output_dir, exist_ok=True)
+    os.chdir(output_dir)
+    Stats.remove_files()
+    stats = Stats.load(config.seen_capacity, config.seen_error_rate)
+    # Pages are merged into a shard, as by the workers, and the shard into
+    # the interned Stats
+    shard = StatsShard(stats)
+    start = time.perf_counter()
+    pages = 0
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("fork"),
+                             initializer=_init_process, initargs=(store_dir, stopwords)) as pool:
+        for url, page in pool.map(_analyze, store.locations(), chunksize=64):
+            if page is not None:
+                scraper.merge_page(url, page, shard)
+            pages += 1
+            if pages % MERGE_PAGES == 0:
+                stats.merge(shard.drain())
+    stats.merge(shard.drain())
+    store.close()
+    print(f"Rebuilt the stats from {pages} stored pages with {processes} processes "
+          f"in {time.perf_counter() - start:.1f}s")
+    stats.save()
+    stats.save_final_report(page_files or config.report_page_files)
+    stats.pages.close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--store", type=str, default=None, help="page store directory, default PAGESTOREDIR")
+    parser.add_argument("--output", type=str, default="rebuilt",
+                        help="directory for the rebuilt stats and report")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--page_files", action="store_true", default=False,
+                        help="write page listings to .ndjson files next to the report")
+    args = parser.parse_args()
+    main(args.config_file, args.store, args.output, args.processes, args.page_files)
@@ -0,0 +1,4 @@
+from replay.response import raw_response
+from replay.site import SyntheticSite
+from replay.corpus import Corpus, CorpusWriter
+from replay.server import ReplayServer
@@ -0,0 +1,74 @@
+"""Serve a synthetic site or a recorded corpus in place of the cache server.
+
+Run from the repository root, then set HOST/PORT in the config to the
+printed address and OFFLINE = true:
+    python -m replay --port 9000 --pages 10000 --hosts 20 --latency 0.05
+    python -m replay --port 9000 --corpus recorded/
+Write the documents of a synthetic site out as a corpus:
+    python -m replay --pages 1000 --save_corpus recorded/
+"""
+from argparse import ArgumentParser
+
+from replay import SyntheticSite, Corpus, CorpusWriter, ReplayServer
+from replay.site import TRAPS
+
+
+def save_corpus(site, directory):
+    writer = CorpusWriter(directory)
+    try:
+        for url in site.seed_urls() + [site.doc_url(n) for n in range(site.pages)]:
+            writer.add(url, *site.get(url))
+    finally:
+        writer.close()
+
+
+def main(args):
+    if args.corpus and args.save_corpus:
+        raise SystemExit("--save_corpus writes a synthetic site, not a corpus")
+    if args.corpus:
+        source = Corpus(args.corpus)
+    else:
+        source = SyntheticSite(
+            pages=args.pages, hosts=args.hosts, fanout=args.fanout, words=args.words,
+            error_rate=args.error_rate, trap_rate=args.trap_rate, traps=args.traps, seed=args.seed,
+            revision=args.revision, change_rate=args.change_rate)
+    if args.save_corpus:
+        save_corpus(source, args.save_corpus)
+        print(f"Saved {source.pages} documents to {args.save_corpus}")
+        return
+    server = ReplayServer(
+        source, args.host, args.port, args.latency, args.jitter, args.cache_error_rate, args.capacity)
+    host, port = server.address
+    print(f"Serving on {host}:{port}, seed urls: {','.join(source.seed_urls())}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(f"Served {server.counts}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--corpus", type=str, default=None, help="serve this recorded corpus")
+    parser.add_argument("--save_corpus", type=str, default=None, help="write the site to a corpus and exit")
+    parser.add_argument("--pages", type=int, default=10000)
+    parser.add_argument("--hosts", type=int, default=20)
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--words", type=int, default=300)
+    parser.add_argument("--error_rate", type=float, default=0.01)
+    parser.add_argument("--trap_rate", type=float, default=0.02)
+    parser.add_argument("--traps", nargs="*", choices=TRAPS, default=list(TRAPS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--revision", type=int, default=0, help="version of the site to serve")
+    parser.add_argument("--change_rate", type=float, default=0.0,
+                        help="share of the documents changed by every revision")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.5, help="share of the latency it varies by")
+    parser.add_argument("--cache_error_rate", type=float, default=0.0, help="share of requests answered 503")
+    parser.add_argument("--capacity", type=int, default=0,
+                        help="requests waiting out their latency at once, 0 for any number")
+    main(parser.parse_args())
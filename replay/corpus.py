@@ -0,0 +1,57 @@
+import os
+import json
+from hashlib import sha256
+
+INDEX_FILE = "index.ndjson"
+
+
+class Corpus(object):
+    ''' Recorded pages served by the replay server.
+
+    A corpus is a directory with an index.ndjson file, one
+    {"url", "status", "file", "content_type"} object per line, and the page
+    bodies in the files it names (relative to the directory). Urls that are
+    not in the index get a 404. '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index = dict()
+        with open(os.path.join(directory, INDEX_FILE), encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.index[entry["url"]] = entry
+
+    def seed_urls(self):
+        return list(self.index)[:1]
+
+    def get(self, url):
+        ''' (status, content, content type) of url. '''
+        entry = self.index.get(url)
+        if entry is None:
+            return 404, None, None
+        content = None
+        if entry.get("file"):
+            with open(os.path.join(self.directory, entry["file"]), "rb") as f:
+                content = f.read()
+        return entry.get("status", 200), content, entry.get("content_type", "text/html")
+
+
+class CorpusWriter(object):
+    ''' Writes pages in the Corpus format. '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, "pages"), exist_ok=True)
+        self.index = open(os.path.join(directory, INDEX_FILE), "a", encoding="utf-8")
+
+    def add(self, url, status, content, content_type="text/html"):
+        entry = {"url": url, "status": status, "file": None, "content_type": content_type}
+        if content is not None:
+            entry["file"] = os.path.join("pages", sha256(url.encode("utf-8")).hexdigest())
+            with open(os.path.join(self.directory, entry["file"]), "wb") as f:
+                f.write(content)
+        self.index.write(json.dumps(entry) + "\n")
+
+    def close(self):
+        self.index.close()
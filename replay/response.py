@@ -0,0 +1,16 @@
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+def raw_response(url, content, headers=None, status_code=200):
+    ''' What the replay server pickles into the "response" field of its
+    replies: a requests.Response like the one the real cache server
+    pickles, so the crawler unpickles and sniffs it the same way and does
+    not need this package to do so. '''
+    raw = requests.Response()
+    raw._content = content
+    raw.status_code = status_code
+    raw.headers = CaseInsensitiveDict(
+        headers if headers is not None else {"Content-Type": "text/html; charset=utf-8"})
+    raw.url = url
+    return raw
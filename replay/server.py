@@ -0,0 +1,108 @@
+import time
+import pickle
+import random
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import cbor
+
+from replay.response import raw_response
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real cache server, so the crawler's pooled
+    # connections get reused.
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server.replay
+        query = parse_qs(urlsplit(self.path).query)
+        url = query.get("q", [""])[0]
+        if not url or not query.get("u"):
+            self._reply(400, b"")
+            return
+        if server.latency:
+            server.wait()
+        if server.cache_error_rate and random.random() < server.cache_error_rate:
+            server.count("cache_errors")
+            self._reply(503, b"")
+            return
+        status, content, content_type = server.source.get(url)
+        server.count("requests")
+        if status == 200 and content is not None:
+            raw = raw_response(url, content, {"Content-Type": content_type or "text/html"})
+            envelope = {"url": url, "status": status, "response": pickle.dumps(raw)}
+        else:
+            server.count("errors")
+            envelope = {"url": url, "status": status, "error": f"Replay status {status} for {url}"}
+        self._reply(200, cbor.dumps(envelope))
+
+    def _reply(self, code, body):
+        self.send_response(code)
+        self.send_header("Content-Type", "application/cbor")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer(object):
+    ''' Local stand-in for the cache server: answers GET /?q=<url>&u=<agent>
+    with the same CBOR envelope, holding a pickled requests.Response, for
+    pages of `source` (a SyntheticSite or a Corpus).
+
+    Every request waits `latency` seconds, give or take `jitter` of it, and
+    a share `cache_error_rate` of requests get an HTTP 503 instead, as when
+    the cache server is overloaded. With a `capacity`, only that many
+    requests wait out their latency at once and the others queue for a
+    turn, so latency grows with the number of requests in flight. '''
+
+    def __init__(self, source, host="127.0.0.1", port=0, latency=0.0, jitter=0.5, cache_error_rate=0.0,
+                 capacity=0):
+        self.source = source
+        self.latency = latency
+        self.jitter = jitter
+        self.slots = threading.Semaphore(capacity) if capacity else None
+        self.cache_error_rate = cache_error_rate
+        self.counts = {"requests": 0, "errors": 0, "cache_errors": 0}
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.replay = self
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.httpd.server_address[:2]
+
+    def delay(self):
+        return random.uniform(self.latency * (1 - self.jitter), self.latency * (1 + self.jitter))
+
+    def wait(self):
+        if self.slots is None:
+            time.sleep(self.delay())
+            return
+        with self.slots:
+            time.sleep(self.delay())
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def start(self):
+        ''' Serve in a background thread and return the (host, port). '''
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.address
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
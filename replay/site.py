@@ -0,0 +1,170 @@
+import re
+import random
+from itertools import accumulate
+
+# Hosts of the default seed urls in config.ini come first, so a crawl with
+# the stock config finds the site.
+DEFAULT_HOSTS = ["www.ics.uci.edu", "www.cs.uci.edu", "www.informatics.uci.edu", "www.stat.uci.edu"]
+TRAPS = ("calendar", "pagination", "hash", "query")
+
+_DOC = re.compile(r"/doc/(\d+)$")
+_CALENDAR = re.compile(r"/calendar/(\d{4})-(\d{2})-(\d{2})$")
+_PAGINATION = re.compile(r"/list/page/(\d+)$")
+_HASH = re.compile(r"/tree/([0-9a-f]{40})$")
+_QUERY = re.compile(r"/search\?page=(\d+)&sort=(\w+)$")
+
+
+class SyntheticSite(object):
+    ''' A generated site graph for the replay server.
+
+    `pages` documents at https://<host>/doc/<n> are spread round robin over
+    `hosts` hosts; the root of each host serves its first document. Every
+    document has `words` words drawn from a Zipf-like vocabulary and
+    `fanout` links to other documents. A share `error_rate` of documents
+    answer 404 or 500, and a share `trap_rate` also link into one of the
+    crawler traps in `traps`, each an infinite url space:
+
+        calendar    /calendar/YYYY-MM-DD, linking to the next and previous day
+        pagination  /list/page/N, linking to page N + 1
+        hash        /tree/<40 hex digits>, linking to three new hashes
+        query       /search?page=N&sort=K, linking to more pages and sorts
+
+    Pages are generated from the url and `seed` alone, so the same site is
+    served on every run without keeping it in memory.
+
+    `revision` is the version of the site served: from one revision to the
+    next, a share `change_rate` of the documents get a new text, with the
+    same links and topic. '''
+
+    def __init__(self, pages=10000, hosts=20, fanout=10, words=300, vocabulary=20000,
+                 error_rate=0.01, trap_rate=0.02, traps=TRAPS, seed=0, domain="ics.uci.edu",
+                 revision=0, change_rate=0.0):
+        self.pages = pages
+        self.fanout = fanout
+        self.words = words
+        self.error_rate = error_rate
+        self.trap_rate = trap_rate
+        self.traps = tuple(traps)
+        self.seed = seed
+        self.revision = revision
+        self.change_rate = change_rate
+        extra = [f"h{i}.{domain}" for i in range(max(0, hosts - len(DEFAULT_HOSTS)))]
+        self.hosts = (DEFAULT_HOSTS + extra)[:hosts]
+        self.host_index = {host: i for i, host in enumerate(self.hosts)}
+        rng = random.Random(seed)
+        self.vocabulary = [
+            "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 10)))
+            for _ in range(vocabulary)]
+        self.cum_weights = list(accumulate(1.0 / (rank + 1) for rank in range(vocabulary)))
+
+    def seed_urls(self):
+        return [f"https://{host}" for host in self.hosts]
+
+    def doc_url(self, n):
+        return f"https://{self.hosts[n % len(self.hosts)]}/doc/{n}"
+
+    def is_document(self, url):
+        ''' Whether url is one of the documents (or a host root), rather than
+        a trap page. '''
+        host, _, path = url.partition("://")[2].partition("/")
+        match = _DOC.match("/" + path)
+        return host in self.host_index and (not path or match is not None)
+
+    def _rng(self, key):
+        return random.Random(f"{self.seed}:{key}")
+
+    def _text(self, rng, count, topic=0):
+        # Zipf-like word ranks, shifted by the topic so that documents on
+        # different topics have different frequent words and are not near
+        # duplicates of each other.
+        vocabulary, size = self.vocabulary, len(self.vocabulary)
+        ranks = rng.choices(range(size), cum_weights=self.cum_weights, k=count)
+        return " ".join(vocabulary[(rank + topic) % size] for rank in ranks)
+
+    def _html(self, title, text, links):
+        anchors = "\n".join(f'<li><a href="{link}">{link.rsplit("/", 1)[-1]}</a></li>' for link in links)
+        return (f"<html><head><title>{title}</title></head><body><h1>{title}</h1>"
+                f"<p>{text}</p><ul>\n{anchors}\n</ul></body></html>").encode("utf-8")
+
+    def _doc(self, n):
+        rng = self._rng(n)
+        if rng.random() < self.error_rate:
+            return rng.choice((404, 500)), None
+        links = [self.doc_url(rng.randrange(self.pages)) for _ in range(self.fanout)]
+        if self.traps and rng.random() < self.trap_rate:
+            links.append(self._trap_entry(rng, self.hosts[n % len(self.hosts)]))
+        topic = rng.randrange(len(self.vocabulary))
+        revision = self._revision(n)
+        if revision:
+            rng = self._rng(f"{n}@{revision}")
+        text = self._text(rng, self.words, topic)
+        return 200, self._html(f"Document {n}", text, links)
+
+    def _revision(self, n):
+        # The last revision up to self.revision that changed document n
+        for revision in range(self.revision, 0, -1):
+            if self._rng(f"{n}@{revision}").random() < self.change_rate:
+                return revision
+        return 0
+
+    def _trap_entry(self, rng, host):
+        trap = rng.choice(self.traps)
+        if trap == "calendar":
+            return f"https://{host}/calendar/{rng.randint(2000, 2030)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        if trap == "pagination":
+            return f"https://{host}/list/page/1"
+        if trap == "hash":
+            return f"https://{host}/tree/{rng.getrandbits(160):040x}"
+        return f"https://{host}/search?page=1&sort=date"
+
+    def _trap(self, host, path):
+        # Trap pages are nearly identical, like the real thing: a text shared
+        # by the whole trap on the host plus a few words of their own.
+        rng = self._rng(host + path)
+        kind = path.split("/", 2)[1].split("?")[0]
+        text = self._text(self._rng(host + kind), 40) + " " + self._text(rng, 3)
+        match = _CALENDAR.match(path)
+        if match:
+            year, month, day = (int(part) for part in match.groups())
+            links = [f"https://{host}/calendar/{year + (month == 12 and day == 28):04d}-"
+                     f"{month % 12 + 1 if day == 28 else month:02d}-{day % 28 + 1:02d}",
+                     f"https://{host}/calendar/{year:04d}-{month:02d}-{max(1, day - 1):02d}"]
+            return self._html(f"Events on {year}-{month:02d}-{day:02d}", text, links)
+        match = _PAGINATION.match(path)
+        if match:
+            page = int(match.group(1))
+            return self._html(f"Listing page {page}", text,
+                              [f"https://{host}/list/page/{page + 1}"])
+        match = _HASH.match(path)
+        if match:
+            return self._html(f"Tree {match.group(1)}", text,
+                              [f"https://{host}/tree/{rng.getrandbits(160):040x}" for _ in range(3)])
+        match = _QUERY.match(path)
+        if match:
+            page = int(match.group(1))
+            return self._html(f"Search results {page}", text,
+                              [f"https://{host}/search?page={page + 1}&sort={sort}"
+                               for sort in ("date", "name", "size")])
+        return None
+
+    def get(self, url):
+        ''' (status, content, content type) of url. '''
+        scheme, _, rest = url.partition("://")
+        host, slash, path = rest.partition("/")
+        index = self.host_index.get(host)
+        if scheme not in ("http", "https") or index is None:
+            return 404, None, None
+        path = slash + path
+        if path in ("", "/"):
+            path = f"/doc/{index}"
+        match = _DOC.match(path)
+        if match:
+            n = int(match.group(1))
+            if n >= self.pages or n % len(self.hosts) != index:
+                return 404, None, None
+            status, content = self._doc(n)
+            return status, content, "text/html" if content is not None else None
+        content = self._trap(host, path) if self.traps else None
+        if content is None:
+            return 404, None, None
+        return 200, content, "text/html"
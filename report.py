@@ -0,0 +1,31 @@
+from configparser import ConfigParser
+from argparse import ArgumentParser
+import os
+import sys
+
+from utils.config import Config
+from crawler.stats import Stats
+
+
+def main(config_file, output, page_files):
+    # Rebuilds the final report from the saved stats, without crawling.
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    config = Config(cparser)
+
+    if not os.path.exists(Stats.SAVE_FILE) and not Stats.delta_files():
+        print(f"No saved stats found ({Stats.SAVE_FILE})")
+        sys.exit(1)
+    stats = Stats.load(config.seen_capacity, config.seen_error_rate)
+    stats.save_final_report(page_files or config.report_page_files, output)
+    stats.pages.close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--output", type=str, default=Stats.FINAL_REPORT)
+    parser.add_argument("--page_files", action="store_true", default=False,
+                        help="write page listings to .ndjson files next to the report")
+    args = parser.parse_args()
+    main(args.config_file, args.output, args.page_files)
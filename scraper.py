@@ -1,9 +1,16 @@
 import re
-from urllib.parse import urlparse, urljoin, urldefrag
-from bs4 import BeautifulSoup
+import time
+import logging
+from urllib.parse import urlparse, urldefrag
+from utils.parse import parse_html
 from utils.tokenize import tokenize_text
-import json
+from utils.simhash import simhash
+from utils.url_filter import UrlFilter
+from utils.metrics import metrics
+from utils import get_logger
+from utils.log import events
 from datetime import datetime
+from collections import namedtuple
 
 
 # Skip blocked domains and domain+path combinations
@@ -14,61 +21,178 @@ blocked_domains = {"transformativeplay.ics.uci.edu", "tron.lom.ics.uci.edu",
                    "checkmate.ics.uci.edu", "tippersweb.ics.uci.edu"}
 blocked_paths = {"ics.uci.edu/people/", "www.ics.uci.edu/~eppstein/gina/", "www.ics.uci.edu/~wjohnson/"}
 
-def save_stats_log(stats, url):
-    log_entry = {
-        'pages_scraped': len(stats.pages),
-        # 'pages': list(stats.pages),
-        # 'subdomains': {subdomain: list(pages) for subdomain, pages in stats.subdomains.items()},
-        # 'tokens': dict(stats.tokens),
-        'longest_page_words': stats.longest_length
-    }
-
-    with open('logs/Stats.log', 'w') as f:
-        json.dump(log_entry, f, indent=2)
+allowed_domains = ["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu"]
+
+# Path rules, checked against the lowercased path in a single regex pass
+path_patterns = [
+    # date avoiding
+    ("date_slash", r'/\d{4}/\d{1,2}(?:/\d{1,2})?'),
+    ("date_hyphen", r'\d{4}-\d{1,2}(?:-\d{1,2})?'),
+    # Patterns: /page/2, /p/3, /news/page/2, etc.
+    ("pagination", r'/(?:page|p)/\d+/?'),
+    # Detect Git repository paths with commit hashes (crawler traps)
+    ("git_hash", r'/(?:tree|commit|blob|raw)s?/[a-f0-9]{30,}'),
+    # Detect any URL with very long hexadecimal strings (likely identifiers/hashes)
+    # is this necessary?
+    ("long_hex", r'/[a-f0-9]{32,}'),
+    # Skip image gallery paths
+    ("gallery", r'/(?:pix|photos|gallery|galleries|images|pics)/'),
+    ("extension", r"\.(?:css|js|bmp|gif|jpe?g|ico"
+        + r"|png|tiff?|mid|mp2|mp3|mp4"
+        + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+        + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+        + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+        + r"|epub|dll|cnf|tgz|sha1"
+        + r"|thmx|mso|arff|rtf|jar|csv"
+        + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$"),
+    # Match patterns like: /r123.html, /paper456.php, /item789.aspx
+    # Allow up to 50 numbered items per pattern
+    # maybe allow this?
+    ("numbered_file", r'/([a-z]+)(\d+)\.(?:html?|php|aspx?)$',
+        lambda match: int(match.group(2)) > 50),
+]
+
+url_filter = UrlFilter(
+    allowed_domains, blocked_domains, blocked_paths,
+    # Skip paths with single dash segment (/-/) and dokuwiki pages
+    path_substrings=['/-/', '/doku.php/'],
+    path_patterns=path_patterns,
+    # every path pattern starts with one of these
+    path_pattern_lead=r'/.\d')
+
+# Pages with fewer words than this are not checked for near duplicates
+# (their fingerprints are too unstable, e.g. frame or redirect pages)
+MIN_FINGERPRINT_WORDS = 20
 
 def scraper(url, resp, stats, stopwords):
-    if resp.status != 200:
-        return []
-
-    links = extract_next_links(url, resp)
-
-    soup = BeautifulSoup(resp.raw_response.content, 'lxml')
-
-    # Extract text content from HTML and tokenize (skipping stopwords)
-    text_content = soup.get_text(separator = ' ', strip = True)
+    return scrape(url, resp, stats, stopwords)[0]
 
-    # Count total words (including stopwords) for longest page tracking
-    words = text_content.split()
-    word_count = len([word for word in words if word])
-    if word_count > stats.longest_length:
-        stats.longest_length = word_count
-
-    # Tokenize and merge token frequencies into global stats (excluding stopwords)
-    tokens = tokenize_text(text_content, stopwords)
-    for token, count in tokens.items():
-        stats.tokens[token] += count
-
-    # Track subdomain for successfully crawled pages
+def scrape(url, resp, stats, stopwords):
+    # scraper() that also returns the fingerprint of the page (None if it
+    # was too short to fingerprint) and whether it added new content to the
+    # stats, for the frontier's trap detector
+    if resp.status != 200:
+        return [], None, False
+
+    content, visit = revisit(url, resp, stats)
+    if visit is not None and visit.unchanged:
+        # Its links and tokens are in from when it was recorded
+        return [], visit.previous.fingerprint, visit.previous.merged
+    page = analyze_page(url, resp.url, content, stopwords)
+    return merge_page(url, page, stats, visit)
+
+def revisit(url, resp, stats):
+    # The page body, and its PageVisit if the frontier keeps page records
+    # (None otherwise). A page that did not change since it was recorded is
+    # not parsed nor merged again.
+    content = page_content(url, resp)
+    records = getattr(stats, 'records', None)
+    if records is None or content is None:
+        return content, None
+    return content, records.visit(url, resp, content)
+
+# What analyze_page found out about a page. Small and picklable, so pages
+# can be analyzed in other processes and merged into the stats here. cpu is
+# the thread CPU time the analysis took.
+PageAnalysis = namedtuple('PageAnalysis', ['links', 'word_count', 'tokens', 'fingerprint', 'cpu'], defaults=(0.0,))
+
+def analyze_page(url, base_url, content, stopwords):
+    # CPU-heavy part of scraping: parse the page once for both its links and
+    # its text content, count words, tokenize and fingerprint it.
+    # Does not touch stats.
+    start = time.thread_time()
+    with metrics.timer("parse", url):
+        links, text_content = parse_content(url, base_url, content)
+
+    with metrics.timer("tokenize", url):
+        # Count total words (including stopwords) for longest page tracking
+        words = text_content.split()
+        word_count = len([word for word in words if word])
+
+        # Tokenize (excluding stopwords)
+        tokens = tokenize_text(text_content, stopwords)
+
+    with metrics.timer("fingerprint", url):
+        fingerprint = simhash(tokens) if word_count >= MIN_FINGERPRINT_WORDS else None
+    return PageAnalysis(links, word_count, tokens, fingerprint, time.thread_time() - start)
+
+def merge_page(url, page, stats, visit=None):
+    # Merge an analyzed page into stats and return its links to crawl, its
+    # fingerprint and whether it was merged as new content.
+    # Skip near duplicates of pages we already have (calendars, revisions,
+    # listings): no stats merging and no link expansion for them
+    # stats is usually the worker's StatsShard; its lock keeps the page from
+    # being split across two merges into the global Stats
+    # visit is the PageVisit of a page the frontier keeps records of. A
+    # changed page that was merged before is merged as an update: its old
+    # tokens are taken out, its old fingerprint makes way for the new one,
+    # and it is not checked for near duplicates, as it would match its own
+    # old fingerprint. A changed page that was a near duplicate is checked
+    # again, but counted once per url: as fingerprinted, and as a duplicate
+    # for as long as it still is one.
+    start = time.thread_time()
+    previous = visit.previous if visit is not None else None
+    update = previous is not None and previous.merged
+    was_duplicate = previous is not None and not previous.merged
+    old_tokens = stats.records.tokens(previous) if update else None
     parsed_url = urlparse(url)
-    if parsed_url.netloc.endswith('.uci.edu') or parsed_url.netloc == 'uci.edu':
-        subdomain = parsed_url.netloc
-        # Remove fragment from URL for unique page tracking
-        page_url = urldefrag(url)[0]
-
-        # Add this page to the subdomain's unique pages
-        stats.subdomains[subdomain].add(page_url)
-
-    # Save stats to log after processing this page
-    save_stats_log(stats, url)
+    duplicate = False
+    with stats.lock, metrics.timer("merge", url):
+        if update:
+            with stats.fingerprints.lock:
+                if previous.fingerprint is not None:
+                    stats.fingerprints.remove(previous.fingerprint)
+                if page.fingerprint is not None:
+                    stats.fingerprints.add(page.fingerprint)
+        elif page.fingerprint is not None:
+            if not was_duplicate:
+                stats.fingerprinted[parsed_url.netloc] += 1
+            if stats.fingerprints.find_or_add(page.fingerprint) is not None:
+                if not was_duplicate:
+                    stats.duplicates[parsed_url.netloc] += 1
+                metrics.count("near_duplicate", url)
+                duplicate = True
+        if was_duplicate and not duplicate:
+            stats.duplicates[parsed_url.netloc] -= 1
+
+        if not duplicate:
+            # Longest page counts every version of a page
+            if page.word_count > stats.longest_length:
+                stats.longest_length = page.word_count
+
+            # Merge token frequencies into the worker's stats
+            for token, count in page.tokens.items():
+                stats.tokens[token] += count
+            if old_tokens:
+                for token, count in old_tokens.items():
+                    stats.tokens[token] -= count
+
+            # Track subdomain for successfully crawled pages
+            if parsed_url.netloc.endswith('.uci.edu') or parsed_url.netloc == 'uci.edu':
+                subdomain = parsed_url.netloc
+                # Remove fragment from URL for unique page tracking
+                page_url = urldefrag(url)[0]
+
+                # Add this page to the subdomain's unique pages
+                stats.subdomains[subdomain].add(page_url)
+
+    if duplicate:
+        if visit is not None:
+            stats.records.put(visit, None, None, False, page.cpu + time.thread_time() - start)
+        return [], None, False
 
     valid_links = []
-    for link in links:
-        if is_valid(link, stats):
+    # filter_many is lazy, so links added to stats.pages below are seen by the
+    # duplicate check of the links after them
+    with metrics.timer("filter", url):
+        for link in url_filter.filter_many(page.links, stats.pages):
             valid_links.append(link)
             # Remove fragment and add to stats.pages (set automatically handles uniqueness)
             url_without_fragment = urldefrag(link)[0]
             stats.pages.add(url_without_fragment)
-    return valid_links
+    if visit is not None:
+        stats.records.put(visit, page.tokens, page.fingerprint, True, page.cpu + time.thread_time() - start)
+    return valid_links, page.fingerprint, True
 
 def extract_next_links(url, resp):
     # Implementation required.
@@ -80,131 +204,45 @@ def extract_next_links(url, resp):
     #         resp.raw_response.url: the url, again
     #         resp.raw_response.content: the content of the page!
     # Return a list with the hyperlinks (as strings) scrapped from resp.raw_response.content
-    links = []
-    if resp.status != 200:
-        return links
+    links, _ = parse_page(url, resp)
+    return links
 
-    MAX_FILE_SIZE = 5 * 1024 * 1024  # 5 MB in bytes
-    if resp.raw_response and resp.raw_response.content:
-        content_size = len(resp.raw_response.content)
-        if content_size > MAX_FILE_SIZE:
-            print(f"Skipping large file ({content_size / (1024*1024):.2f} MB): {url}")
-            return links
+def parse_page(url, resp):
+    # Single parse stage shared by link extraction and tokenization.
+    # Returns (absolute links, visible text) of the page.
+    return parse_content(url, resp.url, page_content(url, resp))
 
+def page_content(url, resp):
+    # The page body, or None if there is nothing worth parsing. Pages over
+    # the size cap or of other content types were turned down by the
+    # Response before they were decoded.
+    if resp.status != 200:
+        return None
+    if resp.rejected:
+        events.log(get_logger("SCRAPER", "Worker"), "rejected", "Skipping page, {reason}: {url}",
+                   key=resp.rejected.split(" (")[0], url=url, reason=resp.rejected)
+        metrics.count("rejected", url)
+        return None
+    return resp.content or None
+
+def parse_content(url, base_url, content):
+    if content is None:
+        return [], ''
     try:
-        soup = BeautifulSoup(resp.raw_response.content, 'lxml')
-
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            absolute_url = urljoin(resp.url, href)
-            links.append(absolute_url)
-
+        return parse_html(content, base_url)
     except Exception as e:
-        print(f"Error parsing {url}: {e}")
-
-    return links
+        events.log(get_logger("SCRAPER", "Worker"), "parse_error", "Error parsing {url}: {error}",
+                   key=type(e).__name__, level=logging.WARNING, url=url, error=str(e))
+        return [], ''
 
 def is_valid(url, stats=None):
     # Decide whether to crawl this url or not.
     # If you decide to crawl it, return True; otherwise return False.
-    # There are already some conditions that return False.
-
+    # The rules are compiled once into url_filter above; url_filter.check
+    # tells which rule rejected a url.
+    # Only check duplicates if stats is provided
     try:
-        parsed = urlparse(url)
-
-        # Skip if base URL (without query/fragment) was already crawled
-        # Only check duplicates if stats is provided
-        if stats:
-            base_url = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
-            if base_url in stats.pages: # maybe too restrictive? allow fragments but not count them as unique pages?
-                return False
-
-        if parsed.scheme not in {"http", "https"}:
-            return False
-
-        # allowed domains
-        allowed_domains = ["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu"]
-        domain_valid = False
-        for domain in allowed_domains:
-            if parsed.netloc == domain or parsed.netloc.endswith("." + domain):
-                domain_valid = True
-                break
-
-        if not domain_valid:
-            return False
-
-        # Block entire domains
-        if parsed.netloc in blocked_domains:
-            return False
-
-        # Block specific domain+path combinations
-        for blocked in blocked_paths:
-            if '/' in blocked:
-                domain, path = blocked.split('/', 1)
-                if parsed.netloc == domain and parsed.path.startswith('/' + path):
-                    return False
-
-        # Skip paths with single dash segment (/-/)
-        if '/-/' in parsed.path:
-            return False
-        #if '/activity' in parsed.path: # not necessary?
-            #return False
-        if '/doku.php/' in parsed.path:
-            return False
-
-        # date avoiding
-        date_pattern_slash = r'/\d{4}/\d{1,2}(/\d{1,2})?'
-        if re.search(date_pattern_slash, parsed.path):
-            return False
-
-        date_pattern_hyphen = r'\d{4}-\d{1,2}(-\d{1,2})?'
-        if re.search(date_pattern_hyphen, parsed.path):
-            return False
-
-        # Patterns: /page/2, /p/3, /news/page/2, etc.
-        pagination_pattern = r'/(page|p)/\d+/?'
-        if re.search(pagination_pattern, parsed.path.lower()):
-            return False
-
-        # Match patterns like: /r123.html, /paper456.php, /item789.aspx
-        # maybe allow this?
-        numbered_file_pattern = r'/([a-z]+)(\d+)\.(html?|php|aspx?)$'
-        match = re.search(numbered_file_pattern, parsed.path.lower())
-        if match:
-            prefix = match.group(1)  # e.g., "r", "paper", "item"
-            number = int(match.group(2))  # e.g., 83, 456
-
-            # Allow up to 50 numbered items per pattern
-            if number > 50:
-                return False
-
-        # Detect Git repository paths with commit hashes (crawler traps)
-        git_pattern = r'/(tree|commit|blob|raw)s?/[a-f0-9]{30,}'
-        if re.search(git_pattern, parsed.path.lower()):
-            return False
-
-        # Detect any URL with very long hexadecimal strings (likely identifiers/hashes)
-        # is this necessary?
-        long_hex_pattern = r'/[a-f0-9]{32,}'
-        if re.search(long_hex_pattern, parsed.path.lower()):
-            return False
-
-        # Skip image gallery paths
-        gallery_patterns = ['/pix/', '/photos/', '/gallery/', '/galleries/', '/images/', '/pics/']
-        path_lower = parsed.path.lower()
-        if any(pattern in path_lower for pattern in gallery_patterns):
-            return False
-
-        return not re.match(
-            r".*\.(css|js|bmp|gif|jpe?g|ico"
-            + r"|png|tiff?|mid|mp2|mp3|mp4"
-            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
-            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
-            + r"|epub|dll|cnf|tgz|sha1"
-            + r"|thmx|mso|arff|rtf|jar|csv"
-            + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower())
-
+        return url_filter.is_valid(url, stats.pages if stats else None)
     except TypeError:
-        print ("TypeError for ", parsed)
-        raise
\ No newline at end of file
+        print ("TypeError for ", url)
+        raise
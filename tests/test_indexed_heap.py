@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from crawler.priority import IndexedHeap, LifoQueue
+
+
+def check_invariant(heap):
+    # Every entry is no better than its parent, and position indexes it
+    for index, entry in enumerate(heap.heap):
+        assert heap.position[entry[2]] == index
+        if index:
+            assert heap.heap[(index - 1) >> 1] <= entry
+    assert len(heap.position) == len(heap.heap)
+
+
+def drain(heap):
+    popped = []
+    while heap:
+        popped.append(heap.pop())
+        check_invariant(heap)
+    return popped
+
+
+def test_pops_highest_priority_first():
+    heap = IndexedHeap()
+    for key, priority in [("a", 1), ("b", 5), ("c", -2), ("d", 3)]:
+        heap.push(key, priority, value=key.upper())
+    assert heap.peek_priority() == 5
+    assert drain(heap) == [("b", "B"), ("d", "D"), ("a", "A"), ("c", "C")]
+
+
+def test_equal_priorities_pop_in_push_order():
+    heap = IndexedHeap()
+    for key in "abcdef":
+        heap.push(key, 0)
+    assert [key for key, _ in drain(heap)] == list("abcdef")
+
+
+def test_push_of_a_queued_key_updates_it():
+    heap = IndexedHeap()
+    heap.push("a", 1, value="first")
+    heap.push("b", 2)
+    heap.push("a", 3, value="second")
+    assert len(heap) == 2
+    assert heap.priority("a") == 3
+    # The value it was queued with is kept
+    assert heap.pop() == ("a", "first")
+
+
+def test_update_and_remove():
+    heap = IndexedHeap()
+    for key, priority in [("a", 1), ("b", 2), ("c", 3), ("d", 4)]:
+        heap.push(key, priority)
+    heap.update("a", 10)
+    heap.update("d", 0)
+    assert heap.remove("b") == ("b", None)
+    assert "b" not in heap and "a" in heap
+    check_invariant(heap)
+    assert [key for key, _ in drain(heap)] == ["a", "c", "d"]
+    with pytest.raises(KeyError):
+        heap.remove("b")
+
+
+def test_random_operations_match_a_sorted_list():
+    rng = random.Random(0)
+    heap = IndexedHeap()
+    expected = dict()
+    for step in range(5000):
+        operation = rng.random()
+        if operation < 0.5 or not expected:
+            key = rng.randrange(300)
+            priority = rng.randrange(-50, 50)
+            if key not in expected:
+                expected[key] = (priority, step)
+            else:
+                expected[key] = (priority, expected[key][1])
+            heap.push(key, priority)
+        elif operation < 0.7:
+            key = rng.choice(list(expected))
+            assert heap.remove(key)[0] == key
+            del expected[key]
+        else:
+            best = min(expected, key=lambda key: (-expected[key][0], expected[key][1]))
+            assert heap.pop()[0] == best
+            del expected[best]
+        assert len(heap) == len(expected)
+    check_invariant(heap)
+    assert set(heap) == set(expected)
+
+
+def test_lifo_queue():
+    queue = LifoQueue()
+    for key, priority in [("a", 3), ("b", 1), ("c", 2)]:
+        queue.push(key, priority, value=key.upper())
+    assert "a" not in queue
+    assert list(queue) == ["a", "b", "c"]
+    assert queue.pop() == ("c", "C")
@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from benchmarks.tokenize import STOP_WORDS, TRICKY, chunked, generate_page, legacy_tokenize
+from utils import tokenize
+from utils.tokenize import tokenize_chunks, tokenize_text
+
+
+@pytest.mark.parametrize("text", TRICKY)
+def test_tokenize_text_matches_legacy(text):
+    assert dict(tokenize_text(text)) == dict(legacy_tokenize(text))
+    assert dict(tokenize_text(text, STOP_WORDS)) == dict(legacy_tokenize(text, STOP_WORDS))
+
+
+@pytest.mark.parametrize("text", TRICKY)
+@pytest.mark.parametrize("size", [1, 2, 3, 7])
+def test_tokenize_chunks_matches_legacy(text, size):
+    assert dict(tokenize_chunks(chunked(text, size), STOP_WORDS)) == dict(legacy_tokenize(text, STOP_WORDS))
+
+
+def test_generated_page_matches_legacy():
+    page = generate_page(20000)
+    expected = dict(legacy_tokenize(page, STOP_WORDS))
+    assert dict(tokenize_text(page, STOP_WORDS)) == expected
+    assert dict(tokenize_chunks(chunked(page, 4096), STOP_WORDS)) == expected
+
+
+@pytest.mark.parametrize("chunks, expected", [
+    # A token split across chunks is counted once, whole
+    (["hel", "lo world"], {"hello": 1, "world": 1}),
+    (["a", "b", "c"], {"abc": 1}),
+    # Boundaries on a separator, and empty chunks
+    (["one ", " two"], {"one": 1, "two": 1}),
+    (["one", "", " ", "", "two"], {"one": 1, "two": 1}),
+    # A stop word only appears once its chunks are joined
+    (["th", "e cat"], {"cat": 1}),
+    (["the", "n"], {"then": 1}),
+    # Multi-byte characters and the non-ASCII letters lowering to ASCII
+    # separate or join tokens the same way across a boundary
+    (["caf", "é au"], {"caf": 1, "au": 1}),
+    (["K", "ey"], {"key": 1}),
+    (["İ", "n"], {"i": 1, "n": 1}),
+    ([], {}),
+])
+def test_tokenize_chunks_boundaries(chunks, expected):
+    assert dict(tokenize_chunks(chunks, STOP_WORDS)) == expected
+    assert dict(legacy_tokenize("".join(chunks), STOP_WORDS)) == expected
+
+
+def test_tokenize_text_slices_long_text(monkeypatch):
+    # Long texts are tokenized in CHUNK_SIZE slices that may cut tokens
+    monkeypatch.setattr(tokenize, "CHUNK_SIZE", 5)
+    rng = random.Random(0)
+    text = " ".join(rng.choice(["alpha", "Beta9", "of", "x", "café"]) for _ in range(500))
+    assert dict(tokenize_text(text, STOP_WORDS)) == dict(legacy_tokenize(text, STOP_WORDS))
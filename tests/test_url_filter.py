@@ -0,0 +1,114 @@
+import pytest
+
+from benchmarks.url_filter import VARIANTS, legacy_is_valid
+from scraper import allowed_domains, blocked_domains, blocked_paths, path_patterns, url_filter
+from utils.url_filter import DomainTrie, UrlFilter
+
+PAGES = [
+    "https://www.ics.uci.edu",
+    "https://www.ics.uci.edu/~eppstein/gina/index.html",
+    "https://ics.uci.edu/people/faculty",
+    "http://vision.ics.uci.edu/papers",
+    "https://www.stat.uci.edu/events/2021-03-04",
+    "https://sli.ics.uci.edu/Pubs/Main",
+    "https://sub.sli.ics.uci.edu/Pubs",
+    "https://notuci.edu/page",
+    "https://xics.uci.edu/page",
+    "https://www.informatics.uci.edu/wp-content/uploads/a.JPG",
+    "https://gitlab.ics.uci.edu/group/project/-/tree/main",
+    "https://wiki.ics.uci.edu/doku.php/start",
+    "https://www.cs.uci.edu/a/b/c/d?x=1&y=2",
+]
+
+
+@pytest.mark.parametrize("page", PAGES)
+def test_matches_legacy_is_valid(page):
+    urls = [page + variant for variant in VARIANTS]
+    urls += [page.replace("https://", "ftp://", 1), page.replace(".uci.edu", ".uci.edu:8080", 1)]
+    seen = {url.split("?")[0].split("#")[0] for url in urls[::3]}
+    for url in urls:
+        assert url_filter.is_valid(url) == legacy_is_valid(url), url
+        assert url_filter.is_valid(url, seen) == legacy_is_valid(url, seen), url
+
+
+@pytest.mark.parametrize("url, rule", [
+    ("https://www.ics.uci.edu/about", None),
+    ("ftp://www.ics.uci.edu/about", "scheme"),
+    ("https://www.uci.edu/about", "domain"),
+    ("https://fano.ics.uci.edu/about", "blocked_domain"),
+    ("https://ics.uci.edu/people/someone", "blocked_path"),
+    ("https://gitlab.ics.uci.edu/a/-/b", "path:/-/"),
+    ("https://www.ics.uci.edu/news/2020/01/02", "date_slash"),
+    ("https://www.ics.uci.edu/events/2020-1", "date_hyphen"),
+    ("https://www.ics.uci.edu/news/Page/3", "pagination"),
+    ("https://www.ics.uci.edu/Photos/x", "gallery"),
+    ("https://www.ics.uci.edu/slides.PDF", "extension"),
+    ("https://www.ics.uci.edu/item51.html", "numbered_file"),
+    ("https://www.ics.uci.edu/item50.html", None),
+])
+def test_check_names_the_rule(url, rule):
+    assert url_filter.check(url) == rule
+
+
+def test_predicate_passing_does_not_hide_later_matches():
+    numbered = UrlFilter(["uci.edu"], path_patterns=[
+        ("number", r'/[a-z]+(\d+)', lambda match: int(match.group(1)) > 50),
+        ("pdf", r'\.pdf$')])
+    assert numbered.check("https://uci.edu/a1/b") is None
+    assert numbered.check("https://uci.edu/a1/b99") == "number"
+    assert numbered.check("https://uci.edu/a1/b.PDF") == "pdf"
+
+
+def test_seen_is_checked_without_query_and_fragment():
+    seen = {"https://www.ics.uci.edu/about"}
+    assert url_filter.check("https://www.ics.uci.edu/about?x=1#top", seen) == "seen"
+    assert url_filter.check("https://www.ics.uci.edu/about/", seen) is None
+
+
+def test_domain_trie():
+    trie = DomainTrie(["ics.uci.edu"], subdomains=True)
+    trie.add("stat.uci.edu", subdomains=False)
+    assert trie.match("ics.uci.edu")
+    assert trie.match("www.ics.uci.edu")
+    assert trie.match("stat.uci.edu")
+    assert not trie.match("www.stat.uci.edu")
+    assert not trie.match("uci.edu")
+    assert not trie.match("xics.uci.edu")
+
+
+def test_filter_many_sees_urls_added_while_it_runs():
+    seen = set()
+    urls = ["https://www.ics.uci.edu/a", "https://www.ics.uci.edu/a?page=2",
+            "https://www.uci.edu/b", "https://www.ics.uci.edu/c"]
+    kept = []
+    for url in url_filter.filter_many(urls, seen):
+        kept.append(url)
+        seen.add(url.split("?")[0])
+    assert kept == ["https://www.ics.uci.edu/a", "https://www.ics.uci.edu/c"]
+
+
+def build(**changes):
+    rules = dict(allowed_domains=allowed_domains, blocked_domains=blocked_domains,
+                 blocked_paths=blocked_paths, path_substrings=['/-/', '/doku.php/'],
+                 path_patterns=path_patterns, path_pattern_lead=r'/.\d')
+    rules.update(changes)
+    return UrlFilter(**rules)
+
+
+def test_version_follows_the_rules():
+    assert build().version == url_filter.version
+    # Sets of domains hash the same in any order
+    assert build(blocked_domains=sorted(blocked_domains, reverse=True)).version == url_filter.version
+    assert build(blocked_domains=set(blocked_domains) | {"x.ics.uci.edu"}).version != url_filter.version
+    assert build(path_substrings=['/-/']).version != url_filter.version
+    # A predicate is compared by its code
+    patterns = [rule if rule[0] != "numbered_file" else (rule[0], rule[1], lambda match: int(match.group(2)) > 60)
+                for rule in path_patterns]
+    assert build(path_patterns=patterns).version != url_filter.version
+
+
+def test_host_verdicts_are_cached():
+    fresh = build()
+    assert fresh.check("https://fano.ics.uci.edu/") == "blocked_domain"
+    assert fresh.host_verdicts["fano.ics.uci.edu"] == "blocked_domain"
+    assert fresh.check("https://fano.ics.uci.edu/other") == "blocked_domain"
@@ -1,25 +1,8 @@
-import os
-import logging
+import re
 from hashlib import sha256
 from urllib.parse import urlparse
 
-def get_logger(name, filename=None):
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    if not os.path.exists("Logs"):
-        os.makedirs("Logs")
-    fh = logging.FileHandler(f"Logs/{filename if filename else name}.log")
-    fh.setLevel(logging.DEBUG)
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    formatter = logging.Formatter(
-       "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    fh.setFormatter(formatter)
-    ch.setFormatter(formatter)
-    # add the handlers to the logger
-    logger.addHandler(fh)
-    logger.addHandler(ch)
-    return logger
+from utils.log import get_logger
 
 
 def get_urlhash(url):
@@ -29,6 +12,14 @@ def get_urlhash(url):
         f"{parsed.netloc}/{parsed.path}/{parsed.params}/"
         f"{parsed.query}/{parsed.fragment}".encode("utf-8")).hexdigest()
 
+# scheme://netloc at the start of a url
+_NETLOC = re.compile(r'[A-Za-z][A-Za-z0-9+.-]*://([^/?#]*)')
+
+def get_host(url):
+    # Same as urlparse(url).netloc for crawlable urls, at a fraction of the cost
+    match = _NETLOC.match(url)
+    return match.group(1) if match else urlparse(url).netloc
+
 def normalize(url):
     if url.endswith("/"):
         return url.rstrip("/")
@@ -0,0 +1,138 @@
+import cbor
+import time
+import random
+import asyncio
+
+from urllib.parse import urlencode
+
+from utils.response import Response
+from utils.download import NO_RESPONSE, RETRY_STATUSES
+
+
+class DownloadError(Exception):
+    pass
+
+
+class AsyncCacheClient(object):
+    ''' asyncio client for the cache server, with a pool of keep-alive
+    HTTP/1.1 connections shared by all tasks of the event loop. It follows
+    the timeout, retry and size cap settings of utils.download. '''
+
+    def __init__(self, config, max_connections):
+        self.config = config
+        self.host, self.port = config.cache_server
+        self.idle = []
+        self.slots = asyncio.Semaphore(max_connections)
+
+    async def _connect(self):
+        start = time.perf_counter()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.config.connect_timeout)
+        return reader, writer, time.perf_counter() - start
+
+    async def _read_response(self, reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise DownloadError("Connection closed by cache server")
+        status = int(status_line.split()[1])
+        headers = dict()
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        max_bytes = self.config.max_download_bytes
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                body += await reader.readexactly(size)
+                await reader.readexactly(2)
+                if len(body) > max_bytes:
+                    return status, headers, None
+            body = bytes(body)
+        elif "content-length" in headers:
+            length = int(headers["content-length"])
+            if length > max_bytes:
+                return status, headers, None
+            body = await reader.readexactly(length)
+        else:
+            # No length: the body runs until the server closes the connection.
+            body = await reader.read(max_bytes + 1)
+            headers["connection"] = "close"
+            if len(body) > max_bytes:
+                return status, headers, None
+        return status, headers, body
+
+    async def _get(self, url):
+        # One request over a pooled connection. Returns (status, body, connect_time).
+        connect_time = 0.0
+        if self.idle:
+            reader, writer = self.idle.pop()
+        else:
+            reader, writer, connect_time = await self._connect()
+        query = urlencode([("q", f"{url}"), ("u", f"{self.config.user_agent}")])
+        writer.write(
+            f"GET /?{query} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+            f"Connection: keep-alive\r\n\r\n".encode("utf-8"))
+        try:
+            await writer.drain()
+            status, headers, body = await asyncio.wait_for(
+                self._read_response(reader), self.config.read_timeout)
+        except BaseException:
+            writer.close()
+            raise
+        if body is None or headers.get("connection", "").lower() == "close":
+            writer.close()
+        else:
+            self.idle.append((reader, writer))
+        return status, body, connect_time
+
+    async def download(self, url):
+        connect_time = 0.0
+        error = None
+        async with self.slots:
+            for attempt in range(self.config.download_retries + 1):
+                if attempt:
+                    # Exponential backoff with full jitter
+                    await asyncio.sleep(random.uniform(0, self.config.retry_backoff * 2 ** (attempt - 1)))
+                try:
+                    status, body, setup = await self._get(url)
+                    connect_time += setup
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                        ValueError, DownloadError) as e:
+                    error = f"Spacetime download error {e!r} with url {url}."
+                    continue
+                if status in RETRY_STATUSES and attempt < self.config.download_retries:
+                    continue
+                break
+            else:
+                return self._error(url, error, NO_RESPONSE, connect_time)
+
+        if body is None:
+            return self._error(
+                url, f"Spacetime response larger than {self.config.max_download_bytes} bytes with url {url}.",
+                NO_RESPONSE, connect_time)
+        try:
+            if status < 400 and body:
+                response = Response(cbor.loads(body), self.config.max_page_size, self.config.content_types)
+                response.connect_time = connect_time
+                return response
+        except (EOFError, ValueError):
+            pass
+        return self._error(url, f"Spacetime Response error <{status}> with url {url}.", status, connect_time)
+
+    def _error(self, url, error, status, connect_time):
+        response = Response({"error": error, "status": status, "url": url})
+        response.connect_time = connect_time
+        return response
+
+    def close(self):
+        for reader, writer in self.idle:
+            writer.close()
+        self.idle = []
@@ -0,0 +1,335 @@
+import os
+import math
+import mmap
+import struct
+from hashlib import blake2b
+from threading import RLock
+
+from utils.log import get_logger
+
+# magic, number of bits, number of hashes, number of items added
+HEADER = struct.Struct("<8sQIQ")
+MAGIC = b"BLOOM01\x00"
+
+# The url index is an open-addressing hash table in one file, mapped in
+# memory: INDEX_HEADER (magic, capacity, count, clean), then `capacity` slots
+# of the 16 byte blake2b digest of a url. An all-zero slot is empty. `clean`
+# is cleared while the index is open, so one that was not closed is rebuilt.
+INDEX_HEADER = struct.Struct("<8sQQB7x")
+INDEX_MAGIC = b"URLIDX1\x00"
+KEY_SIZE = 16
+EMPTY = bytes(KEY_SIZE)
+MIN_CAPACITY = 1 << 16
+MAX_LOAD = 0.7
+
+
+class BloomFilter(object):
+    ''' Bloom filter over strings.
+
+    Sized for `capacity` items at `error_rate` false positives. With a path
+    the bits live in a memory-mapped file, so the filter is persisted as it
+    is written and reopening it only maps the file instead of rebuilding. '''
+
+    def __init__(self, capacity, error_rate=0.001, path=None):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.count = 0
+        self.path = path
+        self.file = None
+        self._setup_hashing()
+
+        size = HEADER.size + (self.num_bits + 7) // 8
+        if path is None:
+            self.bits = bytearray(size)
+        else:
+            self.file = open(path, "w+b")
+            self.file.truncate(size)
+            self.bits = mmap.mmap(self.file.fileno(), size)
+        self._write_header()
+
+    @classmethod
+    def open(cls, path):
+        ''' Map an existing filter file. '''
+        bloom = cls.__new__(cls)
+        bloom.path = path
+        bloom.file = open(path, "r+b")
+        bloom.bits = mmap.mmap(bloom.file.fileno(), 0)
+        magic, bloom.num_bits, bloom.num_hashes, bloom.count = HEADER.unpack_from(bloom.bits, 0)
+        if magic != MAGIC:
+            bloom.close()
+            raise ValueError(f"{path} is not a bloom filter file")
+        bloom.capacity = int(bloom.num_bits * math.log(2) / bloom.num_hashes)
+        bloom.error_rate = math.exp(-bloom.num_bits / bloom.capacity * math.log(2) ** 2)
+        bloom._setup_hashing()
+        return bloom
+
+    def _write_header(self):
+        HEADER.pack_into(self.bits, 0, MAGIC, self.num_bits, self.num_hashes, self.count)
+
+    def _setup_hashing(self):
+        # Cut the k indexes straight out of one blake2b digest when they fit
+        # in its 64 bytes, otherwise derive them by double hashing.
+        width = 4 if self.num_bits < 2 ** 32 else 8
+        if self.num_hashes * width <= 64:
+            self.slices = struct.Struct(f"<{self.num_hashes}{'I' if width == 4 else 'Q'}")
+        else:
+            self.slices = None
+
+    def _indexes(self, item):
+        num_bits = self.num_bits
+        if self.slices is not None:
+            digest = blake2b(item.encode("utf-8"), digest_size=self.slices.size).digest()
+            return [value % num_bits for value in self.slices.unpack(digest)]
+        digest = blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        ''' Add item. Returns True if it was not in the filter before. '''
+        bits = self.bits
+        new = False
+        for index in self._indexes(item):
+            offset = HEADER.size + (index >> 3)
+            mask = 1 << (index & 7)
+            byte = bits[offset]
+            if not byte & mask:
+                bits[offset] = byte | mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def __contains__(self, item):
+        bits = self.bits
+        offset = HEADER.size
+        for index in self._indexes(item):
+            if not bits[offset + (index >> 3)] & (1 << (index & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def size_bytes(self):
+        return len(self.bits)
+
+    def flush(self):
+        self._write_header()
+        if self.file is not None:
+            self.bits.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.bits.close()
+            self.file.close()
+            self.file = None
+
+
+def _url_key(url):
+    key = blake2b(url.encode("utf-8"), digest_size=KEY_SIZE).digest()
+    # The all-zero key marks an empty slot
+    return key if key != EMPTY else b"\x01" + key[1:]
+
+
+class UrlIndex(object):
+    ''' Exact set of urls on disk: a memory-mapped hash table of their
+    digests at `path`, doubled in size when it is MAX_LOAD full. It is
+    only looked at when the bloom filter of a SeenUrls answers "maybe",
+    so its pages are rarely read. '''
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            self.file = open(path, "r+b")
+            self.table = mmap.mmap(self.file.fileno(), 0)
+            magic, self.capacity, self.count, self.clean = INDEX_HEADER.unpack_from(self.table, 0)
+            if magic != INDEX_MAGIC:
+                self.close()
+                raise ValueError(f"{path} is not a url index")
+        else:
+            self._create(path, MIN_CAPACITY)
+            self.clean = True
+        self.flush()
+
+    def _create(self, path, capacity):
+        with open(path, "wb") as f:
+            f.truncate(INDEX_HEADER.size + capacity * KEY_SIZE)
+        self.file = open(path, "r+b")
+        self.table = mmap.mmap(self.file.fileno(), 0)
+        self.capacity = capacity
+        self.count = 0
+
+    def _slot(self, key):
+        # The position of key, or of the empty slot it would go to, and
+        # whether it is there
+        mask = self.capacity - 1
+        slot = int.from_bytes(key[:8], "little") & mask
+        table = self.table
+        while True:
+            position = INDEX_HEADER.size + slot * KEY_SIZE
+            stored = table[position:position + KEY_SIZE]
+            if stored == key:
+                return position, True
+            if stored == EMPTY:
+                return position, False
+            slot = (slot + 1) & mask
+
+    def add(self, url):
+        ''' Add url. Returns True if it was not in the index before. '''
+        return self._add_key(_url_key(url))
+
+    def _add_key(self, key):
+        position, found = self._slot(key)
+        if found:
+            return False
+        self.table[position:position + KEY_SIZE] = key
+        self.count += 1
+        if self.count > MAX_LOAD * self.capacity:
+            self._grow()
+        return True
+
+    def _grow(self):
+        # Rehash every key into a table of twice the capacity.
+        old, old_file, old_capacity = self.table, self.file, self.capacity
+        temp = self.path + ".tmp"
+        self._create(temp, old_capacity * 2)
+        for slot in range(old_capacity):
+            position = INDEX_HEADER.size + slot * KEY_SIZE
+            key = old[position:position + KEY_SIZE]
+            if key != EMPTY:
+                self._add_key(key)
+        self.flush()
+        os.replace(temp, self.path)
+        old.close()
+        old_file.close()
+
+    def __contains__(self, url):
+        return self._slot(_url_key(url))[1]
+
+    def __len__(self):
+        return self.count
+
+    def flush(self, clean=False):
+        INDEX_HEADER.pack_into(self.table, 0, INDEX_MAGIC, self.capacity, self.count, clean)
+        self.table.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.flush(clean=True)
+            self.table.close()
+            self.file.close()
+            self.file = None
+
+
+class SeenUrls(object):
+    ''' Set-like record of the unique page urls found by the crawl.
+
+    Membership is answered by a bloom filter, so memory does not grow with
+    the number of urls. When the filter answers "maybe", an exact UrlIndex
+    of the urls on disk (at `index_file`, by default next to the page list)
+    settles it, so no url is lost to a false positive. The urls themselves
+    are appended to a text file, one per line, which keeps the count exact
+    and lets the final report list them. The page list is the record: an
+    index that does not match it, after a crash, is rebuilt from it. '''
+
+    def __init__(self, bloom, pages_file, index_file=None):
+        self.logger = get_logger("SEEN_URLS", "Worker")
+        self.lock = RLock()
+        self.bloom = bloom
+        self.pages_file = pages_file
+        self.index_file = index_file or os.path.splitext(pages_file)[0] + ".index"
+        self.count = 0
+        if os.path.exists(pages_file):
+            with open(pages_file, "rb") as f:
+                self.count = sum(1 for _ in f)
+        self.index = self._open_index()
+        self.false_positives = 0
+        self.over_capacity = False
+        self.file = open(pages_file, "a", encoding="utf-8")
+
+    def _open_index(self):
+        try:
+            index = UrlIndex(self.index_file)
+        except ValueError:
+            index = None
+        if index is not None and index.clean and len(index) == self.count:
+            return index
+        if index is not None:
+            index.close()
+        if os.path.exists(self.index_file):
+            os.remove(self.index_file)
+        index = UrlIndex(self.index_file)
+        if self.count:
+            self.logger.info(f"Rebuilding the url index {self.index_file} from {self.pages_file}.")
+            with open(self.pages_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    index.add(line.rstrip("\n"))
+            index.flush()
+        return index
+
+    @classmethod
+    def open(cls, bloom_file, pages_file, capacity, error_rate, index_file=None):
+        ''' Open the saved filter, page list and index, or start new ones. '''
+        if os.path.exists(bloom_file) and os.path.exists(pages_file):
+            return cls(BloomFilter.open(bloom_file), pages_file, index_file)
+        for path in (bloom_file, pages_file):
+            if os.path.exists(path):
+                os.remove(path)
+        return cls(BloomFilter(capacity, error_rate, bloom_file), pages_file, index_file)
+
+    def add(self, url):
+        ''' Add url. Returns True if it was new. '''
+        with self.lock:
+            if not self.bloom.add(url):
+                # Seen, or a false positive of the filter
+                if url in self.index:
+                    return False
+                self.false_positives += 1
+            self.index.add(url)
+            self.file.write(url + "\n")
+            self.count += 1
+            if self.count > self.bloom.capacity and not self.over_capacity:
+                self.over_capacity = True
+                self.logger.warning(
+                    f"{self.count} urls seen, over the capacity of {self.bloom.capacity} the bloom filter "
+                    f"was sized for (SEENCAPACITY): it answers \"maybe\" more and more often, and every "
+                    f"such answer is checked on disk. Raise SEENCAPACITY for the next crawl.")
+            return True
+
+    def update(self, urls):
+        for url in urls:
+            self.add(url)
+
+    def __contains__(self, url):
+        with self.lock:
+            return url in self.bloom and url in self.index
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        with self.lock:
+            self.file.flush()
+        with open(self.pages_file, "r", encoding="utf-8") as f:
+            for line in f:
+                yield line.rstrip("\n")
+
+    def __repr__(self):
+        return f"<SeenUrls {self.count} urls, {self.bloom.size_bytes} byte filter>"
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+            self.bloom.flush()
+            self.index.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            self.bloom.close()
+            self.index.close()
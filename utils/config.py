@@ -1,6 +1,16 @@
 import re
 
 
+def _log_samples(value):
+    # "100" or "download=100, rejected=1": one in N events logged, by kind
+    samples = dict()
+    for part in value.split(","):
+        event, _, sample = part.strip().rpartition("=")
+        if sample:
+            samples[event.strip() or None] = int(sample)
+    return samples
+
+
 class Config(object):
     def __init__(self, config):
         self.user_agent = config["IDENTIFICATION"]["USERAGENT"].strip()
@@ -8,12 +18,67 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        # Bounds of the worker pool, which starts with THREADCOUNT workers.
+        # Without them it stays at THREADCOUNT.
+        self.min_threads = config["LOCAL PROPERTIES"].getint("MINTHREADS", self.threads_count)
+        self.max_threads = config["LOCAL PROPERTIES"].getint("MAXTHREADS", self.threads_count)
+        self.scale_interval = config["LOCAL PROPERTIES"].getfloat("SCALEINTERVAL", 2.0)
+        self.scale_latency = config["LOCAL PROPERTIES"].getfloat("SCALELATENCY", 2.0)
+        self.scale_error_rate = config["LOCAL PROPERTIES"].getfloat("SCALEERRORRATE", 0.1)
+        self.max_in_flight = config["LOCAL PROPERTIES"].getint("MAXINFLIGHT", 200)
+        self.parser_threads = config["LOCAL PROPERTIES"].getint("PARSERTHREADS", 4)
+        self.parser_processes = config["LOCAL PROPERTIES"].getint("PARSERPROCESSES", 4)
+        self.parse_queue_size = config["LOCAL PROPERTIES"].getint("PARSEQUEUE", 64)
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.storage = config["LOCAL PROPERTIES"].get("STORAGE", "log").strip().lower()
+        self.commit_interval = config["LOCAL PROPERTIES"].getfloat("COMMITINTERVAL", 1.0)
+        self.commit_records = config["LOCAL PROPERTIES"].getint("COMMITRECORDS", 1000)
+        self.seen_capacity = config["LOCAL PROPERTIES"].getint("SEENCAPACITY", 10000000)
+        self.seen_error_rate = config["LOCAL PROPERTIES"].getfloat("SEENERRORRATE", 0.001)
+        self.stats_merge_interval = config["LOCAL PROPERTIES"].getfloat("STATSMERGEINTERVAL", 1.0)
+        self.checkpoint_interval = config["LOCAL PROPERTIES"].getfloat("CHECKPOINTINTERVAL", 30.0)
+        self.checkpoint_pages = config["LOCAL PROPERTIES"].getint("CHECKPOINTPAGES", 1000)
+        self.report_page_files = config["LOCAL PROPERTIES"].getboolean("REPORTPAGEFILES", False)
+        self.metrics = config["LOCAL PROPERTIES"].getboolean("METRICS", False)
+        self.metrics_port = config["LOCAL PROPERTIES"].getint("METRICSPORT", 0)
+        self.metrics_interval = config["LOCAL PROPERTIES"].getfloat("METRICSINTERVAL", 60.0)
+        self.log_format = config["LOCAL PROPERTIES"].get("LOGFORMAT", "text").strip().lower()
+        self.log_sample = _log_samples(config["LOCAL PROPERTIES"].get("LOGSAMPLE", "1"))
+        self.log_summary_interval = config["LOCAL PROPERTIES"].getfloat("LOGSUMMARYINTERVAL", 10.0)
+        self.shards = config["LOCAL PROPERTIES"].getint("SHARDS", 1)
+        self.shard_dir = config["LOCAL PROPERTIES"].get("SHARDDIR", "shards").strip()
+        self.shard_batch = config["LOCAL PROPERTIES"].getint("SHARDBATCH", 256)
+        self.shard_flush_interval = config["LOCAL PROPERTIES"].getfloat("SHARDFLUSHINTERVAL", 0.2)
+        self.page_records = config["LOCAL PROPERTIES"].getboolean("PAGERECORDS", False)
+        self.page_store = config["LOCAL PROPERTIES"].getboolean("PAGESTORE", False)
+        self.page_store_dir = config["LOCAL PROPERTIES"].get("PAGESTOREDIR", "pages").strip()
+        self.page_store_compression = config["LOCAL PROPERTIES"].get("PAGESTORECOMPRESSION", "auto").strip().lower()
+        self.page_store_segment_bytes = config["LOCAL PROPERTIES"].getint("PAGESTORESEGMENTBYTES", 256 * 1024 * 1024)
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        self.offline = config["CONNECTION"].getboolean("OFFLINE", False)
+        self.connect_timeout = config["CONNECTION"].getfloat("CONNECTTIMEOUT", 5.0)
+        self.read_timeout = config["CONNECTION"].getfloat("READTIMEOUT", 30.0)
+        self.download_retries = config["CONNECTION"].getint("RETRIES", 2)
+        self.retry_backoff = config["CONNECTION"].getfloat("RETRYBACKOFF", 0.5)
+        self.max_download_bytes = config["CONNECTION"].getint("MAXDOWNLOAD", 8 * 1024 * 1024)
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        self.max_page_size = config["CRAWLER"].getint("MAXPAGESIZE", 5 * 1024 * 1024)
+        self.content_types = tuple(
+            content_type.strip().lower()
+            for content_type in config["CRAWLER"].get("CONTENTTYPES", "text/html,application/xhtml+xml").split(",")
+            if content_type.strip())
+        self.order = config["CRAWLER"].get("ORDER", "lifo").strip().lower()
+        self.trap_detection = config["CRAWLER"].getboolean("TRAPDETECTION", False)
+        self.trap_window = config["CRAWLER"].getint("TRAPWINDOW", 20)
+        self.trap_throttle_yield = config["CRAWLER"].getfloat("TRAPTHROTTLEYIELD", 0.3)
+        self.trap_block_yield = config["CRAWLER"].getfloat("TRAPBLOCKYIELD", 0.1)
+        self.trap_throttle = config["CRAWLER"].getint("TRAPTHROTTLE", 10)
+        self.recrawl_after = config["CRAWLER"].getfloat("RECRAWLAFTER", 86400.0)
+        # Set by launch.py --recrawl
+        self.recrawl = False
 
         self.cache_server = None
\ No newline at end of file
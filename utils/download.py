@@ -1,21 +1,118 @@
 import requests
 import cbor
 import time
+import random
+import threading
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
 
 from utils.response import Response
 
+# Status of responses that never got an answer from the cache server
+# (connection failures, timeouts, bodies over the size cap).
+NO_RESPONSE = 0
+# Cache server statuses worth another try
+RETRY_STATUSES = {502, 503, 504}
+
+_local = threading.local()
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    # Adds the time spent opening connections to the current thread's download.
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _local.connect_time += time.perf_counter() - start
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = dict(
+            self.poolmanager.pool_classes_by_scheme, http=_TimedHTTPConnectionPool)
+
+
+def _get_session():
+    # One keep-alive session per thread: requests sessions are not thread
+    # safe, and each worker only talks to the cache server.
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.mount("http://", _TimedAdapter(pool_connections=1, pool_maxsize=1, max_retries=0))
+        _local.session = session
+    return session
+
+
+def _read_capped(resp, max_bytes):
+    # Stream the body, giving up as soon as it is larger than max_bytes.
+    length = resp.headers.get("Content-Length")
+    if length and length.isdigit() and int(length) > max_bytes:
+        return None
+    content = bytearray()
+    for chunk in resp.iter_content(chunk_size=65536):
+        content += chunk
+        if len(content) > max_bytes:
+            return None
+    return bytes(content)
+
+
+def _error_response(url, error, status, logger, connect_time):
+    if logger:
+        logger.error(error)
+    response = Response({"error": error, "status": status, "url": url})
+    response.connect_time = connect_time
+    return response
+
+
 def download(url, config, logger=None):
     host, port = config.cache_server
-    resp = requests.get(
-        f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
+    session = _get_session()
+    _local.connect_time = 0.0
+
+    for attempt in range(config.download_retries + 1):
+        if attempt:
+            # Exponential backoff with full jitter
+            time.sleep(random.uniform(0, config.retry_backoff * 2 ** (attempt - 1)))
+        try:
+            resp = session.get(
+                f"http://{host}:{port}/",
+                params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
+                timeout=(config.connect_timeout, config.read_timeout),
+                stream=True)
+            if resp.status_code in RETRY_STATUSES and attempt < config.download_retries:
+                resp.close()
+                continue
+            content = _read_capped(resp, config.max_download_bytes)
+            resp.close()
+        # Also a body cut short or badly encoded while it streams
+        # (ChunkedEncodingError, ContentDecodingError), not only a failed
+        # connection or a timeout
+        except requests.RequestException as e:
+            if attempt < config.download_retries:
+                continue
+            return _error_response(
+                url, f"Spacetime download error {e} with url {url}.",
+                NO_RESPONSE, logger, _local.connect_time)
+        break
+
+    if content is None:
+        return _error_response(
+            url, f"Spacetime response larger than {config.max_download_bytes} bytes with url {url}.",
+            NO_RESPONSE, logger, _local.connect_time)
+
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+        if resp and content:
+            response = Response(cbor.loads(content), config.max_page_size, config.content_types)
+            response.connect_time = _local.connect_time
+            return response
     except (EOFError, ValueError) as e:
         pass
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
-    return Response({
-        "error": f"Spacetime Response error {resp} with url {url}.",
-        "status": resp.status_code,
-        "url": url})
+    return _error_response(
+        url, f"Spacetime Response error {resp} with url {url}.",
+        resp.status_code, logger, _local.connect_time)
@@ -0,0 +1,320 @@
+import zlib
+import heapq
+from array import array
+from collections.abc import Mapping, MutableMapping
+
+MIN_CAPACITY = 1 << 10
+MAX_LOAD = 0.6
+
+
+class Vocabulary(object):
+    ''' Strings interned to the ids 0, 1, 2, ... in the order they were
+    added. Their utf-8 bytes are kept back to back in one buffer, with an
+    array of offsets, and found through an open-addressing table of ids by
+    crc32. That is about the length of the string plus 20 bytes per string,
+    where a str key of a dict costs about 80 bytes plus the length. Up to
+    4 GiB of strings. '''
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array('I', [0])
+        self.hashes = array('I')
+        self.table = array('i', [-1]) * MIN_CAPACITY
+        self.mask = MIN_CAPACITY - 1
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _find(self, encoded, crc):
+        # The slot of encoded and its id, or the empty slot it would go to
+        # and -1
+        table, hashes, offsets, data, mask = self.table, self.hashes, self.offsets, self.data, self.mask
+        slot = crc & mask
+        while True:
+            i = table[slot]
+            if i < 0 or (hashes[i] == crc and data[offsets[i]:offsets[i + 1]] == encoded):
+                return slot, i
+            slot = (slot + 1) & mask
+
+    def find(self, string):
+        ''' The id of string, or -1 if it was not added. '''
+        encoded = string.encode("utf-8")
+        return self._find(encoded, zlib.crc32(encoded))[1]
+
+    def intern(self, string):
+        ''' (id of string, whether it was added now). '''
+        encoded = string.encode("utf-8")
+        crc = zlib.crc32(encoded)
+        slot, i = self._find(encoded, crc)
+        if i >= 0:
+            return i, False
+        return self._add(encoded, crc, slot), True
+
+    def _add(self, encoded, crc, slot):
+        # Add encoded at its empty slot, and return its id
+        i = len(self.hashes)
+        self.table[slot] = i
+        self.hashes.append(crc)
+        self.data += encoded
+        self.offsets.append(len(self.data))
+        if i + 1 > MAX_LOAD * len(self.table):
+            self._build_table(2 * len(self.table))
+        return i
+
+    def _build_table(self, capacity):
+        table = array('i', [-1]) * capacity
+        mask = capacity - 1
+        for i, crc in enumerate(self.hashes):
+            slot = crc & mask
+            while table[slot] >= 0:
+                slot = (slot + 1) & mask
+            table[slot] = i
+        self.table, self.mask = table, mask
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    def __iter__(self):
+        data, offsets = self.data, self.offsets
+        for i in range(len(self.hashes)):
+            yield data[offsets[i]:offsets[i + 1]].decode("utf-8")
+
+    def copy(self):
+        copy = Vocabulary.__new__(Vocabulary)
+        copy.data = bytearray(self.data)
+        copy.offsets, copy.hashes, copy.table = self.offsets[:], self.hashes[:], self.table[:]
+        copy.mask = self.mask
+        return copy
+
+    def nbytes(self):
+        ''' Bytes held by the buffers, less what they keep spare. '''
+        return sum(len(part) * part.itemsize for part in (self.offsets, self.hashes, self.table)) + len(self.data)
+
+    def __getstate__(self):
+        # The table is rebuilt from the hashes on load
+        return {'data': bytes(self.data), 'offsets': self.offsets.tobytes(), 'hashes': self.hashes.tobytes()}
+
+    def __setstate__(self, state):
+        self.data = bytearray(state['data'])
+        self.offsets = array('I')
+        self.offsets.frombytes(state['offsets'])
+        self.hashes = array('I')
+        self.hashes.frombytes(state['hashes'])
+        capacity = MIN_CAPACITY
+        while len(self.hashes) > MAX_LOAD * capacity:
+            capacity *= 2
+        self._build_table(capacity)
+
+
+class TokenCounts(MutableMapping):
+    ''' Token counts as a Vocabulary of the tokens and an array('Q') of
+    counts by token id. Behaves like a Counter: a missing token counts 0,
+    update() adds counts, and a token whose count drops to 0 is gone
+    (its id stays interned). '''
+
+    def __init__(self, counts=None):
+        self.vocabulary = Vocabulary()
+        self.counts = array('Q')
+        self.size = 0
+        if counts:
+            self.update(counts)
+
+    def add(self, token, count):
+        if not count:
+            return
+        i, added = self.vocabulary.intern(token)
+        if added:
+            self.counts.append(0)
+        old = self.counts[i]
+        # Counts only go down by what was added before, see merge_page
+        new = max(0, old + count)
+        self.counts[i] = new
+        self.size += bool(new) - bool(old)
+
+    def update(self, other=(), **kwargs):
+        ''' Add the counts of a mapping or of (token, count) pairs. '''
+        pairs = other.items() if isinstance(other, Mapping) else other
+        # add() for every pair, with the lookup inlined: this is where the
+        # shards of the workers are merged
+        vocabulary, counts, crc32 = self.vocabulary, self.counts, zlib.crc32
+        table, hashes, offsets, data, mask = (
+            vocabulary.table, vocabulary.hashes, vocabulary.offsets, vocabulary.data, vocabulary.mask)
+        size = self.size
+        for token, count in pairs:
+            if not count:
+                continue
+            encoded = token.encode("utf-8")
+            crc = crc32(encoded)
+            slot = crc & mask
+            while True:
+                i = table[slot]
+                if i < 0:
+                    i = vocabulary._add(encoded, crc, slot)
+                    counts.append(0)
+                    # The table may have grown
+                    table, mask = vocabulary.table, vocabulary.mask
+                    break
+                if hashes[i] == crc and data[offsets[i]:offsets[i + 1]] == encoded:
+                    break
+                slot = (slot + 1) & mask
+            old = counts[i]
+            new = old + count
+            if new < 0:
+                new = 0
+            counts[i] = new
+            size += bool(new) - bool(old)
+        self.size = size
+        for token, count in kwargs.items():
+            self.add(token, count)
+
+    def __getitem__(self, token):
+        i = self.vocabulary.find(token)
+        return self.counts[i] if i >= 0 else 0
+
+    def get(self, token, default=None):
+        count = self[token]
+        return count if count else default
+
+    def __setitem__(self, token, count):
+        self.add(token, count - self[token])
+
+    def __delitem__(self, token):
+        count = self[token]
+        if not count:
+            raise KeyError(token)
+        self.add(token, -count)
+
+    def __contains__(self, token):
+        return self[token] > 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        vocabulary = self.vocabulary
+        for i, count in enumerate(self.counts):
+            if count:
+                yield vocabulary[i]
+
+    def items(self):
+        vocabulary = self.vocabulary
+        return [(vocabulary[i], count) for i, count in enumerate(self.counts) if count]
+
+    def values(self):
+        return [count for count in self.counts if count]
+
+    def most_common(self, n=None):
+        ''' The n most common (token, count) pairs, like Counter.most_common.
+        Only those n tokens are decoded. '''
+        counts = self.counts
+        if n is None:
+            ids = sorted(range(len(counts)), key=counts.__getitem__, reverse=True)
+        else:
+            ids = heapq.nlargest(n, range(len(counts)), key=counts.__getitem__)
+        return [(self.vocabulary[i], counts[i]) for i in ids if counts[i]]
+
+    def copy(self):
+        copy = TokenCounts.__new__(TokenCounts)
+        copy.vocabulary = self.vocabulary.copy()
+        copy.counts = self.counts[:]
+        copy.size = self.size
+        return copy
+
+    def nbytes(self):
+        return self.vocabulary.nbytes() + len(self.counts) * self.counts.itemsize
+
+    def __getstate__(self):
+        return {'vocabulary': self.vocabulary.__getstate__(), 'counts': self.counts.tobytes(), 'size': self.size}
+
+    def __setstate__(self, state):
+        self.vocabulary = Vocabulary.__new__(Vocabulary)
+        self.vocabulary.__setstate__(state['vocabulary'])
+        self.counts = array('Q')
+        self.counts.frombytes(state['counts'])
+        self.size = state['size']
+
+    def __repr__(self):
+        return f"<TokenCounts {self.size} tokens>"
+
+
+class PageSet(object):
+    ''' The pages of one subdomain in a PageSets, as ids of its vocabulary. '''
+    __slots__ = ('pages', 'ids')
+
+    def __init__(self, pages, ids):
+        self.pages = pages
+        self.ids = ids
+
+    def add(self, url):
+        i, added = self.pages.intern(url)
+        if added:
+            self.ids.append(i)
+
+    def update(self, urls):
+        for url in urls:
+            self.add(url)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        pages = self.pages
+        for i in self.ids:
+            yield pages[i]
+
+    def __repr__(self):
+        return f"<PageSet {len(self.ids)} pages>"
+
+
+class PageSets(Mapping):
+    ''' The crawled pages by subdomain. Every page is interned once in one
+    Vocabulary, and a subdomain holds the ids of its pages in an
+    array('I'). A page belongs to the subdomain it was first added to,
+    which is its host. Like a defaultdict(set), a missing subdomain is
+    created on lookup. '''
+
+    def __init__(self, subdomains=None):
+        self.pages = Vocabulary()
+        self.members = dict()
+        if subdomains:
+            for subdomain, pages in subdomains.items():
+                self[subdomain].update(pages)
+
+    def __getitem__(self, subdomain):
+        ids = self.members.get(subdomain)
+        if ids is None:
+            ids = self.members[subdomain] = array('I')
+        return PageSet(self.pages, ids)
+
+    def __contains__(self, subdomain):
+        return subdomain in self.members
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def __len__(self):
+        return len(self.members)
+
+    def copy(self):
+        copy = PageSets.__new__(PageSets)
+        copy.pages = self.pages.copy()
+        copy.members = {subdomain: ids[:] for subdomain, ids in self.members.items()}
+        return copy
+
+    def nbytes(self):
+        return self.pages.nbytes() + sum(len(ids) * ids.itemsize for ids in self.members.values())
+
+    def __getstate__(self):
+        return {'pages': self.pages.__getstate__(),
+                'members': {subdomain: ids.tobytes() for subdomain, ids in self.members.items()}}
+
+    def __setstate__(self, state):
+        self.pages = Vocabulary.__new__(Vocabulary)
+        self.pages.__setstate__(state['pages'])
+        self.members = dict()
+        for subdomain, ids in state['members'].items():
+            self.members[subdomain] = array('I')
+            self.members[subdomain].frombytes(ids)
+
+    def __repr__(self):
+        return f"<PageSets {len(self.pages)} pages in {len(self.members)} subdomains>"
@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from itertools import count
+from collections import Counter, defaultdict
+from queue import SimpleQueue
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_DIR = "Logs"
+FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# Attributes every LogRecord has; the others were passed in `extra` and are
+# the structured fields of the record
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "log_file"}
+
+
+class JsonFormatter(logging.Formatter):
+    ''' One JSON object per record: time, logger, level and message, plus
+    the structured fields of the record. '''
+
+    def format(self, record):
+        entry = {
+            "time": record.created,
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _Router(logging.Handler):
+    ''' The one handler of the listener thread: writes every record to the
+    log file of its logger, and to the console. '''
+
+    def __init__(self):
+        super().__init__()
+        self.files = dict()
+        self.file_formatter = logging.Formatter(FORMAT)
+        self.console = logging.StreamHandler()
+        self.console.setLevel(logging.INFO)
+        self.console.setFormatter(logging.Formatter(FORMAT))
+
+    def set_file_formatter(self, formatter):
+        self.file_formatter = formatter
+        for handler in self.files.values():
+            handler.setFormatter(formatter)
+
+    def emit(self, record):
+        handler = self.files.get(record.log_file)
+        if handler is None:
+            handler = self.files[record.log_file] = logging.FileHandler(record.log_file)
+            handler.setFormatter(self.file_formatter)
+        handler.handle(record)
+        if record.levelno >= self.console.level:
+            self.console.handle(record)
+
+    def flush(self):
+        for handler in self.files.values():
+            handler.flush()
+        self.console.flush()
+
+
+class _QueueHandler(QueueHandler):
+    ''' Puts the records of one logger on the queue of the listener, for the
+    log file at `path`. Records go as they are: the queue stays in this
+    process, so the message is only formatted by the listener thread. '''
+
+    def __init__(self, queue, path):
+        super().__init__(queue)
+        self.path = path
+
+    def prepare(self, record):
+        record.log_file = self.path
+        return record
+
+
+class _LazyMessage(object):
+    # A message formatted when the record is written, not when it is logged
+    __slots__ = ('template', 'fields')
+
+    def __init__(self, template, fields):
+        self.template = template
+        self.fields = fields
+
+    def __str__(self):
+        return self.template.format(**self.fields)
+
+
+class EventLog(object):
+    ''' Sampling and aggregation of the per-url log lines.
+
+    Only one in `sample` events of a kind is logged (every one by default),
+    with its fields as structured fields of the record. Every event is
+    counted by its key, and every `summary_interval` seconds the counts
+    since the last summary are logged as one line per kind. '''
+
+    def __init__(self):
+        self.default_sample = 1
+        self.samples = dict()
+        self.summary_interval = 0.0
+        self.counters = defaultdict(count)
+        self.lock = threading.Lock()
+        self.counts = defaultdict(Counter)
+        self.since = time.monotonic()
+        self.logger = None
+
+    def configure(self, samples, summary_interval):
+        ''' samples maps kinds of events to the share logged, one in N; the
+        kind None sets the default. '''
+        self.samples = dict(samples)
+        self.default_sample = max(1, self.samples.pop(None, 1))
+        self.summary_interval = summary_interval
+        self.counters.clear()
+        if summary_interval and self.logger is None:
+            self.logger = get_logger("EVENTS", "Worker")
+
+    def log(self, logger, event, template, key=None, level=logging.INFO, **fields):
+        ''' Log an event of kind `event`: template formatted with the fields,
+        once the line is written. key is what the summaries count it by. '''
+        if self.summary_interval:
+            self._count(event, key)
+        sample = self.samples.get(event, self.default_sample)
+        if sample != 1 and (sample <= 0 or next(self.counters[event]) % sample):
+            return
+        if logger.isEnabledFor(level):
+            fields["event"] = event
+            logger.log(level, _LazyMessage(template, fields), extra=fields)
+
+    def _count(self, event, key):
+        with self.lock:
+            self.counts[event][key] += 1
+            now = time.monotonic()
+            if now - self.since < self.summary_interval:
+                return
+            counts, self.counts = self.counts, defaultdict(Counter)
+            elapsed, self.since = now - self.since, now
+        for kind, keys in sorted(counts.items()):
+            total = sum(keys.values())
+            detail = ", ".join(f"{key}: {n}" for key, n in keys.most_common() if key is not None)
+            self.logger.info(
+                f"{kind}: {total} in the last {elapsed:.1f}s" + (f" ({detail})" if detail else ""),
+                extra={"event": "summary", "kind": kind, "total": total, "counts": dict(keys),
+                       "seconds": round(elapsed, 3)})
+
+
+_queue = SimpleQueue()
+_router = _Router()
+_listener = None
+_handlers = list()
+_loggers = dict()
+_lock = threading.RLock()
+events = EventLog()
+
+
+def _start_listener():
+    global _listener
+    if _listener is None:
+        _listener = QueueListener(_queue, _router)
+        _listener.start()
+
+
+def get_logger(name, filename=None):
+    ''' The logger `name`, writing to Logs/<filename or name>.log and the
+    console through the background listener. Set up once per name. '''
+    with _lock:
+        logger = _loggers.get(name)
+        if logger is not None:
+            return logger
+        os.makedirs(LOG_DIR, exist_ok=True)
+        path = os.path.abspath(os.path.join(LOG_DIR, f"{filename if filename else name}.log"))
+        logger = logging.getLogger(name)
+        logger.setLevel(logging.INFO)
+        handler = _QueueHandler(_queue, path)
+        logger.addHandler(handler)
+        _handlers.append(handler)
+        _loggers[name] = logger
+        _start_listener()
+        return logger
+
+
+def configure(config):
+    ''' Apply the logging settings of the config: the format of the log
+    files, and the sampling and summaries of the per-url lines. '''
+    _router.set_file_formatter(JsonFormatter() if config.log_format == "json" else logging.Formatter(FORMAT))
+    events.configure(config.log_sample, config.log_summary_interval)
+
+
+def flush():
+    ''' Write out everything logged so far, and keep the listener running. '''
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+            _start_listener()
+        _router.flush()
+
+
+def _stop():
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        try:
+            _router.flush()
+        except (OSError, ValueError):
+            # The console stream may be closed by now, as logging.shutdown
+            # allows for too
+            pass
+
+
+def _after_fork_in_child():
+    # The listener thread is not forked along, and the queue may have been
+    # in use by it: give the child a queue and a listener of its own.
+    global _queue, _listener, _lock
+    _lock = threading.RLock()
+    _queue = SimpleQueue()
+    for handler in _handlers:
+        handler.queue = _queue
+    _listener = None
+    if _handlers:
+        _start_listener()
+
+
+atexit.register(_stop)
+os.register_at_fork(after_in_child=_after_fork_in_child)
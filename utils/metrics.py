@@ -0,0 +1,275 @@
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from utils import get_host, get_logger
+
+# Upper bounds of the latency buckets in seconds: 50us doubling up to ~52s
+BOUNDS = [0.00005 * 2 ** i for i in range(21)]
+METRICS_FILE = "logs/metrics.json"
+
+
+class Histogram(object):
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BOUNDS, value)] += 1
+        self.sum += value
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def quantile(self, q):
+        ''' Upper bound of the bucket holding the q-quantile. '''
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(BOUNDS + [float("inf")], self.counts):
+            seen += count
+            if seen >= target and count:
+                return bound
+        return 0.0
+
+
+class _Timer(object):
+    __slots__ = ('metrics', 'stage', 'url', 'start')
+
+    def __init__(self, metrics, stage, url):
+        self.metrics = metrics
+        self.stage = stage
+        self.url = url
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start, self.url)
+
+
+class _NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics(object):
+    ''' Stage timings and event counts of the crawl.
+
+    Every thread records into its own shard, so recording never takes a
+    lock; shards are only added up when the metrics are read. Timings are
+    kept as histograms per stage and thread ("worker"), and per stage and
+    host when a url is given. While disabled, timer() hands out one shared
+    no-op context manager and the other calls return right away. '''
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.shards = list()
+        self.local = threading.local()
+
+    def _shard(self):
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = dict()
+            with self.lock:
+                self.shards.append((threading.current_thread().name, shard))
+            return shard
+
+    def timer(self, stage, url=None):
+        ''' Context manager timing the stage. '''
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage, url)
+
+    def observe(self, stage, seconds, url=None):
+        if not self.enabled:
+            return
+        shard = self._shard()
+        keys = [('stage', stage)]
+        if url is not None:
+            keys.append(('host', stage, get_host(url)))
+        for key in keys:
+            histogram = shard.get(key)
+            if histogram is None:
+                histogram = shard[key] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, event, url=None, n=1):
+        if not self.enabled:
+            return
+        shard = self._shard()
+        keys = [('event', event)]
+        if url is not None:
+            keys.append(('host_event', event, get_host(url)))
+        for key in keys:
+            shard[key] = shard.get(key, 0) + n
+
+    def collect(self):
+        ''' The merged metrics as {(kind, name, label): Histogram or count},
+        where label is the worker for 'stage'/'event' and the host for
+        'host'/'host_event'. '''
+        with self.lock:
+            shards = list(self.shards)
+        merged = dict()
+        for worker, shard in shards:
+            for key, value in list(shard.items()):
+                if key[0] in ('stage', 'event'):
+                    key = key + (worker,)
+                if isinstance(value, Histogram):
+                    if key not in merged:
+                        merged[key] = Histogram()
+                    merged[key].merge(value)
+                else:
+                    merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def prometheus(self):
+        ''' The metrics in the Prometheus text exposition format. '''
+        names = {'stage': ('crawler_stage_seconds', 'worker'),
+                 'host': ('crawler_host_stage_seconds', 'host'),
+                 'event': ('crawler_events_total', 'worker'),
+                 'host_event': ('crawler_host_events_total', 'host')}
+        lines = {name: [] for name, _ in names.values()}
+        for (kind, name, label), value in sorted(self.collect().items()):
+            metric, label_name = names[kind]
+            key = 'stage' if isinstance(value, Histogram) else 'event'
+            labels = f'{key}="{name}",{label_name}="{_escape(label)}"'
+            if isinstance(value, Histogram):
+                cumulative = 0
+                for bound, count in zip(BOUNDS + [float("inf")], value.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines[metric].append(f'{metric}_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines[metric].append(f'{metric}_sum{{{labels}}} {value.sum}')
+                lines[metric].append(f'{metric}_count{{{labels}}} {cumulative}')
+            else:
+                lines[metric].append(f'{metric}{{{labels}}} {value}')
+        text = []
+        for metric, metric_lines in lines.items():
+            if metric_lines:
+                kind = 'counter' if metric.endswith('_total') else 'histogram'
+                text.append(f"# TYPE {metric} {kind}")
+                text.extend(metric_lines)
+        return "\n".join(text) + "\n"
+
+    def summary(self):
+        ''' JSON-friendly summary: count, total, mean and p50/p90/p99 bucket
+        bounds per stage, both per worker and per host, and event counts. '''
+        result = {'stages': {}, 'hosts': {}, 'events': {}, 'host_events': {}}
+        sections = {'stage': 'stages', 'host': 'hosts', 'event': 'events', 'host_event': 'host_events'}
+        for (kind, name, label), value in sorted(self.collect().items()):
+            section = result[sections[kind]].setdefault(name, {})
+            if isinstance(value, Histogram):
+                count = value.count
+                section[label] = {
+                    'count': count,
+                    'seconds': round(value.sum, 6),
+                    'mean': round(value.sum / count, 6) if count else 0.0,
+                    'p50': value.quantile(0.5),
+                    'p90': value.quantile(0.9),
+                    'p99': value.quantile(0.99)
+                }
+            else:
+                section[label] = value
+        return result
+
+    def dump(self, path=METRICS_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = path + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+        os.replace(temp, path)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# The process-wide metrics, disabled until start() is called
+metrics = Metrics()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = metrics.prometheus(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(metrics.summary(), indent=2), "application/json"
+        else:
+            self.send_error(404)
+            return
+        body = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsReporter(object):
+    ''' Serves the metrics on http://127.0.0.1:port/metrics (Prometheus) and
+    /metrics.json, and dumps them to METRICS_FILE every `interval` seconds.
+    A port or interval of 0 turns that part off. '''
+
+    def __init__(self, port, interval):
+        self.logger = get_logger("METRICS")
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.server = None
+        self.dumper = None
+        if port:
+            self.server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            self.logger.info(f"Serving metrics on http://127.0.0.1:{self.server.server_port}/metrics")
+        if interval:
+            self.dumper = threading.Thread(target=self._dump_loop, daemon=True)
+            self.dumper.start()
+
+    def _dump_loop(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                metrics.dump()
+            except OSError as e:
+                self.logger.error(f"Error writing {METRICS_FILE}: {e}")
+
+    def stop(self):
+        self.stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.interval:
+            metrics.dump()
+
+
+def start(config):
+    ''' Enable the metrics if the config asks for them, and return the
+    MetricsReporter serving them (or None). '''
+    if not config.metrics:
+        return None
+    metrics.enabled = True
+    return MetricsReporter(config.metrics_port, config.metrics_interval)
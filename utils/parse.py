@@ -0,0 +1,88 @@
+from urllib.parse import urljoin
+
+from lxml import etree
+
+# Text inside these tags is not visible (BeautifulSoup's get_text skips it too).
+SKIP_TAGS = {"script", "style", "template"}
+
+
+class _PageTarget(object):
+    ''' lxml parser target that collects <a href> links and visible text in
+    one pass over the document, without building a tree. '''
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.links = []
+        self.strings = []
+        self.buffer = []
+        self.skip_depth = 0
+
+    def _flush(self):
+        # lxml may hand one text node over in several chunks, so text is only
+        # stripped once the node ends, like the strings of get_text(strip=True).
+        if self.buffer:
+            text = "".join(self.buffer).strip()
+            if text:
+                self.strings.append(text)
+            self.buffer = []
+
+    def start(self, tag, attrib):
+        self._flush()
+        if tag == "a" and "href" in attrib:
+            # A malformed href (e.g. "http://[bad") only loses that link, not
+            # the rest of the page
+            try:
+                self.links.append(urljoin(self.base_url, attrib["href"]))
+            except ValueError:
+                pass
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+
+    def end(self, tag):
+        self._flush()
+        if tag in SKIP_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+
+    def data(self, data):
+        if not self.skip_depth:
+            self.buffer.append(data)
+
+    def comment(self, text):
+        self._flush()
+
+    def pi(self, target, data):
+        self._flush()
+
+    def close(self):
+        self._flush()
+        return self.links, " ".join(self.strings)
+
+
+def parse_html(content, base_url):
+    """Parse an HTML page once and return its links and visible text.
+
+    Args:
+        content: The raw page bytes
+        base_url: The url relative links are resolved against
+
+    Returns:
+        (links, text) where links are the absolute urls of every <a href>, in
+        document order, and text is the same string as
+        BeautifulSoup.get_text(separator=' ', strip=True)
+    """
+    # Like BeautifulSoup, prefer utf-8 and otherwise let the parser use the
+    # encoding declared by the page.
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        try:
+            content = bytes(content).decode("utf-8")
+        except UnicodeDecodeError:
+            pass
+
+    target = _PageTarget(base_url)
+    parser = etree.HTMLParser(target=target, recover=True, no_network=True)
+    try:
+        parser.feed(content)
+        return parser.close()
+    except etree.LxmlError:
+        # Empty or hopeless documents: keep whatever was read before the error.
+        return target.close()
@@ -1,14 +1,126 @@
+import io
+import re
 import pickle
+import struct
+import pickletools
+
+# Defaults for responses built without a config: pages larger than this are
+# not decoded, and only these content types are (None accepts any).
+MAX_PAGE_SIZE = 5 * 1024 * 1024
+CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+
+_MIME = re.compile(r"([A-Za-z0-9.+-]+/[A-Za-z0-9.+-]+)")
+# Opcodes that push a str
+_STRINGS = {"SHORT_BINUNICODE", "BINUNICODE", "BINUNICODE8", "UNICODE"}
+# Opcodes with a length-prefixed bytes argument, such as the page body: the
+# format of the length
+_BYTES = {"SHORT_BINBYTES": "<B", "BINBYTES": "<I", "BINBYTES8": "<Q", "BYTEARRAY8": "<Q",
+          "SHORT_BINSTRING": "<B", "BINSTRING": "<i"}
+_OPCODES = {opcode.code.encode("latin-1"): opcode for opcode in pickletools.opcodes}
+
+
+def _opcodes(pickled):
+    # (opcode, argument) of every opcode of the pickle, like
+    # pickletools.genops, except that bytes arguments are skipped over
+    # rather than read, so the page body is not copied.
+    f = io.BytesIO(pickled)
+    while True:
+        opcode = _OPCODES.get(f.read(1))
+        if opcode is None:
+            raise ValueError("not a pickle opcode")
+        arg = None
+        if opcode.name in _BYTES:
+            length = struct.Struct(_BYTES[opcode.name])
+            f.seek(length.unpack(f.read(length.size))[0], io.SEEK_CUR)
+        elif opcode.arg is not None:
+            arg = opcode.arg.reader(f)
+        yield opcode, arg
+        if opcode.name == "STOP":
+            return
+
+
+def _sniff_content_type(pickled):
+    # The Content-Type header of a pickled requests.Response, read from the
+    # pickle opcodes without building any object. The state of a Response
+    # is pickled as _content, status_code, headers, ... and the headers are
+    # a CaseInsensitiveDict closed by the first BUILD after them; history
+    # and request, which have headers of their own, come later. None when
+    # there is no such header, or the pickle is not laid out like that.
+    try:
+        strings = None
+        for opcode, arg in _opcodes(pickled):
+            if strings is None:
+                if opcode.name in _STRINGS and arg == "headers":
+                    strings = list()
+            elif opcode.name in _STRINGS:
+                strings.append(arg)
+            elif opcode.name == "BUILD":
+                break
+        else:
+            return None
+    except Exception:
+        return None
+    # The store maps lowercase names to (name, value)
+    try:
+        key = strings.index("content-type")
+        name, value = strings[key + 1], strings[key + 2]
+    except (ValueError, IndexError):
+        return None
+    match = _MIME.match(value.strip()) if name.lower() == "content-type" else None
+    return match.group(1).lower() if match else None
+
 
 class Response(object):
-    def __init__(self, resp_dict):
+    ''' A response of the cache server.
+
+    url, status and error are read from the envelope right away. The page
+    itself, raw_response, is unpickled only when it is first used, and not
+    at all if the pickled response is larger than `max_size` bytes or its
+    Content-Type header is not one of `content_types`; `rejected` tells why
+    then. The body is handed out as the bytes object that was unpickled,
+    without copies. '''
+
+    def __init__(self, resp_dict, max_size=MAX_PAGE_SIZE, content_types=CONTENT_TYPES):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
-        try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+        # Seconds spent opening connections to the cache server for this
+        # response; 0 when a pooled connection was reused.
+        self.connect_time = 0.0
+        self._pickled = resp_dict.get("response")
+        self._raw_response = None
+        # Size of the pickled response, an upper bound of the body size
+        self.size = len(self._pickled) if isinstance(self._pickled, (bytes, bytearray)) else 0
+        self.content_type = None
+        self.rejected = None
+        if self.size:
+            if max_size is not None and self.size > max_size:
+                self.rejected = f"larger than {max_size} bytes ({self.size / (1024 * 1024):.2f} MB)"
+            else:
+                self.content_type = _sniff_content_type(self._pickled)
+                if content_types and self.content_type and self.content_type not in content_types:
+                    self.rejected = f"content type {self.content_type}"
+            if self.rejected:
+                self._pickled = None
+
+    @property
+    def raw_response(self):
+        if self._pickled is not None:
+            try:
+                self._raw_response = pickle.loads(self._pickled)
+            except TypeError:
+                self._raw_response = None
+            self._pickled = None
+        return self._raw_response
+
+    def validators(self):
+        ''' (ETag, Last-Modified) headers of the page, None where missing. '''
+        headers = getattr(self.raw_response, "headers", None) or {}
+        return (headers.get("ETag") or headers.get("etag"),
+                headers.get("Last-Modified") or headers.get("last-modified"))
+
+    @property
+    def content(self):
+        ''' The page body, or None if there is none or it was rejected. '''
+        raw_response = self.raw_response
+        return raw_response.content if raw_response is not None else None
@@ -20,7 +20,13 @@ def init(df, user_agent, fresh):
     return reg.load_balancer
 
 def get_cache_server(config, restart):
+    if config.offline:
+        # HOST/PORT is a replay server (python -m replay), used as the cache
+        # server directly without registering.
+        return (config.host, config.port)
     init_node = Node(
         init, Types=[Register], dataframe=(config.host, config.port))
     return init_node.start(
-        config.user_agent, restart or not os.path.exists(config.save_file))
\ No newline at end of file
+        config.user_agent, restart or not any(
+            os.path.exists(config.save_file + ext)
+            for ext in ["", ".db", ".dir", ".wal"]))
\ No newline at end of file
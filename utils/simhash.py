@@ -0,0 +1,145 @@
+from array import array
+from hashlib import blake2b
+from threading import RLock
+
+FINGERPRINT_BITS = 64
+# Per-bit weights are summed in LANE_BITS wide lanes of one big integer,
+# so a token costs a handful of big-int operations instead of 64 adds.
+LANE_BITS = 48
+LANE_MASK = (1 << LANE_BITS) - 1
+
+# _SPREAD[byte][value] has bit j of value moved to lane 8 * byte + j
+_SPREAD = [
+    [sum(1 << (LANE_BITS * (8 * byte + j)) for j in range(8) if value >> j & 1)
+     for value in range(256)]
+    for byte in range(FINGERPRINT_BITS // 8)]
+
+# int.bit_count is only there from Python 3.10
+if hasattr(int, "bit_count"):
+    _popcount = int.bit_count
+else:
+    def _popcount(value):
+        return bin(value).count("1")
+
+
+def _token_hash(token):
+    return blake2b(token.encode("utf-8"), digest_size=8).digest()
+
+
+def simhash(token_freq) -> int:
+    """Compute the 64-bit SimHash of a page from its token frequencies.
+
+    Args:
+        token_freq: Mapping of token -> count, like tokenize_text returns
+
+    Returns:
+        The fingerprint as an int. Pages with similar token distributions
+        get fingerprints that differ in few bits.
+    """
+    spread = _SPREAD
+    lanes = 0
+    total = 0
+    for token, count in token_freq.items():
+        digest = _token_hash(token)
+        lanes += count * (spread[0][digest[0]] | spread[1][digest[1]] | spread[2][digest[2]]
+                          | spread[3][digest[3]] | spread[4][digest[4]] | spread[5][digest[5]]
+                          | spread[6][digest[6]] | spread[7][digest[7]])
+        total += count
+
+    # Bit i is set when the tokens with bit i set outweigh the others.
+    fingerprint = 0
+    for i in range(FINGERPRINT_BITS):
+        if 2 * ((lanes >> (LANE_BITS * i)) & LANE_MASK) > total:
+            fingerprint |= 1 << i
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    return _popcount(a ^ b)
+
+
+class SimHashIndex(object):
+    ''' Banded LSH index of SimHash fingerprints.
+
+    Fingerprints are split into `bands` equal bands and bucketed by each
+    band. Two fingerprints within `max_distance` bits share at least one band
+    when max_distance < bands, so a lookup only compares against the
+    fingerprints in its own buckets. '''
+
+    def __init__(self, bands=4, max_distance=3):
+        assert max_distance < bands, "max_distance must be smaller than bands"
+        self.bands = bands
+        self.max_distance = max_distance
+        self.band_bits = FINGERPRINT_BITS // bands
+        self.band_mask = (1 << self.band_bits) - 1
+        self.tables = [dict() for _ in range(bands)]
+        # Fingerprints added, and those taken out again (the old version of
+        # a changed page). Both only grow, so a checkpoint saves what was
+        # appended since the last one.
+        self.fingerprints = array('Q')
+        self.removed = array('Q')
+        self.lock = RLock()
+
+    def _keys(self, fingerprint):
+        return [(fingerprint >> (band * self.band_bits)) & self.band_mask for band in range(self.bands)]
+
+    def find(self, fingerprint):
+        ''' Return an indexed fingerprint within max_distance, or None. '''
+        for table, key in zip(self.tables, self._keys(fingerprint)):
+            for candidate in table.get(key, ()):
+                if _popcount(candidate ^ fingerprint) <= self.max_distance:
+                    return candidate
+        return None
+
+    def add(self, fingerprint):
+        for table, key in zip(self.tables, self._keys(fingerprint)):
+            table.setdefault(key, []).append(fingerprint)
+        self.fingerprints.append(fingerprint)
+
+    def remove(self, fingerprint):
+        ''' Take one copy of fingerprint out of the index. Returns whether
+        it was there. '''
+        with self.lock:
+            keys = self._keys(fingerprint)
+            if fingerprint not in self.tables[0].get(keys[0], ()):
+                return False
+            for table, key in zip(self.tables, keys):
+                bucket = table[key]
+                bucket.remove(fingerprint)
+                if not bucket:
+                    del table[key]
+            self.removed.append(fingerprint)
+            return True
+
+    def find_or_add(self, fingerprint):
+        ''' Return the near duplicate of fingerprint if there is one,
+        otherwise index fingerprint and return None. '''
+        with self.lock:
+            match = self.find(fingerprint)
+            if match is None:
+                self.add(fingerprint)
+            return match
+
+    def __len__(self):
+        return len(self.fingerprints) - len(self.removed)
+
+    def __getstate__(self):
+        # Only the fingerprints are saved; the buckets are rebuilt on load.
+        return {'bands': self.bands, 'max_distance': self.max_distance,
+                'fingerprints': self.fingerprints.tobytes(), 'removed': self.removed.tobytes()}
+
+    def __setstate__(self, state):
+        self.__init__(state['bands'], state['max_distance'])
+        self.extend(state['fingerprints'], state.get('removed', b''))
+
+    def extend(self, added, removed=b''):
+        ''' Add the fingerprints packed in `added`, then take out those in
+        `removed` (both as saved by __getstate__ or a checkpoint). '''
+        fingerprints = array('Q')
+        fingerprints.frombytes(added)
+        for fingerprint in fingerprints:
+            self.add(fingerprint)
+        fingerprints = array('Q')
+        fingerprints.frombytes(removed)
+        for fingerprint in fingerprints:
+            self.remove(fingerprint)
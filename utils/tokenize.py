@@ -1,32 +1,70 @@
-from collections import defaultdict
+from collections import Counter
 
-# runtime: O(n) since runs through each character once
-def tokenize_text(text: str, stop_words: set = None) -> defaultdict:
+# Maps ASCII letters to lowercase, keeps digits and turns every other byte
+# (including all bytes of multi-byte UTF-8 characters) into a space.
+_TOKEN_BYTES = bytes(
+    (b | 0x20 if 0x41 <= b <= 0x5A else b) if (0x30 <= b <= 0x39 or 0x41 <= b <= 0x5A or 0x61 <= b <= 0x7A) else 0x20
+    for b in range(256))
+
+# The only non-ASCII characters whose str.lower() contains an ASCII letter.
+_LOWER_TO_ASCII = {"İ": "i̇", "K": "k"}
+
+# tokenize_text works through long texts in slices of this many characters
+CHUNK_SIZE = 1 << 20
+
+
+def _token_bytes(text: str) -> bytes:
+    # text as bytes where tokens are runs of [a-z0-9] and everything else is a space
+    for char, lowered in _LOWER_TO_ASCII.items():
+        if char in text:
+            text = text.replace(char, lowered)
+    return text.encode("utf-8", "surrogatepass").translate(_TOKEN_BYTES)
+
+
+def tokenize_chunks(chunks, stop_words: set = None) -> Counter:
+    """Tokenize text that arrives in pieces and count token frequencies.
+
+    Tokens may span chunk boundaries. The output is the same as
+    tokenize_text on the concatenated chunks.
+
+    Args:
+        chunks: Iterable of str pieces of the text
+        stop_words: Optional set of words to skip during tokenization
+
+    Returns:
+        Counter with token frequencies (excluding stopwords if provided)
+    """
+    counts = Counter()
+    carry = b""
+    for chunk in chunks:
+        data = carry + _token_bytes(chunk)
+        # The last run may continue in the next chunk.
+        cut = data.rfind(b" ") + 1
+        counts.update(data[:cut].split())
+        carry = data[cut:]
+    if carry:
+        counts[carry] += 1
+
+    token_freq = Counter({token.decode("ascii"): count for token, count in counts.items()})
+    if stop_words:
+        for word in stop_words:
+            token_freq.pop(word, None)
+    return token_freq
+
+
+# runtime: O(n), the scanning and counting is done in C
+def tokenize_text(text: str, stop_words: set = None) -> Counter:
     """Tokenize text content directly and count token frequencies.
 
+    Tokens are maximal runs of ASCII letters and digits in the lowercased
+    text.
+
     Args:
         text: The text to tokenize
         stop_words: Optional set of words to skip during tokenization
 
     Returns:
-        defaultdict(int) with token frequencies (excluding stopwords if provided)
+        Counter with token frequencies (excluding stopwords if provided)
     """
-    text = text.lower()
-    cur = 0
-    index = 0
-    token_freq = defaultdict(int)
-    while index < len(text):
-        ch = text[index]
-        if not (('a' <= ch <= 'z') or ('A' <= ch <= 'Z') or ('0' <= ch <= '9')):
-            token = text[cur:index]
-            # Only count token if it's not empty and not a stopword
-            if token and (stop_words is None or token not in stop_words):
-                token_freq[token] += 1
-            cur = index + 1
-        index += 1
-
-    token = text[cur:index]
-    # Only count token if it's not empty and not a stopword
-    if token and (stop_words is None or token not in stop_words):
-        token_freq[token] += 1
-    return token_freq
\ No newline at end of file
+    return tokenize_chunks(
+        (text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)), stop_words)
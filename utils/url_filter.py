@@ -0,0 +1,176 @@
+import re
+from hashlib import sha256
+from urllib.parse import urlparse
+
+_END = object()
+MAX_CACHED_HOSTS = 100000
+
+
+class DomainTrie(object):
+    ''' Set of domains stored as a trie of reversed labels, so a host is
+    matched with one walk over its labels instead of a loop over domains. '''
+
+    def __init__(self, domains=(), subdomains=True):
+        self.root = dict()
+        for domain in domains:
+            self.add(domain, subdomains)
+
+    def add(self, domain, subdomains=True):
+        # subdomains=True matches the domain and everything below it,
+        # False matches the domain only.
+        node = self.root
+        for label in reversed(domain.split(".")):
+            node = node.setdefault(label, dict())
+        node[_END] = node.get(_END, False) or subdomains
+
+    def match(self, host):
+        node = self.root
+        labels = host.split(".")
+        for depth, label in enumerate(reversed(labels), 1):
+            node = node.get(label)
+            if node is None:
+                return False
+            if _END in node and (node[_END] or depth == len(labels)):
+                return True
+        return False
+
+
+class UrlFilter(object):
+    ''' Precompiled url filter.
+
+    check() returns the name of the rule that rejects a url, or None if the
+    url is allowed. Rules are, in order: already seen, scheme, allowed
+    domains, blocked domains, blocked host+path prefixes, case-sensitive
+    path substrings, and finally every path pattern combined into a single
+    regular expression that runs once over the lowercased path.
+
+    Path patterns are (name, regex) or (name, regex, predicate) tuples.
+    A predicate gets the match object of the pattern on its own and decides
+    whether the match rejects the url; patterns with a predicate are tried
+    after the plain ones. If every pattern starts with a character from
+    the character class path_pattern_lead, passing it lets the combined
+    regex skip all other positions of the path cheaply.
+
+    version is a hash of all the rules. It changes whenever a rule does, so
+    verdicts saved under one version can be reused as long as it matches. '''
+
+    def __init__(self, allowed_domains, blocked_domains=(), blocked_paths=(),
+                 path_substrings=(), path_patterns=(), path_pattern_lead=None,
+                 schemes=("http", "https")):
+        self.schemes = frozenset(schemes)
+        self.allowed = DomainTrie(allowed_domains, subdomains=True)
+        self.blocked = DomainTrie(blocked_domains, subdomains=False)
+
+        # "host/path/prefix" entries, indexed by host
+        prefixes = dict()
+        for blocked in blocked_paths:
+            if '/' in blocked:
+                host, path = blocked.split('/', 1)
+                prefixes.setdefault(host, []).append('/' + path)
+        self.blocked_paths = {host: tuple(paths) for host, paths in prefixes.items()}
+
+        self.path_substrings = tuple(path_substrings)
+
+        # Verdicts of the domain tries, per host. A crawl only sees a few
+        # hundred hosts, so this stays small.
+        self.host_verdicts = dict()
+
+        rules = sorted(path_patterns, key=lambda rule: len(rule) > 2)
+        self.predicates = dict()
+        alternatives = []
+        for name, regex, *predicate in rules:
+            alternatives.append(f"(?P<{name}>{regex})")
+            if predicate:
+                self.predicates[name] = (re.compile(regex), predicate[0])
+        combined = "|".join(alternatives)
+        if path_pattern_lead:
+            combined = f"(?=[{path_pattern_lead}])(?:{combined})"
+        self.pattern = re.compile(combined) if alternatives else None
+
+        self.version = self._version(
+            allowed_domains, blocked_domains, blocked_paths, path_substrings,
+            path_patterns, path_pattern_lead, schemes)
+
+    @staticmethod
+    def _version(allowed_domains, blocked_domains, blocked_paths, path_substrings,
+                 path_patterns, path_pattern_lead, schemes):
+        rules = [sorted(allowed_domains), sorted(blocked_domains), sorted(blocked_paths),
+                 list(path_substrings), path_pattern_lead, sorted(schemes)]
+        for name, regex, *predicate in path_patterns:
+            rules.append((name, regex))
+            for function in predicate:
+                # Predicates are compared by their code
+                code = function.__code__
+                rules.append((code.co_code.hex(), repr(code.co_consts), code.co_names))
+        return sha256(repr(rules).encode("utf-8")).hexdigest()[:16]
+
+    def _check_host(self, host):
+        if not self.allowed.match(host):
+            verdict = "domain"
+        elif self.blocked.match(host):
+            verdict = "blocked_domain"
+        else:
+            verdict = None
+        if len(self.host_verdicts) >= MAX_CACHED_HOSTS:
+            self.host_verdicts.clear()
+        self.host_verdicts[host] = verdict
+        return verdict
+
+    def _check_parsed(self, parsed, seen=None):
+        # Skip if base URL (without query/fragment) was already crawled
+        if seen is not None:
+            if f"{parsed.scheme}://{parsed.netloc}{parsed.path}" in seen:
+                return "seen"
+
+        if parsed.scheme not in self.schemes:
+            return "scheme"
+
+        host = parsed.netloc
+        try:
+            verdict = self.host_verdicts[host]
+        except KeyError:
+            verdict = self._check_host(host)
+        if verdict:
+            return verdict
+
+        prefixes = self.blocked_paths.get(host)
+        path = parsed.path
+        if prefixes and path.startswith(prefixes):
+            return "blocked_path"
+
+        for substring in self.path_substrings:
+            if substring in path:
+                return "path:" + substring
+
+        if self.pattern is None:
+            return None
+        path = path.lower()
+        match = self.pattern.search(path)
+        while match:
+            name = match.lastgroup
+            if name not in self.predicates:
+                return name
+            regex, predicate = self.predicates[name]
+            if predicate(regex.match(path, match.start())):
+                return name
+            # Predicate patterns come last in the alternation, so nothing
+            # else matched at this position: keep looking further on.
+            match = self.pattern.search(path, match.start() + 1)
+        return None
+
+    def check(self, url, seen=None):
+        ''' Return the name of the rule that rejects url, or None.
+        seen is an optional container of already crawled base urls. '''
+        return self._check_parsed(urlparse(url), seen)
+
+    def is_valid(self, url, seen=None):
+        return self._check_parsed(urlparse(url), seen) is None
+
+    def filter_many(self, urls, seen=None):
+        ''' Yield the urls that pass the filter, parsing each one once.
+        This is a generator, so urls the caller adds to seen while
+        consuming it are taken into account for the urls after them. '''
+        check = self._check_parsed
+        for url in urls:
+            if check(urlparse(url), seen) is None:
+                yield url